@@ -0,0 +1,182 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+from canonical import canonical_id
+
+ARCHIVE_NAME = ".download_archive.sqlite3"
+MEDIA_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.mov', '.flv', '.m4a', '.mp3')
+CHECKSUM_BLOCK = 1024 * 1024 # 快速校验只读取文件首尾各 1MiB
+
+
+def quick_checksum(path):
+    """文件大小 + 首尾数据块的 SHA1, 用于识别被移动/重命名的文件 (无需读取整个文件)"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(CHECKSUM_BLOCK))
+        if size > CHECKSUM_BLOCK * 2:
+            f.seek(-CHECKSUM_BLOCK, os.SEEK_END)
+            digest.update(f.read(CHECKSUM_BLOCK))
+    return digest.hexdigest()
+
+
+def info_archive_key(info):
+    """yt-dlp 信息字典对应的归档键, 与 canonical_id 的格式一致 (如 youtube:<id>)"""
+    if not info or not info.get('id') or not info.get('extractor_key'):
+        return None
+    return f"{info['extractor_key'].lower()}:{info['id']}"
+
+
+class DownloadArchive:
+    """
+    已下载视频的索引: 平台+视频 ID → 最终文件路径、大小、视频编码、快速校验值
+    - 下载前按视频 ID 查询 (单次主键查询), 已下载的视频无需任何网络请求
+    - SQLite WAL 模式 + busy_timeout, 多个线程/进程 (GUI 与命令行) 可同时写入
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS archive ("
+                "key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                "codec TEXT, checksum TEXT, downloaded_at REAL NOT NULL)"
+            )
+
+    def _conn(self):
+        # 每个线程使用独立连接 (sqlite3 连接不能跨线程共享)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, key):
+        """
+        查询已下载记录, 返回 {'path', 'size', 'codec', 'checksum'}
+        文件已被删除或大小不一致时视为未下载, 并移除该记录
+        """
+        if not key:
+            return None
+        try:
+            row = self._conn().execute(
+                "SELECT path, size, codec, checksum FROM archive WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not row:
+            return None
+        path, size, codec, checksum = row
+        try:
+            if os.path.getsize(path) == size:
+                return {"path": path, "size": size, "codec": codec, "checksum": checksum}
+        except OSError:
+            pass
+        self.remove(key)
+        return None
+
+    def record(self, key, path, codec=None):
+        if not key or not path or not os.path.exists(path):
+            return False
+        try:
+            size = os.path.getsize(path)
+            checksum = quick_checksum(path)
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO archive (key, path, size, codec, checksum, downloaded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, os.path.abspath(path), size, codec, checksum, time.time()),
+                )
+            return True
+        except (OSError, sqlite3.Error):
+            return False
+
+    def remove(self, key):
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM archive WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def rebuild(self, download_dir, toolchain=None, log=None):
+        """
+        将索引与下载目录重新对齐:
+        - 文件仍存在: 保留 (大小变化时更新校验值)
+        - 文件被移动/重命名: 按大小+校验值重新关联
+        - 文件已删除: 移除记录
+        - 目录中未记录的文件: 读取 MP4 的 comment 标签 (下载时写入的来源链接) 补充记录
+        返回各类数量统计
+        """
+        from transcode import probe_tags, probe_streams
+
+        log = log or (lambda msg: None)
+        stats = {"kept": 0, "updated": 0, "relinked": 0, "removed": 0, "added": 0}
+
+        untracked = {}
+        for entry in os.scandir(download_dir):
+            if entry.is_file() and entry.name.lower().endswith(MEDIA_EXTENSIONS) and '.temp.' not in entry.name:
+                untracked[os.path.abspath(entry.path)] = entry.stat().st_size
+
+        conn = self._conn()
+        rows = conn.execute("SELECT key, path, size, checksum FROM archive").fetchall()
+        missing = []
+        for key, path, size, checksum in rows:
+            if path in untracked:
+                current = untracked.pop(path)
+                if current != size:
+                    self.record(key, path)
+                    stats["updated"] += 1
+                else:
+                    stats["kept"] += 1
+            else:
+                missing.append((key, size, checksum))
+
+        for key, size, checksum in missing:
+            moved = None
+            for path, current in untracked.items():
+                if current == size and quick_checksum(path) == checksum:
+                    moved = path
+                    break
+            if moved:
+                untracked.pop(moved)
+                with conn:
+                    conn.execute("UPDATE archive SET path = ? WHERE key = ?", (moved, key))
+                log(f"状态: 重新关联 {key} → {os.path.basename(moved)}")
+                stats["relinked"] += 1
+            else:
+                self.remove(key)
+                stats["removed"] += 1
+
+        if toolchain is not None and toolchain.ffprobe:
+            for path in untracked:
+                tags = probe_tags(toolchain, path) or {}
+                key = canonical_id(tags.get('comment') or tags.get('purl') or '')
+                if key:
+                    streams = probe_streams(toolchain, path) or []
+                    codec = next((s.get('codec_name') for s in streams if s.get('codec_type') == 'video'), None)
+                    if self.record(key, path, codec):
+                        log(f"状态: 补充记录 {key} ← {os.path.basename(path)}")
+                        stats["added"] += 1
+
+        return stats
+
+
+_archive_lock = threading.Lock()
+_archives = {}
+
+
+def get_archive(download_dir):
+    """每个下载目录共享一个索引, 数据库文件保存在下载目录中 (随目录一起移动)"""
+    os.makedirs(download_dir, exist_ok=True)
+    path = os.path.abspath(os.path.join(download_dir, ARCHIVE_NAME))
+    with _archive_lock:
+        archive = _archives.get(path)
+        if archive is None:
+            archive = DownloadArchive(path)
+            _archives[path] = archive
+        return archive
@@ -0,0 +1,200 @@
+import time
+import threading
+
+MIN_ALLOCATION = 64 * 1024   # 每个任务至少分到的带宽 (字节/秒), 避免低权重任务完全停滞
+REBALANCE_INTERVAL = 0.5     # 重新分配的最小间隔 (秒)
+WARMUP = 2.0                 # 开始传输后的前几秒按满额分配, 不根据实测速率收回
+RATE_SMOOTHING = 0.5         # 显示用速率的平滑系数
+
+
+def priority_weight(priority):
+    """调度优先级 → 带宽权重: 数值越小越优先, 每提升一级权重翻倍"""
+    return 2.0 ** max(-4, min(4, -priority))
+
+
+class BandwidthShare:
+    """
+    单个任务的带宽份额
+    - allocation: 当前分配的速率 (字节/秒), None 表示不限速
+    - rate: 实测速率 (平滑后, 用于界面显示)
+    - consume(): 自行下载的数据 (分段下载/流式转码) 每读取一块调用一次, 超出分配时阻塞
+    - record(): yt-dlp 下载的数据只做统计, 限速由 yt-dlp 的 ratelimit 参数完成
+    """
+    def __init__(self, manager, name, weight=1.0):
+        self.manager = manager
+        self.name = name
+        self.weight = weight
+        self.allocation = None
+        self.rate = 0.0
+        self.total_bytes = 0
+        self.first_byte_at = None
+        self.closed = False
+        self._sample_rate = 0.0  # 最近一个采样周期的瞬时速率
+        self._sample_bytes = 0
+        self._sample_at = time.monotonic()
+        self._tokens = 0.0
+        self._updated = self._sample_at
+        self._lock = threading.Lock()
+
+    def record(self, nbytes):
+        if nbytes <= 0:
+            return
+        with self._lock:
+            if self.first_byte_at is None:
+                self.first_byte_at = time.monotonic()
+            self.total_bytes += nbytes
+            self._sample_bytes += nbytes
+        self.manager._maybe_rebalance()
+
+    def consume(self, nbytes):
+        """记录已读取的数据, 并按当前分配限速; 返回等待的秒数"""
+        self.record(nbytes)
+        allocation = self.allocation
+        if not allocation:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            # 令牌桶容量为 1 秒的配额, 分配变化后立即生效
+            self._tokens = min(allocation, self._tokens + (now - self._updated) * allocation)
+            self._updated = now
+            self._tokens -= nbytes
+            wait = -self._tokens / allocation if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _sample(self, now):
+        # 调用方需持有 manager 的锁
+        with self._lock:
+            elapsed = max(now - self._sample_at, 1e-6)
+            self._sample_rate = self._sample_bytes / elapsed
+            self._sample_bytes = 0
+            self._sample_at = now
+            self.rate = RATE_SMOOTHING * self._sample_rate + (1 - RATE_SMOOTHING) * self.rate
+
+    def _demand(self, now):
+        """
+        估计任务实际需要的带宽, None 表示需求不受限 (按权重分配)
+        - 尚未开始传输 (解析中/转码中): 只保留最低配额
+        - 传输刚开始: 不受限
+        - 最近一个周期明显用不满分配 (上游慢或任务已在收尾): 按实测速率的 1.5 倍回收多余部分
+        """
+        if self.first_byte_at is None:
+            return 0
+        if now - self.first_byte_at < WARMUP or self.allocation is None:
+            return None
+        if self._sample_rate < self.allocation * 0.9:
+            return self._sample_rate * 1.5
+        return None
+
+    def set_weight(self, weight):
+        self.manager.set_weight(self, weight)
+
+    def close(self):
+        self.manager.release(self)
+
+    def describe(self):
+        from direct_download import format_bytes
+        allocation = f"{format_bytes(self.allocation)}/s" if self.allocation else "不限"
+        return f"实际 {format_bytes(self.rate)}/s · 分配 {allocation}"
+
+
+class BandwidthManager:
+    """
+    全局带宽管理: 所有进行中任务共享一个总速率上限
+    - 按权重做最大最小公平分配: 用不满份额的任务只保留实际所需, 剩余带宽按权重分给其他任务
+    - 任务开始/结束、权重变化以及每个采样周期都会重新分配, 完成任务释放的带宽立即分给其他任务
+    - 未设置上限时不限速, 只统计各任务速率
+    """
+    def __init__(self, limit=None):
+        self.limit = limit or None
+        self._shares = []
+        self._lock = threading.Lock()
+        self._last_rebalance = 0.0
+
+    def set_limit(self, limit):
+        with self._lock:
+            self.limit = limit or None
+            self._rebalance()
+
+    def register(self, name, weight=1.0):
+        share = BandwidthShare(self, name, weight)
+        with self._lock:
+            self._shares.append(share)
+            self._rebalance()
+        return share
+
+    def release(self, share):
+        with self._lock:
+            if share.closed:
+                return
+            share.closed = True
+            self._shares.remove(share)
+            self._rebalance()
+
+    def set_weight(self, share, weight):
+        with self._lock:
+            share.weight = weight
+            if not share.closed:
+                self._rebalance()
+
+    def _maybe_rebalance(self):
+        if time.monotonic() - self._last_rebalance < REBALANCE_INTERVAL:
+            return
+        with self._lock:
+            if time.monotonic() - self._last_rebalance >= REBALANCE_INTERVAL:
+                self._rebalance()
+
+    def _rebalance(self):
+        # 调用方需持有 self._lock
+        now = time.monotonic()
+        self._last_rebalance = now
+        for share in self._shares:
+            share._sample(now)
+        if not self.limit:
+            for share in self._shares:
+                share.allocation = None
+            return
+
+        # 加权水位填充: 需求低于公平份额的任务先按需求满足, 剩余带宽在其余任务间按权重重新划分
+        demands = {share: share._demand(now) for share in self._shares}
+        pending = list(self._shares)
+        remaining = float(self.limit)
+        while pending:
+            total_weight = sum(share.weight for share in pending)
+            fair = {share: remaining * share.weight / total_weight for share in pending}
+            satisfied = [s for s in pending if demands[s] is not None and demands[s] < fair[s]]
+            if not satisfied:
+                for share in pending:
+                    share.allocation = max(MIN_ALLOCATION, fair[share])
+                break
+            for share in satisfied:
+                share.allocation = max(MIN_ALLOCATION, demands[share])
+                remaining = max(0.0, remaining - share.allocation)
+                pending.remove(share)
+
+    def stats(self):
+        with self._lock:
+            return [
+                {"name": s.name, "weight": s.weight, "allocation": s.allocation, "rate": round(s.rate)}
+                for s in self._shares
+            ]
+
+
+_manager_lock = threading.Lock()
+_shared_manager = None
+
+
+def configure_bandwidth(limit=None):
+    """设置全局带宽上限 (字节/秒), None 或 0 表示不限; 进行中的任务立即按新上限重新分配"""
+    manager = get_bandwidth_manager()
+    manager.set_limit(limit)
+    return manager
+
+
+def get_bandwidth_manager():
+    global _shared_manager
+    with _manager_lock:
+        if _shared_manager is None:
+            _shared_manager = BandwidthManager()
+        return _shared_manager
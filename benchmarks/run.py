@@ -0,0 +1,388 @@
+"""
+离线基准测试: 所有请求都发往本地模拟服务器 (见 server.py), 不访问外网
+
+测量项目
+- resolve:    Douyin 分享页解析延迟 (请求 + _ROUTER_DATA 解析), p50/p95
+- segmented:  分段下载器在不同连接数下的吞吐
+- fragments:  HLS 分片在不同并发数下的吞吐 (yt-dlp 下载阶段)
+- postprocess: 分轨合并与转码为 MP4 的耗时 (需要 FFmpeg, 否则跳过)
+- e2e:        调度器执行混合任务 (Douyin 直链 / HLS / DASH) 的吞吐 (个/分钟)
+
+结果与 baseline.json 中同一模式 (full/quick) 的基线对比, 超出回归阈值时退出码为 1
+基线只在同一台机器上有意义: 更换机器后先运行 --update-baseline
+
+用法:
+    python benchmarks/run.py [--quick] [--only resolve,segmented] [--output results.json]
+    python benchmarks/run.py --update-baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# 缓存目录 (工具链探测、解析缓存、分片并发调整) 指向临时目录, 不影响正常使用的缓存
+_WORK_DIR = tempfile.mkdtemp(prefix="videodl-bench-")
+os.environ["XDG_CACHE_HOME"] = os.path.join(_WORK_DIR, "cache")
+
+from server import BenchServer  # noqa: E402
+import video_extractor  # noqa: E402
+from video_extractor import VideoExtractor  # noqa: E402
+from direct_download import SegmentedDownloader, format_bytes  # noqa: E402
+from metrics import get_metrics, SPAN_LABELS, SPAN_DOWNLOAD  # noqa: E402
+from toolchain import get_toolchain  # noqa: E402
+
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_THRESHOLD = 0.25  # 默认允许 25% 的波动
+
+MIB = 1024 * 1024
+
+# 两种规模: quick 用于冒烟测试, full 用于对比基线
+PROFILES = {
+    "full": {
+        "media_size": 16 * MIB, "segment_count": 30, "segment_size": 200 * 1024, "repeat": 3,
+        "resolve_runs": 20, "connections": (1, 2, 4, 8), "fragments": (1, 4, 8),
+        "jobs": {"douyin": 8, "hls": 4, "dash": 4}, "clip_seconds": 10,
+    },
+    "quick": {
+        "media_size": 4 * MIB, "segment_count": 10, "segment_size": 200 * 1024, "repeat": 1,
+        "resolve_runs": 5, "connections": (1, 4), "fragments": (1, 4),
+        "jobs": {"douyin": 4, "hls": 2, "dash": 2}, "clip_seconds": 3,
+    },
+}
+
+BENCHMARKS = ("resolve", "segmented", "fragments", "postprocess", "e2e")
+
+
+class Skipped(Exception):
+    """当前环境无法运行该项目 (例如缺少 FFmpeg)"""
+
+
+def higher_is_better(name):
+    return name.endswith(("_mibps", "_per_min"))
+
+
+@contextlib.contextmanager
+def silenced():
+    """屏蔽 yt-dlp 与下载器的输出 (只显示基准测试的结果)"""
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+
+class Context:
+    def __init__(self, server, profile):
+        self.server = server
+        self.profile = profile
+        self._counter = 0
+
+    def unique(self, prefix):
+        self._counter += 1
+        return f"{prefix}{os.getpid()}{self._counter:04d}"
+
+    def douyin_url(self):
+        # 19 位数字 ID, 与真实链接相同的格式 (canonical_id 可识别)
+        self._counter += 1
+        return f"https://www.douyin.com/video/7{int(time.time()) % 10 ** 9:09d}{self._counter:09d}"
+
+    def workdir(self, name):
+        path = tempfile.mkdtemp(prefix=name + "-", dir=_WORK_DIR)
+        return path
+
+    def extractor(self, name, **kwargs):
+        return VideoExtractor(download_dir=self.workdir(name), status_callback=lambda msg: None, **kwargs)
+
+
+def bench_resolve(ctx):
+    extractor = ctx.extractor("resolve")
+    # 预热: 首次请求包含建立连接, 不计入
+    extractor._resolve_douyin(ctx.douyin_url())
+    latencies = []
+    for _ in range(ctx.profile["resolve_runs"]):
+        # 保持在站点限速的令牌补充速度以内, 只测量请求与解析本身
+        time.sleep(0.2)
+        url = ctx.douyin_url()
+        started = time.perf_counter()
+        info = extractor._resolve_douyin(url)
+        elapsed = time.perf_counter() - started
+        if not info:
+            raise RuntimeError("Douyin 分享页解析失败")
+        latencies.append(elapsed * 1000)
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(round(len(latencies) * 0.95)) - 1)]
+    return {"resolve_p50_ms": statistics.median(latencies), "resolve_p95_ms": p95}
+
+
+def bench_segmented(ctx):
+    results = {}
+    url = f"{ctx.server.url}/play/1.mp4"
+    size = len(ctx.server.media)
+    for connections in ctx.profile["connections"]:
+        speeds = []
+        for _ in range(ctx.profile["repeat"]):
+            output = os.path.join(ctx.workdir("segmented"), "media.mp4")
+            downloader = SegmentedDownloader(url, output, min_connections=connections, max_connections=connections,
+                                             chunk_size=max(MIB, size // 16))
+            started = time.perf_counter()
+            downloader.download()
+            speeds.append(size / (time.perf_counter() - started) / MIB)
+        results[f"segmented_c{connections}_mibps"] = statistics.median(speeds)
+    return results
+
+
+def _phase_seconds(name):
+    phase = get_metrics().phases.get(name)
+    return phase[0] if phase else 0.0
+
+
+def bench_fragments(ctx):
+    results = {}
+    size = ctx.profile["segment_count"] * ctx.profile["segment_size"]
+    for concurrency in ctx.profile["fragments"]:
+        speeds = []
+        for _ in range(ctx.profile["repeat"]):
+            extractor = ctx.extractor("fragments", concurrent_fragments=concurrency)
+            before = _phase_seconds(SPAN_DOWNLOAD)
+            if not extractor.extract(f"{ctx.server.url}/hls/{ctx.unique('hls')}.m3u8", convert_to_mp4=False):
+                raise RuntimeError(f"HLS 下载失败: {extractor.last_error}")
+            # 只计下载阶段 (不含清单解析)
+            speeds.append(size / (_phase_seconds(SPAN_DOWNLOAD) - before) / MIB)
+        results[f"hls_f{concurrency}_mibps"] = statistics.median(speeds)
+    return results
+
+
+def _make_clips(toolchain, directory, seconds):
+    """用 FFmpeg 生成测试素材: H.264 视频轨 + AAC 音频轨 (合并), MPEG-4/MP2 的 MKV (转码)"""
+    import subprocess
+
+    def run(*args):
+        subprocess.run([toolchain.ffmpeg, "-y", "-v", "error", *args], check=True)
+
+    video = os.path.join(directory, "video.mp4")
+    audio = os.path.join(directory, "audio.m4a")
+    source = os.path.join(directory, "source.mkv")
+    testsrc = ["-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={seconds}"]
+    sine = ["-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}"]
+    try:
+        run(*testsrc, "-c:v", "libx264", "-preset", "ultrafast", video)
+    except subprocess.CalledProcessError:
+        # 未编译 libx264 时合并基准包含视频转码, 与其他机器的基线不可比
+        run(*testsrc, "-c:v", "mpeg4", video)
+    run(*sine, "-c:a", "aac", audio)
+    run(*testsrc, *sine, "-c:v", "mpeg4", "-c:a", "mp2", source)
+    return video, audio, source
+
+
+def bench_postprocess(ctx):
+    from transcode import plan_mp4
+    toolchain = get_toolchain()
+    if not toolchain.available:
+        raise Skipped("未检测到 FFmpeg")
+    directory = ctx.workdir("postprocess")
+    video, audio, source = _make_clips(toolchain, directory, ctx.profile["clip_seconds"])
+    extractor = ctx.extractor("postprocess")
+    merges, transcodes = [], []
+    for i in range(ctx.profile["repeat"]):
+        started = time.perf_counter()
+        extractor.run_mp4_plan(plan_mp4(toolchain, [video, audio]), os.path.join(directory, f"merged{i}.mp4"))
+        merges.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        extractor.convert_to_mp4_ffmpeg(source, os.path.join(directory, f"transcoded{i}.mp4"))
+        transcodes.append(time.perf_counter() - started)
+    return {"merge_s": statistics.median(merges), "transcode_s": statistics.median(transcodes)}
+
+
+def bench_e2e(ctx):
+    from scheduler import DownloadScheduler
+    from transcode import configure_transcode_pool
+
+    download_dir = ctx.workdir("e2e")
+    jobs = ctx.profile["jobs"]
+    urls = [ctx.douyin_url() for _ in range(jobs["douyin"])]
+    urls += [f"{ctx.server.url}/hls/{ctx.unique('hls')}.m3u8" for _ in range(jobs["hls"])]
+    urls += [f"{ctx.server.url}/dash/{ctx.unique('dash')}.mpd" for _ in range(jobs["dash"])]
+
+    pool = configure_transcode_pool()
+    scheduler = DownloadScheduler(
+        workers=4,
+        per_host=4,
+        extractor_factory=lambda: VideoExtractor(download_dir=download_dir),
+        log=lambda msg: None,
+        transcode_pool=pool,
+    )
+    try:
+        for url in urls:
+            scheduler.submit(url, on_status=lambda msg: None)
+        stats = scheduler.run()
+    finally:
+        pool.shutdown()
+    if stats["failed"]:
+        raise RuntimeError(f"{stats['failed']} 个任务失败: {stats['failures'][:3]}")
+    return {"e2e_jobs_per_min": stats["jobs_per_minute"]}
+
+
+RUNNERS = {
+    "resolve": bench_resolve,
+    "segmented": bench_segmented,
+    "fragments": bench_fragments,
+    "postprocess": bench_postprocess,
+    "e2e": bench_e2e,
+}
+
+
+def environment(mode):
+    return {
+        "mode": mode,
+        "python": platform.python_version(),
+        "platform": f"{platform.system()} {platform.machine()}",
+        "cpus": os.cpu_count(),
+        "ffmpeg": get_toolchain().available,
+    }
+
+
+def load_baseline(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"thresholds": {"default": DEFAULT_THRESHOLD}, "baselines": {}}
+
+
+def _pad(text, width):
+    """按显示宽度左对齐 (中文字符占两列)"""
+    display = sum(2 if ord(ch) > 0x2e80 else 1 for ch in text)
+    return text + " " * max(0, width - display)
+
+
+def compare(results, baseline, mode):
+    """返回 (输出行, 回归的指标列表)"""
+    thresholds = baseline.get("thresholds", {})
+    base = baseline.get("baselines", {}).get(mode, {}).get("results", {})
+    lines = [f"{_pad('指标', 22)}{'基线':>10}{'本次':>10}{'变化':>8}  结果"]
+    regressions = []
+    for name, value in results.items():
+        threshold = thresholds.get(name, thresholds.get("default", DEFAULT_THRESHOLD))
+        old = base.get(name)
+        if not old:
+            lines.append(f"{name:<22}{'-':>12}{value:>12.2f}{'-':>10}  无基线")
+            continue
+        change = (value - old) / old
+        worse = -change if higher_is_better(name) else change
+        if worse > threshold:
+            status = f"回归 (阈值 {threshold:.0%})"
+            regressions.append(name)
+        elif worse < -threshold:
+            status = "提升"
+        else:
+            status = "通过"
+        lines.append(f"{name:<22}{old:>12.2f}{value:>12.2f}{change:>+10.1%}  {status}")
+    return lines, regressions
+
+
+def phase_breakdown():
+    """e2e/fragments 任务的阶段耗时 (来自任务指标), 便于定位回归发生在哪个阶段"""
+    metrics = get_metrics()
+    rows = sorted(metrics.phases.items(), key=lambda item: -item[1][0])
+    return [f"  {SPAN_LABELS.get(name, name)}: 平均 {total / count * 1000:.0f}ms ({count} 次)"
+            for name, (total, count, _) in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="videoDownload 离线基准测试")
+    parser.add_argument("--quick", action="store_true", help="缩小数据量 (冒烟测试)")
+    parser.add_argument("--only", help=f"只运行指定项目, 逗号分隔: {','.join(BENCHMARKS)}")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基线文件")
+    parser.add_argument("--update-baseline", action="store_true", help="将本次结果写入基线")
+    parser.add_argument("--output", help="将本次结果写入 JSON 文件")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟服务器的请求延迟 (秒)")
+    parser.add_argument("--connection-rate", default="4M", help="模拟 CDN 的单连接速率上限")
+    args = parser.parse_args()
+
+    from formats import parse_size
+    mode = "quick" if args.quick else "full"
+    profile = PROFILES[mode]
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in selected if name not in RUNNERS]
+    if unknown:
+        parser.error(f"未知的项目: {', '.join(unknown)}")
+
+    server = BenchServer(media_size=profile["media_size"], segment_count=profile["segment_count"],
+                         segment_size=profile["segment_size"], latency=args.latency,
+                         connection_rate=parse_size(args.connection_rate)).start()
+    video_extractor.DOUYIN_SHARE_URL = f"{server.url}/share/video/{{video_id}}/"
+    ctx = Context(server, profile)
+    print(f"基准测试 ({mode}): 服务器 {server.url}, 延迟 {args.latency * 1000:.0f}ms, "
+          f"单连接 {format_bytes(server.connection_rate)}/s")
+
+    results = {}
+    failed = []
+    try:
+        for name in selected:
+            print(f"运行: {name} ...")
+            started = time.perf_counter()
+            try:
+                with silenced():
+                    measured = RUNNERS[name](ctx)
+            except Skipped as e:
+                print(f"  跳过: {e}")
+                continue
+            except Exception as e:
+                print(f"  失败: {e}")
+                failed.append(name)
+                continue
+            for key, value in measured.items():
+                results[key] = round(value, 3)
+            print(f"  完成 ({time.perf_counter() - started:.1f}s)")
+    finally:
+        server.stop()
+
+    baseline = load_baseline(args.baseline)
+    lines, regressions = compare(results, baseline, mode)
+    print("")
+    print("\n".join(lines))
+    breakdown = phase_breakdown()
+    if breakdown:
+        print("阶段耗时:")
+        print("\n".join(breakdown))
+
+    env = environment(mode)
+    base_env = baseline.get("baselines", {}).get(mode, {}).get("environment")
+    if base_env and {k: v for k, v in base_env.items() if k != "recorded_at"} != env:
+        print(f"提示: 基线记录于不同环境 ({base_env}), 对比结果仅供参考")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"environment": env, "results": results}, f, indent=2, ensure_ascii=False)
+    if args.update_baseline:
+        if failed:
+            print("错误: 有项目运行失败, 未更新基线")
+            return 1
+        entry = baseline.setdefault("baselines", {}).setdefault(mode, {})
+        entry["environment"] = dict(env, recorded_at=time.strftime("%Y-%m-%d"))
+        entry.setdefault("results", {}).update(results)
+        baseline.setdefault("thresholds", {"default": DEFAULT_THRESHOLD})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"基线已更新: {args.baseline}")
+        return 0
+    if failed or regressions:
+        print(f"未通过: 运行失败 {failed or '无'}, 回归 {regressions or '无'}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        code = main()
+    finally:
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
+    sys.exit(code)
@@ -0,0 +1,171 @@
+"""
+基准测试使用的本地服务器: 模拟 Douyin 分享页与媒体 CDN, 不访问外网
+
+- /share/video/<id>/      带 window._ROUTER_DATA 的移动端分享页 (play_addr 指向本服务器的多个镜像)
+- /playwm/<id>.mp4        直链 (支持 Range); /play/ 为去水印地址, 内容相同
+- /hls/<name>.m3u8        HLS 播放列表, 分片为 /hls/<name>/<i>.ts
+- /dash/<name>.mpd        DASH 清单 (单个音视频合一的表示), 分片为 /dash/<name>/<i>.m4s
+
+latency: 每个请求返回响应头之前的等待 (模拟往返与 CDN 首字节时间)
+connection_rate: 单个连接的传输速率上限 (字节/秒), 用于观察并发连接/分片数对吞吐的影响
+"""
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WRITE_BLOCK = 64 * 1024
+
+
+def _payload(size):
+    pattern = bytes(range(256))
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+class BenchServer:
+    def __init__(self, media_size=16 * 1024 * 1024, segment_count=30, segment_size=200 * 1024,
+                 latency=0.02, connection_rate=4 * 1024 * 1024, mirrors=3, port=0):
+        self.media = _payload(media_size)
+        self.segment = _payload(segment_size)
+        self.segment_count = segment_count
+        self.latency = latency
+        self.connection_rate = connection_rate
+        self.mirrors = mirrors
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="bench-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def share_page(self, video_id):
+        # 与真实页面相同的结构: loaderData 中某个键下的 videoInfoRes.item_list[0].video.play_addr
+        urls = [f"{self.url}/playwm/{video_id}.mp4?mirror={i}" for i in range(self.mirrors)]
+        data = {
+            "loaderData": {
+                "video_(id)/page": {
+                    "videoInfoRes": {
+                        "item_list": [{
+                            "aweme_id": video_id,
+                            "desc": f"bench {video_id}",
+                            "video": {"play_addr": {"uri": video_id, "url_list": urls}},
+                        }],
+                    },
+                },
+            },
+        }
+        return (
+            "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>bench</title></head><body>"
+            "<div id=\"root\"></div>"
+            f"<script>window._ROUTER_DATA = {json.dumps(data)}</script>"
+            "</body></html>"
+        ).encode("utf-8")
+
+    def hls_playlist(self, name):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:2", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(self.segment_count):
+            lines += ["#EXTINF:2.0,", f"{name}/{i}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def dash_manifest(self, name):
+        duration = self.segment_count * 2
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT{duration}S"
+     minBufferTime="PT2S" profiles="urn:mpeg:dash:profile:isoff-live:2011">
+  <Period id="0">
+    <AdaptationSet mimeType="video/mp4" segmentAlignment="true">
+      <Representation id="av" bandwidth="800000" width="1280" height="720" codecs="avc1.64001f,mp4a.40.2">
+        <SegmentTemplate timescale="1" duration="2" startNumber="0"
+                         initialization="{name}/init.m4s" media="{name}/$Number$.m4s"/>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+""".encode("utf-8")
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                path = self.path.split("?", 1)[0]
+                if re.fullmatch(r"/share/video/\d+/?", path):
+                    self._send(200, server.share_page(path.strip("/").rsplit("/", 1)[-1]), "text/html; charset=utf-8")
+                elif re.fullmatch(r"/play(wm)?/\d+\.mp4", path):
+                    self._send_media(server.media, "video/mp4")
+                elif re.fullmatch(r"/hls/[\w-]+\.m3u8", path):
+                    name = path[len("/hls/"):-len(".m3u8")]
+                    self._send(200, server.hls_playlist(name), "application/vnd.apple.mpegurl")
+                elif re.fullmatch(r"/hls/[\w-]+/\d+\.ts", path):
+                    self._send_media(server.segment, "video/mp2t")
+                elif re.fullmatch(r"/dash/[\w-]+\.mpd", path):
+                    name = path[len("/dash/"):-len(".mpd")]
+                    self._send(200, server.dash_manifest(name), "application/dash+xml")
+                elif re.fullmatch(r"/dash/[\w-]+/(init|\d+)\.m4s", path):
+                    self._send_media(server.segment, "video/mp4")
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+            def _send(self, status, body, content_type, extra=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (extra or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self._write(body)
+
+            def _send_media(self, data, content_type):
+                total = len(data)
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+                if not match:
+                    self._send(200, data, content_type, {"Accept-Ranges": "bytes"})
+                    return
+                start = int(match.group(1))
+                end = min(int(match.group(2) or total - 1), total - 1)
+                if start >= total:
+                    self._send(416, b"", content_type, {"Content-Range": f"bytes */{total}"})
+                    return
+                self._send(206, data[start:end + 1], content_type,
+                           {"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{total}"})
+
+            def _write(self, body):
+                # 按单连接速率上限分块写出
+                rate = server.connection_rate
+                started = time.perf_counter()
+                view = memoryview(body)
+                try:
+                    for offset in range(0, len(body), WRITE_BLOCK):
+                        self.wfile.write(view[offset:offset + WRITE_BLOCK])
+                        if rate:
+                            ahead = (offset + WRITE_BLOCK) / rate - (time.perf_counter() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
@@ -0,0 +1,156 @@
+import re
+import threading
+from urllib.parse import urlparse, parse_qs, urljoin
+
+# 需要跟随重定向才能得到视频 ID 的短链接域名
+SHORT_LINK_HOSTS = ('v.douyin.com', 'b23.tv')
+MAX_REDIRECTS = 5
+
+# YouTube 视频 ID 固定为 11 位
+_YOUTUBE_ID = r'([0-9A-Za-z_-]{11})'
+
+
+def canonical_id(url):
+    """
+    从链接中提取规范化的视频标识 "平台:ID", 无需网络请求
+    - Douyin: /video/<id> 或 modal_id=<id>
+    - YouTube: watch?v= / youtu.be / shorts / embed / live
+    - Bilibili: BV 号 (多 P 视频附加 _p<N>)
+    无法识别时返回 None
+    """
+    if not url:
+        return None
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    query = parse_qs(parsed.query)
+
+    if 'douyin.com' in host or 'iesdouyin.com' in host:
+        match = re.search(r'/video/(\d+)', parsed.path) or re.search(r'modal_id=(\d+)', parsed.query)
+        if match:
+            return f"douyin:{match.group(1)}"
+
+    if 'youtube.com' in host or 'youtu.be' in host:
+        video_id = None
+        if host.endswith('youtu.be'):
+            match = re.match(r'/' + _YOUTUBE_ID, parsed.path)
+            video_id = match and match.group(1)
+        elif query.get('v'):
+            video_id = query['v'][0]
+        else:
+            match = re.match(r'/(?:shorts|embed|live|v)/' + _YOUTUBE_ID, parsed.path)
+            video_id = match and match.group(1)
+        if video_id and re.fullmatch(_YOUTUBE_ID, video_id):
+            return f"youtube:{video_id}"
+
+    if 'bilibili.com' in host:
+        match = re.search(r'(BV[0-9A-Za-z]{10})', parsed.path)
+        if match:
+            page = query.get('p', ['1'])[0]
+            suffix = f"_p{page}" if page.isdigit() and int(page) > 1 else ""
+            return f"bilibili:{match.group(1)}{suffix}"
+
+    return None
+
+
+def host_key(url):
+    """
+    提取用于并发限制的主机标识
+    同一平台的不同子域 (v.douyin.com / www.douyin.com) 归为同一个 key
+    """
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    host = (urlparse(url).hostname or "").lower()
+    parts = host.split(".")
+    # IP 地址保持完整
+    if len(parts) > 2 and not host.replace(".", "").isdigit():
+        host = ".".join(parts[-2:])
+    return host
+
+
+def cache_key(url):
+    """缓存使用的键: 优先规范化 ID, 无法识别时退回到原始链接"""
+    return canonical_id(url) or f"url:{url}"
+
+
+_expand_lock = threading.Lock()
+_expanded = {} # 短链接 → 展开后的地址 (进程内缓存)
+
+
+def is_short_link(url):
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    host = (urlparse(url).hostname or "").lower()
+    return host in SHORT_LINK_HOSTS
+
+
+def expand_short_link(url, timeout=10):
+    """
+    逐跳读取短链接的 Location 重定向 (不下载落地页), 直到得到可识别视频 ID 的地址
+    失败时返回原链接
+    """
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    with _expand_lock:
+        if url in _expanded:
+            return _expanded[url]
+
+    from http_pool import get_session_pool
+
+    current = url
+    try:
+        for _ in range(MAX_REDIRECTS):
+            response = get_session_pool().get(current, allow_redirects=False, timeout=timeout)
+            location = response.headers.get("Location")
+            if response.status_code not in (301, 302, 303, 307, 308) or not location:
+                break
+            current = urljoin(current, location)
+            if canonical_id(current):
+                break
+    except Exception:
+        return url
+
+    with _expand_lock:
+        _expanded[url] = current
+    return current
+
+
+async def expand_short_link_async(url, timeout=10):
+    """expand_short_link 的异步版本 (使用 AsyncSession, 与同步版本共用展开结果缓存)"""
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    with _expand_lock:
+        if url in _expanded:
+            return _expanded[url]
+
+    from http_pool import get_async_session_pool
+
+    current = url
+    try:
+        for _ in range(MAX_REDIRECTS):
+            response = await get_async_session_pool().get(current, allow_redirects=False, timeout=timeout)
+            location = response.headers.get("Location")
+            if response.status_code not in (301, 302, 303, 307, 308) or not location:
+                break
+            current = urljoin(current, location)
+            if canonical_id(current):
+                break
+    except Exception:
+        return url
+
+    with _expand_lock:
+        _expanded[url] = current
+    return current
+
+
+def canonicalize(url):
+    """
+    返回 (规范化 ID, 可直接解析的地址)
+    短链接会先展开 (需要网络请求), 其余链接离线识别; 无法识别时 ID 为 None
+    """
+    key = canonical_id(url)
+    if key or not is_short_link(url):
+        return key, url
+    resolved = expand_short_link(url)
+    return canonical_id(resolved), resolved
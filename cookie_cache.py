@@ -0,0 +1,142 @@
+import os
+import copy
+import time
+import threading
+
+# 浏览器 Cookies 数据库位置无法定位时, 按固定时间间隔重新加载
+FALLBACK_TTL = 600
+
+
+def _browser_cookie_db(browser):
+    """定位浏览器最近使用的 Cookies 数据库 (多个配置文件时取最新的), 找不到时返回 None"""
+    try:
+        from yt_dlp.cookies import _get_chromium_based_browser_settings
+        root = _get_chromium_based_browser_settings(browser)['browser_dir']
+    except Exception:
+        return None
+    newest = None
+    for current, _, files in os.walk(root):
+        if 'Cookies' in files:
+            path = os.path.join(current, 'Cookies')
+            if newest is None or os.path.getmtime(path) > os.path.getmtime(newest):
+                newest = path
+    return newest
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path) if path else None
+    except OSError:
+        return None
+
+
+def _copy_jar(jar):
+    from yt_dlp.cookies import YoutubeDLCookieJar
+    result = YoutubeDLCookieJar()
+    for cookie in jar:
+        result.set_cookie(copy.copy(cookie))
+    return result
+
+
+class _CachedJar:
+    def __init__(self, jar, signature, load_time, error=None):
+        self.jar = jar
+        self.signature = signature
+        self.load_time = load_time
+        self.loaded_at = time.monotonic()
+        self.error = error
+
+
+class CookieJarCache:
+    """
+    进程内共享的 Cookies 缓存
+    - 浏览器 Cookies (复制数据库 + 解密, macOS 上还需访问钥匙串) 只加载一次
+    - 浏览器数据库或 cookies.txt 的修改时间变化时才重新加载
+    - 每个任务拿到独立副本, 任务中写入的 Cookies 不会影响其他任务
+    """
+    def __init__(self, browser='chrome'):
+        self.browser = browser
+        self._db_path = None
+        self._db_searched = False
+        self._entries = {} # cookies.txt 路径 (或 None) -> _CachedJar
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.load_time = 0.0   # 累计加载耗时
+        self.saved_time = 0.0  # 复用缓存节省的时间 (按最近一次加载耗时估算)
+
+    def _signature(self, cookies_file):
+        if not self._db_searched:
+            self._db_path = _browser_cookie_db(self.browser)
+            self._db_searched = True
+        return (self._db_path, _mtime(self._db_path), cookies_file, _mtime(cookies_file))
+
+    def _load(self, cookies_file):
+        from yt_dlp.cookies import extract_cookies_from_browser, YoutubeDLCookieJar
+
+        started = time.perf_counter()
+        jar = YoutubeDLCookieJar()
+        error = None
+        try:
+            for cookie in extract_cookies_from_browser(self.browser):
+                jar.set_cookie(cookie)
+        except Exception as e:
+            error = str(e)
+        if cookies_file and os.access(cookies_file, os.R_OK):
+            file_jar = YoutubeDLCookieJar(cookies_file)
+            file_jar.load()
+            for cookie in file_jar:
+                jar.set_cookie(cookie)
+        return jar, time.perf_counter() - started, error
+
+    def get(self, cookies_file=None, log=None):
+        """返回当前任务使用的 Cookies 副本 (YoutubeDLCookieJar)"""
+        log = log or (lambda msg: None)
+        with self._lock:
+            signature = self._signature(cookies_file)
+            entry = self._entries.get(cookies_file)
+            stale = entry is None or entry.signature != signature
+            if not stale and signature[1] is None and time.monotonic() - entry.loaded_at > FALLBACK_TTL:
+                stale = True
+            if stale:
+                if entry is not None:
+                    log("状态: Cookies 已更新, 重新加载")
+                jar, load_time, error = self._load(cookies_file)
+                entry = _CachedJar(jar, signature, load_time, error)
+                self._entries[cookies_file] = entry
+                self.loads += 1
+                self.load_time += load_time
+                if error:
+                    log(f"提示: 未加载浏览器 Cookies: {error}")
+                else:
+                    log(f"状态: 已加载 Chrome Cookies ({load_time:.2f}s)")
+            else:
+                self.hits += 1
+                self.saved_time += entry.load_time
+            return _copy_jar(entry.jar)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loads": self.loads,
+                "hits": self.hits,
+                "load_time": round(self.load_time, 2),
+                "saved_time": round(self.saved_time, 2),
+            }
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"Cookies 缓存: 加载 {s['loads']} 次 (耗时 {s['load_time']:.1f}s), "
+                f"复用 {s['hits']} 次, 节省约 {s['saved_time']:.1f}s")
+
+
+_cache_lock = threading.Lock()
+_shared_cache = None
+
+
+def get_cookie_cache():
+    global _shared_cache
+    with _cache_lock:
+        if _shared_cache is None:
+            _shared_cache = CookieJarCache()
+        return _shared_cache
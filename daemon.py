@@ -0,0 +1,421 @@
+"""
+常驻后台服务: 进程内保持已导入的 yt-dlp 提取器、HTTP 连接池、解析缓存与 FFmpeg 探测结果,
+通过本地 HTTP 接口接收任务, 每次提交不再承担解释器启动与模块导入的开销
+
+接口 (仅监听 127.0.0.1, 请求需带 X-Auth-Token, 令牌在启动时生成并写入 daemon.json, 文件权限 0600):
+- GET    /health              服务状态、各状态任务数与各阶段队列深度
+- GET    /jobs                任务列表
+- POST   /jobs                提交任务 {"url", "convert_to_mp4", "resolution", "cookies_file", "priority"}
+- GET    /jobs/<id>           单个任务状态
+- POST   /jobs/<id>/cancel    取消任务 (DELETE /jobs/<id> 相同)
+- GET    /events[?job=a,b]    Server-Sent Events: state (任务状态) / log (状态文字) / progress (下载进度)
+- GET    /metrics             Prometheus 文本格式的阶段耗时、计数器与队列深度
+
+命令行在服务运行时把任务提交给服务并跟随事件流输出 (daemon_client.DaemonClient), 不在本进程下载
+"""
+import os
+import sys
+import json
+import time
+import queue
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from paths import cache_path
+from daemon_client import (DaemonClient, DaemonError, DAEMON_FILE, DEFAULT_HOST, DEFAULT_PORT, AUTH_HEADER,
+                           KEEPALIVE_INTERVAL)
+
+EVENT_QUEUE_SIZE = 1000       # 单个事件流连接的缓冲上限, 客户端过慢时丢弃最旧的事件
+
+
+class EventHub:
+    """事件分发: 每个事件流连接一个有界队列, 发布方不会被慢速客户端阻塞"""
+    def __init__(self, maxsize=EVENT_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(self.maxsize)
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    q.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+def job_to_dict(job):
+    """任务的 JSON 表示 (接口返回与 state 事件共用)"""
+    return {
+        "id": job.journal_id,
+        "index": job.index,
+        "url": job.url,
+        "state": job.state,
+        "label": job.state_label,
+        "progress": round(job.progress, 4),
+        "priority": job.priority,
+        "output": job.output_path,
+        "error": job.error,
+        "elapsed": round(job.elapsed, 2),
+        "duplicate_of": job.leader.journal_id if job.leader is not None else None,
+    }
+
+
+def progress_to_dict(event):
+    return {
+        "id": event.task_id,
+        "phase": event.phase,
+        "downloaded": event.downloaded,
+        "total": event.total,
+        "speed": event.speed,
+        "eta": event.eta,
+        "fragment": event.fragment,
+        "fragment_count": event.fragment_count,
+    }
+
+
+class JobDaemon:
+    """
+    常驻调度器 + 转码池 + 任务日志 (服务专用, 与命令行/界面的日志分开)
+    resume: 启动时恢复上次未完成的任务 (--daemon --resume); 否则只提示未完成任务的数量
+    extractor_options: 传给每个任务的 VideoExtractor (stream_transcode / max_bitrate / max_filesize / concurrent_fragments)
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=4, per_host=2, cpu_budget=None,
+                 extractor_options=None, resume=False, log=print):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.per_host = per_host
+        self.cpu_budget = cpu_budget
+        self.extractor_options = extractor_options or {}
+        self.resume = resume
+        self.log = log
+        self.token = secrets.token_urlsafe(24)
+        self.events = EventHub()
+        self.scheduler = None
+        self.pool = None
+        self.started_at = None
+        self._httpd = None
+        self._stopping = threading.Event()
+
+    def _warm_up(self):
+        """预先导入 yt-dlp 全部提取器、创建连接池、探测 FFmpeg (之后的任务不再承担这些开销)"""
+        started = time.perf_counter()
+        from yt_dlp.extractor import gen_extractor_classes
+        from http_pool import get_session_pool
+        from toolchain import get_toolchain
+
+        gen_extractor_classes()
+        get_session_pool()
+        toolchain = get_toolchain()
+        if not toolchain.available:
+            self.log("警告: 系统中未检测到 FFmpeg，部分平台(如B站)可能无法下载高清或视频合并。")
+        self.log(f"状态: 预热完成 ({time.perf_counter() - started:.2f}s)")
+
+    def start(self):
+        """预热、恢复未完成的任务 (resume 时) 并开始监听; 端口被占用时抛出 OSError"""
+        from scheduler import DownloadScheduler
+        from transcode import configure_transcode_pool
+        from journal import get_journal, MODE_DAEMON
+        from progress import get_progress_bus
+        from resolve_cache import configure_resolve_cache
+        from video_extractor import VideoExtractor
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+
+        self._warm_up()
+        # 解析结果保存到磁盘, 服务重启后仍可跳过解析
+        configure_resolve_cache(db_path=cache_path("resolve_cache.sqlite3"))
+        journal = get_journal(MODE_DAEMON)
+        # 压缩日志 (只保留未完成任务), 只有明确要求时才恢复
+        unfinished = journal.compact()
+        resumed = unfinished if self.resume else []
+        options = self.extractor_options
+        self.pool = configure_transcode_pool(cpu_budget=self.cpu_budget)
+        self.scheduler = DownloadScheduler(
+            workers=self.workers,
+            per_host=self.per_host,
+            extractor_factory=lambda: VideoExtractor(**options),
+            log=self.log,
+            transcode_pool=self.pool,
+            journal=journal,
+        )
+        get_progress_bus().subscribe_coalesced(self._on_progress)
+        self.scheduler.start()
+        self.started_at = time.time()
+        if resumed:
+            self.log(f"状态: 恢复上次未完成的任务 {len(resumed)} 个")
+            for entry in resumed:
+                on_status, holder = self._status_callback()
+                holder.append(self.scheduler.restore(entry, on_status=on_status, on_state=self._on_state))
+        elif unfinished:
+            self.log(f"提示: 上次有 {len(unfinished)} 个未完成的任务, 使用 --daemon --resume 启动以恢复")
+
+        self._write_state()
+        self.log(f"状态: 后台服务已启动 http://{self.host}:{self.port} (并发 {self.scheduler.workers}, "
+                 f"单站点上限 {self.scheduler.per_host}, 转码进程 {self.pool.workers} x {self.pool.threads_per_job} 线程)")
+        return self
+
+    def serve_forever(self):
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """停止接收请求 (可从其他线程调用); 未完成的任务保留在任务日志中, 下次启动时继续"""
+        self._stopping.set()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+
+    def close(self):
+        self._stopping.set()
+        self._remove_state()
+        if self._httpd is not None:
+            self._httpd.server_close()
+        if self.scheduler is not None:
+            from scheduler import FINISHED_STATES
+            self.scheduler.shutdown()
+            unfinished = sum(n for state, n in self.scheduler.counts().items() if state not in FINISHED_STATES)
+            if unfinished:
+                self.log(f"状态: 未完成的任务 {unfinished} 个, 下次启动时继续")
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+        self.log("状态: 后台服务已停止")
+
+    def _write_state(self):
+        path = cache_path(DAEMON_FILE)
+        data = {"pid": os.getpid(), "host": self.host, "port": self.port, "token": self.token,
+                "started_at": self.started_at}
+        temp = path + ".tmp"
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp, path)
+
+    def _remove_state(self):
+        # 只删除本进程写入的状态文件 (另一个实例可能已在其他端口启动)
+        path = cache_path(DAEMON_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                if json.load(f).get("pid") != os.getpid():
+                    return
+            os.remove(path)
+        except (OSError, ValueError):
+            pass
+
+    # ---- 任务操作 ----
+
+    def _status_callback(self):
+        """任务的状态文字: 输出到服务日志并发布为 log 事件 (holder 在提交后放入任务)"""
+        holder = []
+
+        def on_status(message):
+            if not holder:
+                # 提交过程中的提示 (重复视频), 调度器已输出到日志
+                return
+            job = holder[0]
+            self.log(f"[{job.index}/{len(self.scheduler.jobs)}] {message}")
+            self.events.publish({"type": "log", "id": job.journal_id, "message": message})
+
+        return on_status, holder
+
+    def submit(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None, priority=0):
+        on_status, holder = self._status_callback()
+        job = self.scheduler.submit(url, convert_to_mp4=convert_to_mp4, resolution=resolution,
+                                    cookies_file=cookies_file, priority=priority,
+                                    on_status=on_status, on_state=self._on_state)
+        holder.append(job)
+        return job
+
+    def _on_state(self, job):
+        self.events.publish({"type": "state", "id": job.journal_id, "job": job_to_dict(job)})
+
+    def _on_progress(self, events):
+        for event in events:
+            if event.task_id is not None:
+                self.events.publish({"type": "progress", "id": event.task_id, "progress": progress_to_dict(event)})
+
+    def health(self):
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at else 0.0,
+            "workers": self.scheduler.workers,
+            "per_host": self.scheduler.per_host,
+            "jobs": self.scheduler.counts(),
+            "stages": self.scheduler.stage_depths(),
+        }
+
+    # ---- HTTP 接口 ----
+
+    def _handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            server_version = "VideoDownloaderDaemon"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def _dispatch(self, method):
+                token = self.headers.get(AUTH_HEADER) or ""
+                if not secrets.compare_digest(token, daemon.token):
+                    self._send_json(401, {"error": "令牌无效"})
+                    return
+                parsed = urlparse(self.path)
+                parts = [p for p in parsed.path.split("/") if p]
+                try:
+                    if method == "GET" and parts == ["health"]:
+                        self._send_json(200, daemon.health())
+                    elif method == "GET" and parts == ["jobs"]:
+                        jobs = [job_to_dict(j) for j in list(daemon.scheduler.jobs)]
+                        self._send_json(200, {"jobs": jobs, "counts": daemon.scheduler.counts()})
+                    elif method == "POST" and parts == ["jobs"]:
+                        self._submit()
+                    elif len(parts) == 2 and parts[0] == "jobs" and method in ("GET", "DELETE"):
+                        self._job(parts[1], cancel=method == "DELETE")
+                    elif method == "POST" and len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                        self._job(parts[1], cancel=True)
+                    elif method == "GET" and parts == ["events"]:
+                        ids = [i for v in parse_qs(parsed.query).get("job", []) for i in v.split(",") if i]
+                        self._stream_events(set(ids))
+                    elif method == "GET" and parts == ["metrics"]:
+                        from metrics import get_metrics
+                        text = get_metrics().render_prometheus(daemon.scheduler.stage_depths())
+                        self._send(200, text.encode("utf-8"),
+                                   "text/plain; version=0.0.4; charset=utf-8")
+                    else:
+                        self._send_json(404, {"error": "未知接口"})
+                except Exception as e:
+                    self._send_json(500, {"error": f"运行异常: {e}"})
+
+            def _submit(self):
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send_json(400, {"error": "请求体不是有效的 JSON"})
+                    return
+                url = (body.get("url") or "").strip() if isinstance(body, dict) else ""
+                if not url:
+                    self._send_json(400, {"error": "缺少 url"})
+                    return
+                job = daemon.submit(
+                    url,
+                    convert_to_mp4=bool(body.get("convert_to_mp4", True)),
+                    resolution=str(body.get("resolution") or '1080'),
+                    cookies_file=body.get("cookies_file"),
+                    priority=int(body.get("priority") or 0),
+                )
+                self._send_json(201, job_to_dict(job))
+
+            def _job(self, job_id, cancel=False):
+                job = daemon.scheduler.find(job_id)
+                if job is None:
+                    self._send_json(404, {"error": f"任务不存在: {job_id}"})
+                    return
+                if cancel:
+                    cancelled = daemon.scheduler.cancel_job(job)
+                    self._send_json(200, {"cancelled": cancelled, "job": job_to_dict(job)})
+                else:
+                    self._send_json(200, job_to_dict(job))
+
+            def _stream_events(self, ids):
+                q = daemon.events.subscribe()
+                self.close_connection = True
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                    self.send_header("Cache-Control", "no-cache")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    # 先发送当前状态: 订阅前已结束的任务不会错过结果
+                    for job in list(daemon.scheduler.jobs):
+                        if not ids or job.journal_id in ids:
+                            self._write_event({"type": "state", "id": job.journal_id, "job": job_to_dict(job)})
+                    while not daemon._stopping.is_set():
+                        try:
+                            event = q.get(timeout=KEEPALIVE_INTERVAL)
+                        except queue.Empty:
+                            self.wfile.write(b": keepalive\n\n")
+                            self.wfile.flush()
+                            continue
+                        if not ids or event.get("id") in ids:
+                            self._write_event(event)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    daemon.events.unsubscribe(q)
+
+            def _write_event(self, event):
+                data = json.dumps(event, ensure_ascii=False)
+                self.wfile.write(f"event: {event['type']}\ndata: {data}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _send_json(self, status, data):
+                self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"),
+                           "application/json; charset=utf-8")
+
+            def _send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def run_daemon(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=4, per_host=2, cpu_budget=None, extractor_options=None,
+               resume=False):
+    """前台运行后台服务, Ctrl+C / SIGTERM 时停止"""
+    import signal
+
+    existing = DaemonClient.discover()
+    if existing is not None:
+        print(f"错误: 后台服务已在运行 (http://{existing.host}:{existing.port})")
+        return False
+    daemon = JobDaemon(host, port, workers=workers, per_host=per_host, cpu_budget=cpu_budget,
+                       extractor_options=extractor_options, resume=resume)
+    try:
+        daemon.start()
+    except OSError as e:
+        print(f"错误: 无法监听 {host}:{port}: {e}")
+        return False
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return True
@@ -0,0 +1,198 @@
+"""
+后台服务 (daemon.py) 的命令行客户端: 提交任务、跟随事件流输出、查看与取消任务
+只使用标准库 (不导入 yt-dlp、curl_cffi 与调度器), 命令行把任务交给后台服务时不承担这些模块的导入开销
+"""
+import os
+import json
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+
+from paths import cache_path
+
+DAEMON_FILE = "daemon.json"   # 运行中服务的地址与令牌
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 17865
+AUTH_HEADER = "X-Auth-Token"
+KEEPALIVE_INTERVAL = 15       # 事件流空闲时的心跳间隔 (秒), 用于发现已断开的客户端
+
+
+class DaemonError(Exception):
+    """后台服务返回错误 (status 为 HTTP 状态码)"""
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class DaemonClient:
+    """后台服务的客户端 (仅使用标准库, 不导入 yt-dlp)"""
+    def __init__(self, host, port, token, timeout=10):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+
+    @classmethod
+    def discover(cls, timeout=1.0):
+        """读取 daemon.json 并确认服务仍在响应; 服务未运行时返回 None"""
+        try:
+            with open(cache_path(DAEMON_FILE), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            client = cls(state["host"], state["port"], state["token"])
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            client._request("GET", "/health", timeout=timeout)
+        except (OSError, DaemonError):
+            return None
+        return client
+
+    def _open(self, method, path, body=None, timeout=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urlrequest.Request(f"http://{self.host}:{self.port}{path}", data=data, method=method)
+        req.add_header(AUTH_HEADER, self.token)
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            return urlrequest.urlopen(req, timeout=timeout or self.timeout)
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error") or str(e)
+            except ValueError:
+                message = str(e)
+            raise DaemonError(message, e.code)
+
+    def _request(self, method, path, body=None, timeout=None):
+        with self._open(method, path, body, timeout) as response:
+            return json.loads(response.read())
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def submit(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None, priority=0):
+        if cookies_file:
+            # 服务的工作目录与命令行不同
+            cookies_file = os.path.abspath(cookies_file)
+        return self._request("POST", "/jobs", {"url": url, "convert_to_mp4": convert_to_mp4,
+                                               "resolution": resolution, "cookies_file": cookies_file,
+                                               "priority": priority})
+
+    def jobs(self):
+        return self._request("GET", "/jobs")
+
+    def job(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def cancel(self, job_id):
+        return self._request("POST", f"/jobs/{job_id}/cancel")
+
+    def events(self, job_ids=None):
+        """
+        打开事件流并返回逐个产生事件 (dict) 的迭代器, 连接断开时结束
+        连接在调用时即建立: 先打开再提交任务, 不会错过任务开始时的状态文字
+        """
+        path = "/events"
+        if job_ids:
+            path += "?job=" + ",".join(job_ids)
+        return self._read_events(self._open("GET", path, timeout=KEEPALIVE_INTERVAL * 4))
+
+    @staticmethod
+    def _read_events(response):
+        with response:
+            data = []
+            for raw in response:
+                line = raw.decode("utf-8").rstrip("\r\n")
+                if line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    yield json.loads("\n".join(data))
+                    data = []
+
+
+FINISHED = ("done", "failed", "cancelled") # 与 scheduler.FINISHED_STATES 相同 (客户端不导入调度器)
+
+
+def follow_jobs(client, jobs, events, show_progress=True):
+    """
+    跟随事件流 (client.events()) 输出状态文字与下载进度, 直到提交的任务全部结束; Ctrl+C 时取消这些任务
+    返回各任务的最终状态 (job 字典列表)
+    """
+    from progress import ConsolePrinter, ProgressEvent
+
+    results = {job["id"]: job for job in jobs}
+    prefixes = {job["id"]: (f"[{n}/{len(jobs)}] " if len(jobs) > 1 else "") for n, job in enumerate(jobs, 1)}
+    printer = ConsolePrinter() if show_progress else None
+    try:
+        if all(job["state"] in FINISHED for job in jobs):
+            return jobs
+        for event in events:
+            job_id = event.get("id")
+            if job_id not in results:
+                continue
+            if event["type"] == "log":
+                if printer is not None:
+                    printer.break_line()
+                print(prefixes[job_id] + event["message"])
+            elif event["type"] == "progress" and printer is not None:
+                p = event["progress"]
+                printer([ProgressEvent(job_id, p["phase"], p["downloaded"], p["total"], p["speed"], p["eta"],
+                                       p["fragment"], p["fragment_count"])])
+            elif event["type"] == "state":
+                results[job_id] = event["job"]
+                if all(job["state"] in FINISHED for job in results.values()):
+                    break
+    except KeyboardInterrupt:
+        print("\n状态: 正在取消任务...")
+        for job_id, job in results.items():
+            if job["state"] not in FINISHED:
+                try:
+                    results[job_id] = client.cancel(job_id)["job"]
+                except (OSError, DaemonError):
+                    pass
+        print("状态: 已请求取消, 已下载的部分保留在下载目录中 (重新提交时继续)")
+    return list(results.values())
+
+
+def submit_and_follow(client, urls, convert_to_mp4=True, resolution='1080', cookies_file=None):
+    """命令行的客户端模式: 提交到后台服务并等待完成, 多个任务时输出汇总; 返回各任务的最终状态"""
+    print(f"状态: 已提交到后台服务 (http://{client.host}:{client.port})")
+    events = client.events()
+    try:
+        jobs = [client.submit(u, convert_to_mp4=convert_to_mp4, resolution=resolution, cookies_file=cookies_file)
+                for u in urls]
+        results = follow_jobs(client, jobs, events, show_progress=len(jobs) == 1)
+    finally:
+        events.close()
+    if len(results) == 1:
+        job = results[0]
+        if job["state"] == "done" and job["output"]:
+            print(f"文件: {job['output']}")
+        return results
+    succeeded = sum(1 for job in results if job["state"] == "done")
+    cancelled = sum(1 for job in results if job["state"] == "cancelled")
+    failed = [job for job in results if job["state"] == "failed"]
+    print("")
+    print("=== 批量下载汇总 ===")
+    line = f"任务总数: {len(results)} | 成功: {succeeded} | 失败: {len(failed)}"
+    if cancelled:
+        line += f" | 已取消: {cancelled}"
+    print(line)
+    if failed:
+        print("失败列表:")
+        for job in failed:
+            print(f"  - {job['url']}: {job['error']}")
+    return results
+
+
+def print_jobs(client):
+    """输出后台服务中的任务列表 (--jobs)"""
+    data = client.jobs()
+    for job in data["jobs"]:
+        progress = f"{job['progress'] * 100:5.1f}%" if job["state"] not in FINISHED else "      "
+        line = f"{job['id']}  {job['label']:<4} {progress}  {job['url']}"
+        if job["error"] and job["state"] != "done":
+            line += f"  ({job['error']})"
+        print(line)
+    counts = data["counts"]
+    print(f"共 {len(data['jobs'])} 个任务 | 排队 {counts['queued']} | 下载中 {counts['running']} | "
+          f"转码 {counts['transcode_queued'] + counts['transcoding']} | 完成 {counts['done']} | "
+          f"失败 {counts['failed']} | 已取消 {counts['cancelled']}")
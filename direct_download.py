@@ -0,0 +1,527 @@
+import os
+import json
+import time
+import threading
+import subprocess
+from collections import deque
+
+from progress import DownloadCancelled
+
+SPEED_CHECK_AFTER = 2.0 # 分段读取超过该时长 (秒) 后开始判断镜像速度
+
+
+def format_bytes(num):
+    """字节数格式化为 1.23MiB 形式 (与 yt-dlp 的显示风格一致)"""
+    if num is None:
+        return "N/A"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num) < 1024 or unit == "GiB":
+            return f"{num:.2f}{unit}" if unit != "B" else f"{int(num)}B"
+        num /= 1024.0
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "N/A"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressMeter:
+    """
+    根据已下载字节计算速度/剩余时间
+    回调参数均为数值: callback(已下载字节, 总字节, 速度 bytes/s, 剩余秒数)
+    """
+    def __init__(self, total, callback=None, interval=0.1):
+        self.total = total or 0
+        self.callback = callback
+        self.interval = interval
+        self.downloaded = 0
+        self.initial = 0 # 断点续传时已有的字节数 (不计入速度)
+        self.started = time.time()
+        self._last_report = 0.0
+
+    def add(self, nbytes):
+        self.downloaded += nbytes
+        now = time.time()
+        if self.callback and now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report(now)
+
+    def report(self, now=None):
+        now = now or time.time()
+        elapsed = max(now - self.started, 1e-6)
+        speed = max(self.downloaded - self.initial, 0) / elapsed
+        eta = (self.total - self.downloaded) / speed if self.total and speed > 0 else None
+        self.callback(self.downloaded, self.total or None, speed, eta)
+
+
+def stream_to_ffmpeg(url, headers, ffmpeg_cmd, progress_callback=None,
+                     impersonate="chrome120", chunk_size=256 * 1024, timeout=30, throttle=None):
+    """
+    将 HTTP 响应体直接写入 ffmpeg 的标准输入 (ffmpeg_cmd 需使用 -i pipe:0)
+    下载与转码同时进行, 磁盘上只会写入 ffmpeg 的最终输出
+    throttle: 每读取一块数据调用一次 (参数为字节数), 用于全局带宽限速
+    失败时抛出 RuntimeError
+    """
+    proc = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    # 持续读取 stderr, 避免管道写满导致 ffmpeg 阻塞; 只保留最后几行用于报错
+    stderr_tail = deque(maxlen=20)
+
+    def drain_stderr():
+        for line in iter(proc.stderr.readline, b''):
+            stderr_tail.append(line.decode('utf-8', 'replace').rstrip())
+
+    reader = threading.Thread(target=drain_stderr, daemon=True)
+    reader.start()
+
+    from curl_cffi import requests as cffi_requests
+
+    response = None
+    try:
+        response = cffi_requests.get(
+            url,
+            headers=headers,
+            impersonate=impersonate,
+            allow_redirects=True,
+            stream=True,
+            timeout=timeout,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+        total = int(response.headers.get("content-length") or 0)
+        meter = ProgressMeter(total, progress_callback)
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            try:
+                proc.stdin.write(chunk)
+            except (BrokenPipeError, OSError):
+                # ffmpeg 已提前退出 (例如输入格式无法从管道解析)
+                break
+            meter.add(len(chunk))
+            if throttle:
+                throttle(len(chunk))
+        if progress_callback:
+            meter.report()
+    except Exception:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        if response is not None:
+            response.close()
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+    returncode = proc.wait()
+    reader.join(timeout=5)
+    if returncode != 0:
+        detail = stderr_tail[-1] if stderr_tail else f"exit {returncode}"
+        raise RuntimeError(f"FFmpeg 流式转码失败: {detail}")
+
+
+def remove_quietly(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def _probe_mirror(url, headers, impersonate, probe_bytes, timeout):
+    """小范围 GET 测速, 返回 (首字节时间, 吞吐 bytes/s), 失败时返回 None"""
+    from curl_cffi import requests as cffi_requests
+
+    started = time.time()
+    try:
+        response = cffi_requests.get(url, headers={**headers, "Range": f"bytes=0-{probe_bytes - 1}"},
+                                     impersonate=impersonate, allow_redirects=True, stream=True, timeout=timeout)
+    except Exception:
+        return None
+    try:
+        if response.status_code not in (200, 206):
+            return None
+        ttfb = time.time() - started
+        received = 0
+        for data in response.iter_content(chunk_size=16 * 1024):
+            received += len(data)
+            if received >= probe_bytes:
+                break
+        elapsed = max(time.time() - started, 1e-6)
+        return ttfb, received / elapsed
+    except Exception:
+        return None
+    finally:
+        response.close()
+
+
+async def _probe_mirror_async(url, headers, probe_bytes, timeout):
+    """_probe_mirror 的异步版本 (共享的 AsyncSession)"""
+    from http_pool import get_async_session_pool
+
+    started = time.time()
+    try:
+        response = await get_async_session_pool().get(url, headers={**headers, "Range": f"bytes=0-{probe_bytes - 1}"},
+                                                      allow_redirects=True, stream=True, timeout=timeout)
+    except Exception:
+        return None
+    try:
+        if response.status_code not in (200, 206):
+            return None
+        ttfb = time.time() - started
+        received = 0
+        async for data in response.aiter_content(chunk_size=16 * 1024):
+            received += len(data)
+            if received >= probe_bytes:
+                break
+        elapsed = max(time.time() - started, 1e-6)
+        return ttfb, received / elapsed
+    except Exception:
+        return None
+    finally:
+        await response.aclose()
+
+
+def _rank_mirrors(urls, results, log=None):
+    ranked = sorted(
+        ((url, result) for url, result in zip(urls, results) if result),
+        key=lambda item: item[1][1],
+        reverse=True,
+    )
+    if not ranked:
+        return urls
+    if log:
+        ttfb, speed = ranked[0][1]
+        log(f"状态: 已选择最快镜像 ({len(ranked)}/{len(urls)} 可用, 首字节 {ttfb * 1000:.0f}ms, {format_bytes(speed)}/s)")
+    return [url for url, _ in ranked]
+
+
+def race_mirrors(urls, headers=None, impersonate="chrome120", probe_bytes=64 * 1024, timeout=8, log=None):
+    """
+    并发探测所有 CDN 镜像 (首字节时间 + 小范围下载吞吐), 按速度从快到慢返回可用地址
+    全部探测失败时按原顺序返回, 交给下载阶段报错
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    urls = list(dict.fromkeys(urls))
+    if len(urls) <= 1:
+        return urls
+    headers = dict(headers or {})
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        results = list(pool.map(lambda u: _probe_mirror(u, headers, impersonate, probe_bytes, timeout), urls))
+    return _rank_mirrors(urls, results, log)
+
+
+async def race_mirrors_async(urls, headers=None, probe_bytes=64 * 1024, timeout=8, log=None):
+    """race_mirrors 的异步版本: 所有镜像在同一事件循环中并发探测, 不占用线程"""
+    import asyncio
+
+    urls = list(dict.fromkeys(urls))
+    if len(urls) <= 1:
+        return urls
+    headers = dict(headers or {})
+    results = await asyncio.gather(*(_probe_mirror_async(u, headers, probe_bytes, timeout) for u in urls))
+    return _rank_mirrors(urls, results, log)
+
+
+class SegmentedDownloader:
+    """
+    基于 curl_cffi 的多连接分段下载器
+    - 通过 Range 请求把文件切成固定大小的块, 多个连接并行领取 (每个连接复用一个 Session 保持长连接)
+    - 状态文件 <输出>.part.json 记录已完成的块, 中断后从已完成的块继续, 而不是从 0 字节重新开始
+    - 连接数自适应: 增加连接后单连接吞吐未明显下降 (带宽未饱和) 时继续增加, 否则停止增加
+    - 多镜像: url 可以是按优先级排序的地址列表; 分段失败或读取中吞吐低于 min_speed 时切换到下一个镜像
+    - throttle: 每读取一块数据调用一次 (参数为字节数, 返回等待秒数), 用于全局带宽限速;
+      限速等待的时间不计入镜像测速
+    服务器不支持 Range 时退化为单连接顺序下载
+    """
+    def __init__(self, url, output_path, headers=None, min_connections=2, max_connections=8,
+                 chunk_size=4 * 1024 * 1024, impersonate="chrome120", progress_callback=None,
+                 log=None, timeout=30, max_retries=3, min_speed=64 * 1024, throttle=None):
+        self.mirrors = list(url) if isinstance(url, (list, tuple)) else [url]
+        self._mirror_index = 0
+        self.url = self.mirrors[0]
+        self.min_speed = min_speed
+        self.output_path = output_path
+        self.headers = dict(headers or {})
+        self.min_connections = max(1, min_connections)
+        self.max_connections = max(self.min_connections, max_connections)
+        self.chunk_size = chunk_size
+        self.impersonate = impersonate
+        self.progress_callback = progress_callback
+        self.log = log or (lambda msg: None)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.throttle = throttle
+
+        self.part_path = output_path + ".part"
+        self.state_path = output_path + ".part.json"
+
+        self.total = 0
+        self.done = set()
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._error = None
+        self._workers = []
+        self._meter = None
+        self.resumed_bytes = 0 # 断点续传时已完成的字节数
+        self.retries = 0       # 分段重试次数
+        self.failovers = 0     # 切换镜像次数
+
+    def _session(self):
+        from curl_cffi import requests as cffi_requests
+        return cffi_requests.Session(impersonate=self.impersonate, headers=self.headers)
+
+    def _probe(self, session):
+        """请求首字节, 确认真实地址 (跟随重定向) / 文件大小 / 是否支持 Range"""
+        response = session.get(self.url, headers={"Range": "bytes=0-0"}, allow_redirects=True,
+                               stream=True, timeout=self.timeout)
+        try:
+            if response.status_code == 206:
+                content_range = response.headers.get("content-range", "")
+                total = content_range.rsplit("/", 1)[-1]
+                if total.isdigit():
+                    self.url = str(response.url) or self.url
+                    return int(total), True
+            if response.status_code in (200, 206):
+                return int(response.headers.get("content-length") or 0), False
+            raise RuntimeError(f"HTTP {response.status_code}")
+        finally:
+            response.close()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (state.get("total") == self.total and state.get("chunk_size") == self.chunk_size
+                and os.path.exists(self.part_path)):
+            self.done = set(state.get("done", []))
+
+    def _save_state(self):
+        # 调用方需持有 self._lock
+        tmp = self.state_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"url": self.url, "total": self.total, "chunk_size": self.chunk_size,
+                       "done": sorted(self.done)}, f)
+        os.replace(tmp, self.state_path)
+
+    def _failover(self, failed_url, reason):
+        """
+        当前镜像失败或过慢时切换到下一个镜像 (其他连接已切换过则不重复切换)
+        返回是否已有其他镜像可用 (只有一个镜像时返回 False)
+        """
+        with self._lock:
+            if failed_url != self.url:
+                return True
+            if len(self.mirrors) <= 1:
+                return False
+            self._mirror_index = (self._mirror_index + 1) % len(self.mirrors)
+            self.url = self.mirrors[self._mirror_index]
+            self.failovers += 1
+        self.log(f"状态: 镜像{reason}，切换到备用镜像 {self._mirror_index + 1}/{len(self.mirrors)}")
+        return True
+
+    def _chunk_range(self, index):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.total) - 1
+        return start, end
+
+    def _fetch_chunk(self, session, index, handle):
+        """
+        下载一个分段; 失败时从进度中扣除本次已计入的字节 (重试不会重复计数)
+        读取过程中持续测速: 镜像过慢且有备用镜像时中止本段, 由重试切换到新镜像
+        """
+        start, end = self._chunk_range(index)
+        url = self.url
+        started = time.time()
+        try:
+            response = session.get(url, headers={"Range": f"bytes={start}-{end}"},
+                                   stream=True, timeout=self.timeout)
+        except Exception:
+            self._failover(url, "连接失败")
+            raise
+        received = 0
+        try:
+            if response.status_code != 206:
+                self._failover(url, f"返回 {response.status_code}")
+                raise RuntimeError(f"HTTP {response.status_code}")
+            throttled = 0.0
+            for data in response.iter_content(chunk_size=256 * 1024):
+                if not data:
+                    continue
+                handle.seek(start + received)
+                handle.write(data)
+                received += len(data)
+                with self._lock:
+                    self._meter.add(len(data))
+                if self.throttle:
+                    throttled += self.throttle(len(data)) or 0
+                # 限速等待的时间不计入测速; 读满一段时间后再判断, 避免连接刚建立时误判
+                elapsed = time.time() - started - throttled
+                if elapsed >= SPEED_CHECK_AFTER and received / elapsed < self.min_speed:
+                    if self._failover(url, f"速度过低 ({format_bytes(received / elapsed)}/s)"):
+                        raise RuntimeError("镜像速度过低")
+            if received != end - start + 1:
+                self._failover(url, "数据不完整")
+                raise RuntimeError(f"分段数据不完整 ({received}/{end - start + 1})")
+        except BaseException:
+            # 未完成的分段不计入进度 (重试时重新下载整段)
+            with self._lock:
+                self._meter.add(-received)
+            raise
+        finally:
+            response.close()
+
+    def _worker_loop(self):
+        session = self._session()
+        try:
+            with open(self.part_path, 'r+b') as handle:
+                while True:
+                    with self._lock:
+                        if self._error or not self._pending:
+                            return
+                        index = self._pending.popleft()
+                    for attempt in range(self.max_retries):
+                        try:
+                            self._fetch_chunk(session, index, handle)
+                            break
+                        except DownloadCancelled as e:
+                            # 取消不重试: 其余连接在下一段开始前退出
+                            with self._lock:
+                                self._error = e
+                            return
+                        except Exception as e:
+                            if attempt == self.max_retries - 1:
+                                with self._lock:
+                                    self._error = e
+                                return
+                            with self._lock:
+                                self.retries += 1
+                            time.sleep(0.5 * (attempt + 1))
+                    with self._lock:
+                        self.done.add(index)
+                        self._save_state()
+        finally:
+            session.close()
+
+    def _start_worker(self):
+        t = threading.Thread(target=self._worker_loop, daemon=True)
+        t.start()
+        self._workers.append(t)
+
+    def _download_single(self, session):
+        """服务器不支持 Range: 单连接顺序下载"""
+        response = session.get(self.url, allow_redirects=True, stream=True, timeout=self.timeout)
+        try:
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            self._meter = ProgressMeter(self.total, self.progress_callback)
+            with open(self.part_path, 'wb') as handle:
+                for data in response.iter_content(chunk_size=256 * 1024):
+                    if data:
+                        handle.write(data)
+                        self._meter.add(len(data))
+                        if self.throttle:
+                            self.throttle(len(data))
+        finally:
+            response.close()
+
+    @property
+    def transferred(self):
+        """本次实际下载的字节数 (不含断点续传前已完成的部分)"""
+        return self._meter.downloaded - self.resumed_bytes if self._meter else 0
+
+    def download(self):
+        """执行下载, 成功返回输出路径, 失败抛出异常 (保留 .part 与状态文件以便续传)"""
+        session = self._session()
+        try:
+            # 首个镜像不可用时依次尝试备用镜像
+            for attempt in range(len(self.mirrors)):
+                try:
+                    self.total, ranged = self._probe(session)
+                    break
+                except Exception as e:
+                    if attempt == len(self.mirrors) - 1:
+                        raise
+                    self._failover(self.url, f"不可用 ({e})")
+            if not ranged or self.total <= 0:
+                self.log("状态: 服务器不支持分段下载，使用单连接")
+                self._download_single(session)
+                os.replace(self.part_path, self.output_path)
+                return self.output_path
+        finally:
+            session.close()
+
+        chunk_count = (self.total + self.chunk_size - 1) // self.chunk_size
+        self._load_state()
+        if self.done:
+            self.log(f"状态: 断点续传 (已完成 {len(self.done)}/{chunk_count} 段)")
+        else:
+            with open(self.part_path, 'wb') as handle:
+                handle.truncate(self.total)
+
+        self._pending = deque(i for i in range(chunk_count) if i not in self.done)
+        self._meter = ProgressMeter(self.total, self.progress_callback)
+        self._meter.downloaded = sum(
+            self._chunk_range(i)[1] - self._chunk_range(i)[0] + 1 for i in self.done
+        )
+        resumed_bytes = self.resumed_bytes = self._meter.initial = self._meter.downloaded
+
+        initial = min(self.min_connections, len(self._pending)) or 1
+        for _ in range(initial):
+            self._start_worker()
+        self._adapt_connections(resumed_bytes)
+
+        for t in self._workers:
+            t.join()
+        if isinstance(self._error, DownloadCancelled):
+            raise self._error
+        if self._error:
+            raise RuntimeError(f"分段下载失败: {self._error}")
+
+        os.replace(self.part_path, self.output_path)
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+        if self.progress_callback:
+            self._meter.report()
+        return self.output_path
+
+    def _adapt_connections(self, resumed_bytes, interval=1.0):
+        """
+        每个采样周期计算单连接吞吐:
+        新增连接后单连接吞吐仍不低于基准的 80% 说明带宽未饱和, 继续增加连接; 否则停止增加
+        """
+        baseline = None
+        last_bytes = resumed_bytes
+        growing = True
+        while any(t.is_alive() for t in self._workers):
+            time.sleep(interval)
+            with self._lock:
+                downloaded = self._meter.downloaded
+                pending = len(self._pending)
+                if self._error:
+                    return
+            active = sum(1 for t in self._workers if t.is_alive())
+            if not growing or not active or not pending:
+                last_bytes = downloaded
+                continue
+            per_connection = (downloaded - last_bytes) / interval / active
+            last_bytes = downloaded
+            if baseline is None or per_connection >= baseline * 0.8:
+                baseline = per_connection if baseline is None else max(baseline, per_connection)
+                if len(self._workers) < self.max_connections:
+                    self._start_worker()
+            else:
+                growing = False
+                self.log(f"状态: 分段下载连接数稳定在 {active}")
@@ -0,0 +1,104 @@
+"""
+异步提取核心 (VideoExtractor.extract_async) 使用的事件循环与线程池
+- 事件循环: 进程内只有一个, 运行在独立的后台线程中, 处理所有任务的网络请求 (短链展开、Douyin 页面、镜像测速)
+- blocking 线程池: yt-dlp 解析/下载、分段下载、下载索引读写 (线程大部分时间在等待网络, 上限较大)
+合并/转码等 ffmpeg 工作不在这里执行, 统一交给共享的转码池 (transcode.get_transcode_pool), 只有一份 CPU 预算
+同步接口通过 run_sync 把协程提交到后台事件循环并等待结果, 可以在任意线程调用
+"""
+import atexit
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BLOCKING_WORKERS = 16
+
+_lock = threading.Lock()
+_blocking_workers = DEFAULT_BLOCKING_WORKERS
+_executor = None
+_loop = None
+_loop_thread = None
+
+
+def configure_executors(blocking=None):
+    """设置 blocking 线程池大小 (之后调用会替换线程池, 已提交的工作在旧线程池中完成)"""
+    global _blocking_workers, _executor
+    with _lock:
+        if blocking:
+            _blocking_workers = max(1, int(blocking))
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+                _executor = None
+
+
+def ensure_blocking_workers(count):
+    """保证 blocking 线程池至少有 count 个线程 (调度器按并发任务数调用, 任务不会在线程池中排队)"""
+    with _lock:
+        enough = _blocking_workers >= count
+    if not enough:
+        configure_executors(blocking=count)
+
+
+def get_executor():
+    """进程内共享的 blocking 线程池"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_blocking_workers, thread_name_prefix="extract-blocking")
+        return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """在 blocking 线程池中执行阻塞函数并等待结果 (异常原样抛出)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def get_event_loop():
+    """进程内共享的后台事件循环 (首次调用时启动)"""
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="extract-loop", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def run_sync(coro):
+    """
+    在后台事件循环中运行协程并等待结果 (同步接口使用)
+    调用线程本身是否运行着事件循环都不影响; 但不能在后台事件循环的线程中调用 (会互相等待), 异步代码应直接 await
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("不能在后台事件循环中同步等待, 请直接 await")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+async def _shutdown_loop():
+    from http_pool import get_async_session_pool
+
+    await get_async_session_pool().close()
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@atexit.register
+def _close_loop():
+    """关闭后台事件循环中的 AsyncSession 与残留任务 (避免退出时的 "Task was destroyed" 警告)"""
+    with _lock:
+        loop, thread = _loop, _loop_thread
+    if loop is None or loop.is_closed() or not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_shutdown_loop(), loop).result(timeout=5)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    if not loop.is_running():
+        loop.close()
@@ -0,0 +1,132 @@
+import re
+import threading
+
+
+def parse_resolution(resolution):
+    """'1080' / '720P' / 'max' → 高度上限 (int), 'max' 或空值返回 None; 无法识别时抛出 ValueError"""
+    if not resolution or str(resolution).lower() == 'max':
+        return None
+    return int(str(resolution).lower().replace('p', ''))
+
+
+def parse_size(value):
+    """'500M' / '2G' / '800K' / 纯数字 (字节) → 字节数"""
+    if value is None:
+        return None
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"无法识别的大小: {value}")
+    number, unit = match.groups()
+    return int(float(number) * {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[unit.upper()])
+
+
+def _filters(height=None, max_bitrate=None, max_filesize=None):
+    """yt-dlp 格式过滤条件; 使用 <=? 使缺少该字段的格式不被排除"""
+    parts = []
+    if height:
+        parts.append(f"[height<=?{height}]")
+    if max_bitrate:
+        parts.append(f"[tbr<=?{max_bitrate}]")
+    if max_filesize:
+        parts.append(f"[filesize<=?{max_filesize}]")
+    return "".join(parts)
+
+
+def platform_of(url):
+    url = (url or "").lower()
+    if 'youtube.com' in url or 'youtu.be' in url:
+        return 'youtube'
+    if 'bilibili.com' in url or 'b23.tv' in url:
+        return 'bilibili'
+    if 'douyin.com' in url or 'snssdk.com' in url or 'douyinvod.com' in url:
+        return 'douyin'
+    return 'generic'
+
+
+def build_format_selector(resolution=None, platform='generic', max_bitrate=None, max_filesize=None, can_merge=True):
+    """
+    生成 yt-dlp 格式选择字符串
+    - 依次尝试: 满足限制的分离流 → 满足限制的预合并流 → 不加限制 (避免 "Requested format is not available")
+    - youtube: 与原有逻辑一致 (bestvideo[height<=N]+bestaudio/best[height<=N]/b)
+    - bilibili: DASH 分离流, 优先 H.264 (MP4 兼容, 后处理只需封装)
+    - douyin: 优先单文件直链 (预合并流), 其次分离流
+    - 无 FFmpeg 时不选择需要合并的分离流
+    max_bitrate: 总码率上限 (kbps); max_filesize: 文件大小上限 (字节)
+    未指定任何限制时返回 None (使用 yt-dlp 默认选择)
+    """
+    height = parse_resolution(resolution)
+    if platform == 'youtube' and not max_bitrate and not max_filesize:
+        if height:
+            return f'bestvideo[height<={height}]+bestaudio/best[height<={height}]/b'
+        return 'bestvideo+bestaudio/b'
+
+    limit = _filters(height, max_bitrate, max_filesize)
+    if not limit:
+        return None
+
+    def level(filters):
+        merged = f"bv*{filters}+ba"
+        single = f"b{filters}"
+        if not can_merge:
+            return [single]
+        if platform == 'douyin':
+            return [single, merged]
+        if platform == 'bilibili':
+            return [f"bv*{filters}[vcodec^=avc]+ba", merged, single]
+        return [merged, single]
+
+    choices = level(limit)
+    # 只限制分辨率的后备: 码率/大小限制无法满足时仍按分辨率选择
+    if height and (max_bitrate or max_filesize):
+        choices += [c for c in level(_filters(height)) if '[vcodec^=avc]' not in c]
+    choices += level("")[-2:] if can_merge else ["b"]
+    return "/".join(choices)
+
+
+def _size(fmt):
+    return fmt.get('filesize') or fmt.get('filesize_approx')
+
+
+def estimate_savings(info):
+    """
+    对比已选格式与最佳画质的预计大小, 返回 (最佳画质字节数, 已选字节数)
+    信息不足 (格式缺少大小) 时返回 None
+    """
+    formats = info.get('formats') or []
+    selected = info.get('requested_formats') or [info]
+    if any(not _size(f) for f in selected):
+        return None
+    chosen = sum(_size(f) for f in selected)
+
+    videos = [f for f in formats if f.get('vcodec') != 'none' and _size(f)]
+    if not videos:
+        return None
+    best_video = max(videos, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+    best = _size(best_video)
+    if best_video.get('acodec') == 'none':
+        audios = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') != 'none' and _size(f)]
+        if audios:
+            best += _size(max(audios, key=lambda f: f.get('abr') or f.get('tbr') or 0))
+    return best, chosen
+
+
+class SavingsStats:
+    """分辨率/码率限制累计节省的流量 (批量模式汇总使用)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.best_bytes = 0
+        self.chosen_bytes = 0
+
+    def record(self, best, chosen):
+        with self._lock:
+            self.jobs += 1
+            self.best_bytes += best
+            self.chosen_bytes += chosen
+
+    @property
+    def saved_bytes(self):
+        return max(0, self.best_bytes - self.chosen_bytes)
+
+
+savings = SavingsStats()
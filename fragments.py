@@ -0,0 +1,131 @@
+import os
+import json
+import threading
+
+from paths import cache_path
+
+CACHE_FILE = "fragments.json"
+DEFAULT_CONCURRENCY = 2   # 未知站点的初始分片并发数
+MAX_CONCURRENCY = 16
+MIN_IMPROVEMENT = 1.1     # 吞吐提升超过 10% 才认为增加并发有效
+REPROBE_AFTER = 10        # 稳定后每成功这么多次重新尝试增加并发 (网络条件可能已变化)
+# 说明并发过高的错误: 限流 (429/403) 与超时/连接被断开; 404、地区限制、解析失败等与分片并发无关
+BACKOFF_MARKERS = ('HTTP Error 429', 'HTTP Error 403', 'Too Many Requests', 'byted_acrawler',
+                   'timed out', 'Timeout', 'timeout', 'Connection reset', 'Connection aborted')
+
+
+def is_backoff_error(text):
+    """错误信息是否应让分片并发退避"""
+    return bool(text) and any(marker in text for marker in BACKOFF_MARKERS)
+
+
+class _HostState:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, best=None, throughput=0.0, settled=False,
+                 ceiling=MAX_CONCURRENCY, successes=0):
+        self.concurrency = concurrency  # 下次使用的并发数
+        self.best = best                # 目前吞吐最高的并发数
+        self.throughput = throughput    # best 对应的吞吐 (字节/秒)
+        self.settled = settled          # 已找到最佳值, 不再继续增加
+        self.ceiling = ceiling          # 出错后的上限 (不再尝试超过该值)
+        self.successes = successes      # 稳定后的成功次数
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        for key, value in data.items():
+            if hasattr(state, key):
+                setattr(state, key, value)
+        return state
+
+
+def _next_step(concurrency):
+    return min(MAX_CONCURRENCY, max(concurrency + 1, (concurrency * 3 + 1) // 2))
+
+
+class FragmentTuner:
+    """
+    按站点自动调整 HLS/DASH 分片并发数 (yt-dlp 的 concurrent_fragment_downloads)
+    - 吞吐随并发增加而明显提升时继续增加 (1.5 倍步进), 不再提升时回到吞吐最高的值并保持
+    - 下载出错 (分片失败、限流) 时并发减半, 并把出错时的并发数以下作为上限
+    - 调整结果按站点保存到缓存目录, 下次运行直接使用
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._hosts = {host: _HostState.from_dict(state) for host, state in data.items()}
+        except (OSError, ValueError, AttributeError):
+            self._hosts = {}
+
+    def _save(self):
+        # 调用方需持有 self._lock
+        if not self.path:
+            return
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({host: state.to_dict() for host, state in self._hosts.items()}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def concurrency(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            return state.concurrency if state else DEFAULT_CONCURRENCY
+
+    def record(self, host, concurrency, throughput, failed=False):
+        """
+        记录一次分片下载的结果 (使用的并发数与实际吞吐), 返回该站点下次使用的并发数
+        """
+        with self._lock:
+            state = self._hosts.setdefault(host, _HostState())
+            if failed:
+                state.ceiling = max(1, concurrency - 1)
+                state.concurrency = max(1, concurrency // 2)
+                state.best, state.throughput = state.concurrency, 0.0
+                state.settled = False
+            elif state.best is None or concurrency == state.best or throughput >= state.throughput * MIN_IMPROVEMENT:
+                # 首次测量、按最佳值运行或增加并发后吞吐明显提升: 记录为最佳值
+                state.best, state.throughput = concurrency, throughput
+                if state.settled:
+                    state.successes += 1
+                    if state.successes >= REPROBE_AFTER:
+                        state.settled, state.successes = False, 0
+                if not state.settled:
+                    state.concurrency = min(state.ceiling, _next_step(concurrency))
+                    state.settled = state.concurrency <= concurrency
+            else:
+                # 增加并发没有带来明显提升: 回到最佳值并保持
+                state.concurrency = state.best
+                state.settled, state.successes = True, 0
+            self._save()
+            return state.concurrency
+
+    def stats(self):
+        with self._lock:
+            return {host: state.to_dict() for host, state in self._hosts.items()}
+
+
+_tuner_lock = threading.Lock()
+_shared_tuner = None
+
+
+def get_fragment_tuner():
+    """进程内共享的分片并发调整器, 调整结果保存在缓存目录"""
+    global _shared_tuner
+    with _tuner_lock:
+        if _shared_tuner is None:
+            _shared_tuner = FragmentTuner(cache_path(CACHE_FILE))
+        return _shared_tuner
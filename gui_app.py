@@ -1,22 +1,37 @@
 import flet as ft
 import os
-import threading
 import warnings
 # 忽略 Flet 的 DeprecationWarning (如 app() -> run())
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 from video_extractor import VideoExtractor
+from scheduler import DownloadScheduler, QUEUED, PAUSED, RUNNING, TRANSCODE_QUEUED, TRANSCODING, DONE, FAILED
+from transcode import configure_transcode_pool
+from bandwidth import configure_bandwidth
+from journal import get_journal, MODE_GUI
+from resolve_cache import configure_resolve_cache
+from paths import cache_path
+from progress import get_progress_bus
 
 class DownloadTask(ft.Container):
-    def __init__(self, url, extractor, on_task_complete):
+    def __init__(self, url, scheduler, on_task_complete):
         super().__init__()
         self.url = url
-        self.extractor = extractor
+        self.scheduler = scheduler
         self.on_task_complete = on_task_complete
+        self.job = None
         self.progress_bar = ft.ProgressBar(value=0, color="#00D2FF", bgcolor="#333333", height=8)
         self.status_text = ft.Text("准备中...", size=12, color="#E0E0E0")
         self.speed_text = ft.Text("", size=11, color="#AAAAAA")
-        self.title_text = ft.Text(url, size=14, weight="bold", overflow=ft.TextOverflow.ELLIPSIS)
+        self.bandwidth_text = ft.Text("", size=11, color="#666666") # 带宽分配与实际速率
+        self.title_text = ft.Text(url, size=14, weight="bold", overflow=ft.TextOverflow.ELLIPSIS, expand=True)
+        self.state_text = ft.Text("排队中", size=11, color="#00D2FF")
+
+        # 队列操作按钮: 暂停/恢复 (仅排队中的任务), 优先下载
+        self.pause_btn = ft.IconButton(ft.Icons.PAUSE_ROUNDED, icon_size=18, icon_color="#888888", tooltip="暂停")
+        self.pause_btn.on_click = self.toggle_pause
+        self.top_btn = ft.IconButton(ft.Icons.VERTICAL_ALIGN_TOP_ROUNDED, icon_size=18, icon_color="#888888", tooltip="优先下载")
+        self.top_btn.on_click = self.prioritize
 
         # Container 配置
         self.padding = 15
@@ -25,33 +40,111 @@ class DownloadTask(ft.Container):
         self.border = ft.Border.all(1, "#333333")
         self.margin = ft.Margin.only(bottom=10)
         self.content = ft.Column([
-            self.title_text,
+            ft.Row([self.title_text, self.state_text, self.top_btn, self.pause_btn], spacing=5),
             self.status_text,
             self.progress_bar,
             self.speed_text,
+            self.bandwidth_text,
         ], spacing=5)
 
-    def update_progress(self, percent, speed, eta):
-        self.progress_bar.value = percent
-        self.speed_text.value = f"速度: {speed} | 剩余: {eta}"
-        self.update()
+    def progress_id(self):
+        """卡片对应的进度事件标识 (重复任务使用其挂靠任务的进度)"""
+        if not self.job:
+            return None
+        return (self.job.leader or self.job).journal_id
+
+    def update_progress(self, event):
+        """只修改控件属性, 由进度总线的批量回调统一刷新页面"""
+        self.progress_bar.value = event.percent # 总大小未知时为 None (不确定进度条)
+        self.speed_text.value = f"速度: {event.speed_text} | 剩余: {event.eta_text}"
+        share = self.bandwidth_share()
+        if share is not None:
+            self.bandwidth_text.value = f"带宽: {share.describe()}"
+
+    def bandwidth_share(self):
+        if not self.job:
+            return None
+        return (self.job.leader or self.job).bandwidth
 
     def update_status(self, message):
         self.status_text.value = message
         self.update()
 
-    def run_download(self, convert_to_mp4=True, resolution='1080', cookies_file=None):
-        self.extractor.progress_callback = self.update_progress
-        self.extractor.status_callback = self.update_status
-        success = self.extractor.extract(self.url, convert_to_mp4=convert_to_mp4, resolution=resolution, cookies_file=cookies_file)
-        if success:
+    def start(self, convert_to_mp4=True, resolution='1080', cookies_file=None):
+        """提交到下载队列, 由调度器的工作线程执行"""
+        self.job = self.scheduler.submit(
+            self.url,
+            convert_to_mp4=convert_to_mp4,
+            resolution=resolution,
+            cookies_file=cookies_file,
+            on_status=self.update_status,
+            on_state=self.on_state_change,
+        )
+
+    def resume(self, entry):
+        """恢复上次退出时未完成的任务 (任务日志)"""
+        self.job = self.scheduler.restore(
+            entry,
+            on_status=self.update_status,
+            on_state=self.on_state_change,
+        )
+        self.status_text.value = f"已恢复 (上次进行到: {entry.stage_label})"
+        self.update()
+
+    def toggle_pause(self, e):
+        if not self.job:
+            return
+        if self.job.state == PAUSED:
+            self.scheduler.resume_job(self.job)
+        else:
+            self.scheduler.pause_job(self.job)
+
+    def prioritize(self, e):
+        if not self.job:
+            return
+        # 比当前所有任务的优先级更高 (数值更小)
+        top = min([j.priority for j in self.scheduler.jobs] + [0])
+        self.scheduler.set_priority(self.job, top - 1)
+        self.state_text.value = "排队中 (优先)"
+        self.update()
+
+    def on_state_change(self, job):
+        self.state_text.value = job.state_label
+        if job.leader is not None and job.state not in (DONE, FAILED):
+            # 同一视频已在队列中: 本卡片共享该任务的进度
+            self.state_text.value += f" (同任务 #{job.leader.index})"
+        waiting = job.state in (QUEUED, PAUSED)
+        self.pause_btn.visible = waiting
+        self.top_btn.visible = job.state == QUEUED
+        if job.state == PAUSED:
+            self.pause_btn.icon = ft.Icons.PLAY_ARROW_ROUNDED
+            self.pause_btn.tooltip = "继续"
+            self.status_text.value = "已暂停"
+        elif job.state == QUEUED:
+            self.pause_btn.icon = ft.Icons.PAUSE_ROUNDED
+            self.pause_btn.tooltip = "暂停"
+            self.status_text.value = "等待空闲下载槽位..."
+        elif job.state == RUNNING:
+            self.status_text.value = "准备中..."
+        elif job.state == TRANSCODE_QUEUED:
+            self.status_text.value = "下载完成，等待转码..."
+
+        if job.state in (DONE, FAILED):
+            self.on_finished(job)
+        else:
+            self.on_task_complete()
+            self.update()
+
+    def on_finished(self, job):
+        self.bandwidth_text.value = ""
+        if job.success:
             self.status_text.value = "任务已完成"
             self.status_text.color = ft.Colors.GREEN_400
             self.progress_bar.value = 1.0
             self.speed_text.value = "下载并处理完成 100%"
         else:
             # 优先显示具体错误信息
-            error_msg = getattr(self.extractor, 'last_error', None)
+            error_msg = job.error
             if error_msg:
                 self.status_text.value = f"失败: {error_msg}"
             else:
@@ -75,11 +168,31 @@ def main(page: ft.Page):
         # 改为使用用户下载文件夹
         "path": os.path.join(os.path.expanduser("~"), "Downloads", "VideoDownloads"),
         "resolution": "1080",
-        "convert": True
+        "convert": True,
+        "workers": 3, # 同时下载的任务数
+        "stream": False, # 边下载边转码 (单流资源)
+        "bandwidth": "0", # 总带宽上限 (MB/s), 0 为不限
     }
 
     if not os.path.exists(config["path"]):
         os.makedirs(config["path"])
+
+    # 任务日志 (界面专用): 每次阶段变化写入磁盘, 应用退出/崩溃后重新打开时可恢复未完成的任务
+    # 解析结果同样保存到磁盘, 恢复的任务无需重新解析
+    journal = get_journal(MODE_GUI)
+    configure_resolve_cache(db_path=cache_path("resolve_cache.sqlite3"))
+
+    # 全局下载队列: 固定数量的工作线程, 多余的任务排队等待
+    # 合并/转码交给独立的转码池, 下载线程不必等待 ffmpeg
+    scheduler = DownloadScheduler(
+        workers=config["workers"],
+        per_host=2,
+        extractor_factory=lambda: VideoExtractor(download_dir=config["path"], stream_transcode=config["stream"]),
+        log=lambda msg: None,
+        transcode_pool=configure_transcode_pool(),
+        journal=journal,
+    )
+    scheduler.start()
     
     # UI 组件
     url_input = ft.TextField(
@@ -93,6 +206,65 @@ def main(page: ft.Page):
     )
 
     task_list = ft.Column(scroll=ft.ScrollMode.AUTO, expand=True, spacing=15)
+    queue_text = ft.Text("", size=12, color="#666666")
+
+    def refresh_queue_info():
+        counts = scheduler.counts()
+        depths = scheduler.stage_depths()
+        queue_text.value = (f"下载 {counts[RUNNING]} · 转码 {counts[TRANSCODING] + counts[TRANSCODE_QUEUED]}"
+                            f" (ffmpeg {depths['ffmpeg_running']}/{depths['ffmpeg_slots']})"
+                            f" · 排队 {counts[QUEUED]} · 暂停 {counts[PAUSED]}")
+        if scheduler.paused:
+            queue_text.value += " (队列已暂停)"
+        page.update()
+
+    def toggle_queue(e):
+        if scheduler.paused:
+            scheduler.resume()
+            queue_btn.icon = ft.Icons.PAUSE_CIRCLE_OUTLINE_ROUNDED
+            queue_btn.tooltip = "暂停队列"
+        else:
+            scheduler.pause()
+            queue_btn.icon = ft.Icons.PLAY_CIRCLE_OUTLINE_ROUNDED
+            queue_btn.tooltip = "继续队列"
+        refresh_queue_info()
+
+    queue_btn = ft.IconButton(ft.Icons.PAUSE_CIRCLE_OUTLINE_ROUNDED, icon_size=20, icon_color="#666666", tooltip="暂停队列")
+    queue_btn.on_click = toggle_queue
+
+    # 上次未完成的任务: 启动时 (提交任何新任务之前) 读取一次, 由用户点击后恢复 (不在启动时自动开始下载)
+    # 点击时不再重新读取日志, 否则本次会话中提交、仍在进行的任务会被再次提交
+    unfinished = journal.compact()
+
+    def resume_unfinished(e):
+        resume_btn.visible = False
+        entries = list(unfinished)
+        unfinished.clear()
+        for entry in entries:
+            if scheduler.find(entry.job_id) is not None:
+                continue
+            task_ui = DownloadTask(entry.url, scheduler, refresh_queue_info)
+            task_list.controls.insert(0, task_ui)
+            page.update()
+            task_ui.resume(entry)
+        page.update()
+
+    resume_btn = ft.TextButton(f"恢复 {len(unfinished)} 个未完成任务", icon=ft.Icons.RESTORE_ROUNDED,
+                               visible=bool(unfinished), on_click=resume_unfinished)
+
+    def on_progress_batch(events):
+        """进度总线每 100ms 推送一次各任务的最新进度, 所有卡片合并为一次页面刷新"""
+        latest = {event.task_id: event for event in events}
+        changed = False
+        for task_ui in list(task_list.controls):
+            event = latest.get(task_ui.progress_id())
+            if event is not None and task_ui.job.state not in (DONE, FAILED):
+                task_ui.update_progress(event)
+                changed = True
+        if changed:
+            page.update()
+
+    get_progress_bus().subscribe_coalesced(on_progress_batch)
 
     def add_task(url=None):
         target_url = url if url else url_input.value.strip()
@@ -104,37 +276,26 @@ def main(page: ft.Page):
             
         if not url: url_input.value = ""
         
-        extractor = VideoExtractor(
-            download_dir=config["path"]
-        )
-        
-        task_ui = DownloadTask(target_url, extractor, lambda: page.update())
+        task_ui = DownloadTask(target_url, scheduler, refresh_queue_info)
         task_list.controls.insert(0, task_ui)
         page.update()
         
+        # 自动检测 cookies.txt (在当前目录或 dist 目录下)
+        cookies_path = "cookies.txt"
+        if not os.path.exists(cookies_path):
+             # 尝试在打包后的应用资源目录查找 (可选)
+             cookies_path = None
         
-        def thread_wrapper():
-            try:
-                # 自动检测 cookies.txt (在当前目录或 dist 目录下)
-                cookies_path = "cookies.txt"
-                if not os.path.exists(cookies_path):
-                     # 尝试在打包后的应用资源目录查找 (可选)
-                     cookies_path = None
-                
-                if cookies_path:
-                    task_ui.status_text.value = "准备中... (已加载 cookies.txt)"
-                    
-                task_ui.run_download(
-                    convert_to_mp4=config["convert"], 
-                    resolution=config["resolution"],
-                    cookies_file=cookies_path
-                )
-            except Exception as ex:
-                task_ui.status_text.value = f"错误: {str(ex)}"
-                task_ui.status_text.color = ft.Colors.RED_400
-                task_ui.update()
-
-        threading.Thread(target=thread_wrapper, daemon=True).start()
+        try:
+            task_ui.start(
+                convert_to_mp4=config["convert"], 
+                resolution=config["resolution"],
+                cookies_file=cookies_path
+            )
+        except Exception as ex:
+            task_ui.status_text.value = f"错误: {str(ex)}"
+            task_ui.status_text.color = ft.Colors.RED_400
+            task_ui.update()
 
     # 设置面板
     async def toggle_settings(e):
@@ -165,6 +326,39 @@ def main(page: ft.Page):
     # 绑定事件
     mp4_switch.on_change = lambda e: config.update({"convert": mp4_switch.value})
 
+    stream_switch = ft.Switch(
+        label="边下载边转码 (不保存中间文件)",
+        value=False,
+        active_color="#00D2FF",
+    )
+    stream_switch.on_change = lambda e: config.update({"stream": stream_switch.value})
+
+    # 3. 同时下载任务数
+    workers_dd = ft.Dropdown(
+        value=str(config["workers"]),
+        options=[ft.dropdown.Option(str(n), f"{n} 个") for n in (1, 2, 3, 4, 6, 8)],
+    )
+
+    def on_workers_change(e):
+        config["workers"] = int(workers_dd.value)
+        scheduler.set_workers(config["workers"])
+        refresh_queue_info()
+
+    workers_dd.on_change = on_workers_change
+
+    # 4. 总带宽上限: 所有下载任务共享, 按优先级加权分配
+    bandwidth_dd = ft.Dropdown(
+        value=config["bandwidth"],
+        options=[ft.dropdown.Option("0", "不限")]
+                + [ft.dropdown.Option(str(n), f"{n} MB/s") for n in (1, 2, 5, 10, 20, 50)],
+    )
+
+    def on_bandwidth_change(e):
+        config["bandwidth"] = bandwidth_dd.value
+        configure_bandwidth(int(bandwidth_dd.value) * 1024 * 1024)
+
+    bandwidth_dd.on_change = on_bandwidth_change
+
     page.drawer = ft.NavigationDrawer(
         bgcolor="#1A1A1A",
         controls=[
@@ -178,6 +372,13 @@ def main(page: ft.Page):
                     ft.Divider(height=10, color="transparent"),
                     ft.Text("格式转换", size=14),
                     mp4_switch,
+                    stream_switch,
+                    ft.Divider(height=10, color="transparent"),
+                    ft.Text("同时下载任务数", size=14),
+                    workers_dd,
+                    ft.Divider(height=10, color="transparent"),
+                    ft.Text("总带宽上限", size=14),
+                    bandwidth_dd,
                 ], spacing=10),
                 padding=20
             )
@@ -223,6 +424,10 @@ def main(page: ft.Page):
                 ft.Row([
                     ft.Icon(ft.Icons.LIST_ALT_ROUNDED, size=18, color="#666666"),
                     ft.Text(" 任务列表", size=16, weight="bold", color="#888888"),
+                    ft.Container(expand=True),
+                    queue_text,
+                    resume_btn,
+                    queue_btn,
                 ]),
                 task_list
             ]),
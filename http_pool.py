@@ -0,0 +1,213 @@
+import time
+import queue
+import asyncio
+import threading
+from contextlib import contextmanager
+
+from curl_cffi import requests as cffi_requests
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IMPERSONATE = "chrome120"
+
+
+def _http2_options():
+    """优先协商 HTTP/2 (旧版 curl_cffi 不支持该参数时使用默认值)"""
+    try:
+        from curl_cffi import CurlHttpVersion
+        return {"http_version": CurlHttpVersion.V2TLS}
+    except ImportError:
+        return {}
+
+
+class PoolStats:
+    """连接池统计: 请求数、新建/复用会话数、请求耗时"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.sessions_created = 0
+        self.sessions_reused = 0
+        self.total_latency = 0.0
+
+    def record(self, latency):
+        with self._lock:
+            self.requests += 1
+            self.total_latency += latency
+
+    @property
+    def avg_latency_ms(self):
+        return self.total_latency / self.requests * 1000 if self.requests else 0.0
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "sessions_created": self.sessions_created,
+            "sessions_reused": self.sessions_reused,
+            "avg_latency_ms": round(self.avg_latency_ms, 1),
+        }
+
+
+class SessionPool:
+    """
+    可复用的 curl_cffi Session 池 (线程安全)
+    每个 Session 保持长连接, 连续请求同一站点时复用已建立的 TCP+TLS 连接
+    最多同时借出 size 个 Session, 空闲 Session 按后进先出复用 (最近使用的连接最可能仍然存活)
+    """
+    def __init__(self, size=DEFAULT_POOL_SIZE, impersonate=DEFAULT_IMPERSONATE, headers=None):
+        self.size = max(1, int(size))
+        self.impersonate = impersonate
+        self.headers = dict(headers or {})
+        self.stats = PoolStats()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        session = cffi_requests.Session(impersonate=self.impersonate, headers=self.headers, **_http2_options())
+        with self._lock:
+            self._all.append(session)
+            self.stats.sessions_created += 1
+        return session
+
+    @contextmanager
+    def session(self):
+        self._slots.acquire()
+        try:
+            try:
+                session = self._idle.get_nowait()
+                with self._lock:
+                    self.stats.sessions_reused += 1
+            except queue.Empty:
+                session = self._new_session()
+            try:
+                yield session
+            finally:
+                self._idle.put(session)
+        finally:
+            self._slots.release()
+
+    def request(self, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            with self.session() as session:
+                return session.request(method, url, **kwargs)
+        finally:
+            self.stats.record(time.perf_counter() - started)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            sessions, self._all = self._all, []
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+        self._idle = queue.LifoQueue()
+
+
+class AsyncSessionPool:
+    """
+    异步版本: 每个事件循环共享一个 AsyncSession, 由其内部维护最多 size 个并发连接
+    """
+    def __init__(self, size=DEFAULT_POOL_SIZE, impersonate=DEFAULT_IMPERSONATE, headers=None):
+        self.size = max(1, int(size))
+        self.impersonate = impersonate
+        self.headers = dict(headers or {})
+        self.stats = PoolStats()
+        self._sessions = {} # 事件循环 -> AsyncSession
+        self._lock = threading.Lock()
+
+    def _session(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is None:
+                session = cffi_requests.AsyncSession(
+                    impersonate=self.impersonate,
+                    headers=self.headers,
+                    max_clients=self.size,
+                    **_http2_options(),
+                )
+                self._sessions[loop] = session
+                self.stats.sessions_created += 1
+            else:
+                self.stats.sessions_reused += 1
+        return session
+
+    async def request(self, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await self._session().request(method, url, **kwargs)
+        finally:
+            self.stats.record(time.perf_counter() - started)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+    def close_all(self):
+        """
+        关闭所有事件循环中的 AsyncSession (可在任意线程调用)
+        运行中的事件循环: 把关闭操作交给该循环执行; 空闲的事件循环: 直接在其中完成关闭
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, session in sessions.items():
+            if loop.is_closed():
+                continue
+            try:
+                if loop is current:
+                    loop.create_task(session.close())
+                elif loop.is_running():
+                    asyncio.run_coroutine_threadsafe(session.close(), loop)
+                else:
+                    loop.run_until_complete(session.close())
+            except Exception:
+                pass
+
+
+_pool_lock = threading.Lock()
+_shared_pool = None
+_shared_async_pool = None
+
+
+def configure_pool_size(size):
+    """设置共享连接池大小 (需在首次使用前调用, 之后调用会重建连接池)"""
+    global _shared_pool, _shared_async_pool
+    with _pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+        if _shared_async_pool is not None:
+            _shared_async_pool.close_all()
+        _shared_pool = SessionPool(size)
+        _shared_async_pool = AsyncSessionPool(size)
+
+
+def get_session_pool():
+    """进程内共享的 Session 池 (解析器等短请求使用)"""
+    global _shared_pool
+    with _pool_lock:
+        if _shared_pool is None:
+            _shared_pool = SessionPool()
+        return _shared_pool
+
+
+def get_async_session_pool():
+    global _shared_async_pool
+    with _pool_lock:
+        if _shared_async_pool is None:
+            _shared_async_pool = AsyncSessionPool()
+        return _shared_async_pool
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+from paths import cache_path
+
+# 各运行方式使用独立的任务日志: 一种方式中提交的任务不会在另一种方式启动时被恢复
+MODE_CLI = "cli"
+MODE_GUI = "gui"
+MODE_DAEMON = "daemon"
+JOURNAL_FILES = {
+    MODE_CLI: "jobs.jsonl",
+    MODE_GUI: "jobs-gui.jsonl",
+    MODE_DAEMON: "jobs-daemon.jsonl",
+}
+
+# 任务阶段 (按先后顺序)
+STAGE_QUEUED = "queued"
+STAGE_RESOLVE = "resolve"
+STAGE_DOWNLOAD = "download"
+STAGE_MERGE = "merge"
+STAGE_TRANSCODE = "transcode"
+
+STAGE_LABELS = {
+    STAGE_QUEUED: "排队",
+    STAGE_RESOLVE: "解析",
+    STAGE_DOWNLOAD: "下载",
+    STAGE_MERGE: "合并",
+    STAGE_TRANSCODE: "转码",
+}
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def _file_lock(path):
+    """跨进程的独占锁 (锁文件 <日志>.lock): 同一日志被多个进程同时追加/压缩时不会丢失记录"""
+    with open(path + ".lock", 'a+b') as handle:
+        if os.name == 'nt':
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+class JournalEntry:
+    """日志中一个未完成任务的最新状态"""
+    def __init__(self, job_id, url, options=None, stage=STAGE_QUEUED, task=None, updated_at=None):
+        self.job_id = job_id
+        self.url = url
+        self.options = options or {}
+        self.stage = stage
+        self.task = task          # 合并/转码阶段的 PostProcessTask 字典, 恢复时跳过下载直接处理
+        self.updated_at = updated_at
+
+    @property
+    def stage_label(self):
+        return STAGE_LABELS.get(self.stage, self.stage)
+
+
+class JobJournal:
+    """
+    只追加的任务日志 (JSON Lines), 每次状态变化写入一行并刷入磁盘
+    - 进程崩溃/退出后, 根据每个任务最后一行记录判断已完成到哪个阶段
+    - 截断的最后一行 (写入中途断电) 在读取时忽略
+    - 启动时压缩: 只保留未完成任务的最新状态, 避免文件无限增长
+    - 追加与压缩都持有跨进程文件锁, 两个进程使用同一日志时压缩不会覆盖另一进程的追加
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, _file_lock(self.path):
+            yield
+
+    def _append(self, record):
+        record["t"] = round(time.time(), 3)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            with self._locked():
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError:
+            pass
+
+    def submitted(self, job_id, url, options):
+        self._append({"id": job_id, "event": "submit", "url": url, "options": options})
+
+    def stage(self, job_id, stage, task=None):
+        record = {"id": job_id, "event": "stage", "stage": stage}
+        if task is not None:
+            record["task"] = task
+        self._append(record)
+
+    def finished(self, job_id, success, output_path=None, error=None):
+        self._append({"id": job_id, "event": "done" if success else "failed",
+                      "output": output_path, "error": error})
+
+    def _read(self):
+        records = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return records
+
+    def unfinished(self):
+        """返回未完成的任务 (按提交顺序), 失败的任务不自动恢复"""
+        try:
+            with self._locked():
+                records = self._read()
+        except OSError:
+            records = []
+        return self._entries(records)
+
+    @staticmethod
+    def _entries(records):
+        entries = {}
+        for record in records:
+            job_id = record.get("id")
+            event = record.get("event")
+            if event == "submit":
+                entries[job_id] = JournalEntry(job_id, record.get("url"), record.get("options"),
+                                               updated_at=record.get("t"))
+            elif job_id in entries and event == "stage":
+                entry = entries[job_id]
+                entry.stage = record.get("stage", entry.stage)
+                entry.task = record.get("task")
+                entry.updated_at = record.get("t")
+            elif event in ("done", "failed"):
+                entries.pop(job_id, None)
+        return list(entries.values())
+
+    def compact(self):
+        """
+        重写日志, 只保留未完成任务; 返回这些任务
+        读取与替换在同一把文件锁内完成, 期间其他进程的追加会等待, 不会被覆盖
+        """
+        entries = []
+        try:
+            with self._locked():
+                entries = self._entries(self._read())
+                self._rewrite(entries)
+        except OSError:
+            pass
+        return entries
+
+    def _rewrite(self, entries):
+        # 调用方需持有 self._locked()
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                lines = [{"id": entry.job_id, "event": "submit", "url": entry.url, "options": entry.options,
+                          "t": entry.updated_at}]
+                if entry.stage != STAGE_QUEUED:
+                    stage = {"id": entry.job_id, "event": "stage", "stage": entry.stage, "t": entry.updated_at}
+                    if entry.task is not None:
+                        stage["task"] = entry.task
+                    lines.append(stage)
+                for record in lines:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+_journal_lock = threading.Lock()
+_shared_journals = {}
+
+
+def get_journal(mode=MODE_CLI):
+    """进程内共享的任务日志 (按运行方式区分, 见 JOURNAL_FILES), 保存在缓存目录"""
+    with _journal_lock:
+        journal = _shared_journals.get(mode)
+        if journal is None:
+            journal = JobJournal(cache_path(JOURNAL_FILES[mode]))
+            _shared_journals[mode] = journal
+        return journal
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# 任务阶段 (span 名称)
+SPAN_EXPAND = "expand"             # 短链接展开
+SPAN_DOUYIN_PAGE = "douyin_page"   # Douyin 分享页请求
+SPAN_MIRROR_PROBE = "mirror_probe" # CDN 镜像测速
+SPAN_RATE_WAIT = "rate_wait"       # 站点限流等待
+SPAN_METADATA = "metadata"         # yt-dlp 解析
+SPAN_DOWNLOAD = "download"
+SPAN_STREAM = "stream"             # 流式转码 (下载与转码同时进行)
+SPAN_QUEUE = "queue"               # 等待转码池
+SPAN_MERGE = "merge"               # 手动合并分轨
+SPAN_TRANSCODE = "transcode"       # 转为 MP4
+SPAN_PUBLISH = "publish"           # 移入下载目录并写入下载索引
+
+SPAN_LABELS = {
+    SPAN_EXPAND: "短链展开",
+    SPAN_DOUYIN_PAGE: "Douyin 页面",
+    SPAN_MIRROR_PROBE: "镜像测速",
+    SPAN_RATE_WAIT: "限流等待",
+    SPAN_METADATA: "解析",
+    SPAN_DOWNLOAD: "下载",
+    SPAN_STREAM: "流式转码",
+    SPAN_QUEUE: "等待转码",
+    SPAN_MERGE: "合并",
+    SPAN_TRANSCODE: "转码",
+    SPAN_PUBLISH: "归档",
+}
+
+# 计数器; 带分类的计数器在 Prometheus 输出中作为标签
+COUNTER_BYTES = "bytes"                # 本次下载的字节数
+COUNTER_RETRIES = "retries"            # 分类: fragment / segment / mirror / resolve
+COUNTER_CACHE_HITS = "cache_hits"      # 分类: resolve / archive / existing
+COUNTER_CACHE_MISSES = "cache_misses"  # 分类: resolve
+
+COUNTER_LABELS = {
+    COUNTER_RETRIES: "kind",
+    COUNTER_CACHE_HITS: "cache",
+    COUNTER_CACHE_MISSES: "cache",
+}
+
+# 阶段耗时直方图的分桶 (秒)
+DURATION_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+
+METRIC_PREFIX = "videodl"
+
+
+class JobTrace:
+    """
+    单个任务的耗时记录: 各阶段的 span 与计数器
+    span 在任务内按发生顺序记录, 同名阶段可出现多次 (例如缓存失效后重新解析)
+    """
+    def __init__(self, job_id, url):
+        self.job_id = job_id
+        self.url = url
+        self.started_at = time.time()
+        self.duration = None
+        self.success = None
+        self.spans = []    # [(name, 相对任务开始的秒数, 耗时, 是否正常结束)]
+        self.counters = {} # name -> 数值, 或 name -> {分类: 数值}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """记录 with 块的耗时; 块内抛出异常时标记为 error 并继续抛出"""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._add(name, start, time.perf_counter() - start, ok)
+
+    def add_span(self, name, duration):
+        """记录在其他地方测得的耗时 (以当前时刻为结束)"""
+        if duration > 0:
+            self._add(name, time.perf_counter() - duration, duration, True)
+
+    def _add(self, name, start, duration, ok):
+        with self._lock:
+            self.spans.append((name, start - self._start, duration, ok))
+
+    def count(self, name, value=1, kind=None):
+        if not value:
+            return
+        with self._lock:
+            if kind is None:
+                self.counters[name] = self.counters.get(name, 0) + value
+            else:
+                kinds = self.counters.setdefault(name, {})
+                kinds[kind] = kinds.get(kind, 0) + value
+
+    def finish(self, success):
+        with self._lock:
+            if self.duration is None:
+                self.duration = time.perf_counter() - self._start
+                self.success = bool(success)
+
+    def phase_totals(self):
+        """各阶段累计耗时, 按首次出现的顺序"""
+        totals = {}
+        with self._lock:
+            for name, _, duration, _ in self.spans:
+                totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def records(self):
+        """导出为 JSON Lines 记录: 每个 span 一行, 最后一行为任务汇总"""
+        with self._lock:
+            spans = list(self.spans)
+            counters = json.loads(json.dumps(self.counters))
+        lines = [
+            {"job": self.job_id, "type": "span", "name": name, "start": round(start, 4),
+             "duration": round(duration, 4), "status": "ok" if ok else "error"}
+            for name, start, duration, ok in spans
+        ]
+        lines.append({
+            "job": self.job_id, "type": "job", "url": self.url, "started_at": round(self.started_at, 3),
+            "duration": round(self.duration or 0.0, 4), "success": self.success,
+            "phases": {name: round(total, 4) for name, total in self.phase_totals().items()},
+            "counters": counters,
+        })
+        return lines
+
+    def format_profile(self):
+        """单行耗时分析: 各阶段耗时与占比, 以及计数器"""
+        total = self.duration or (time.perf_counter() - self._start)
+        totals = self.phase_totals()
+        other = total - sum(totals.values())
+        if other > 0.005:
+            totals["other"] = other
+        parts = []
+        for name, seconds in totals.items():
+            if seconds < 0.005:
+                continue
+            label = SPAN_LABELS.get(name, "其他" if name == "other" else name)
+            parts.append(f"{label} {seconds:.2f}s ({seconds / total:.0%})" if total > 0 else f"{label} {seconds:.2f}s")
+        line = f"耗时分析: 共 {total:.2f}s"
+        if parts:
+            line += " | " + " · ".join(parts)
+        counters = format_counters(self.counters)
+        if counters:
+            line += " | " + counters
+        return line
+
+
+def format_counters(counters):
+    from direct_download import format_bytes
+    parts = []
+    if counters.get(COUNTER_BYTES):
+        parts.append(f"下载 {format_bytes(counters[COUNTER_BYTES])}")
+    for name, label in ((COUNTER_RETRIES, "重试"), (COUNTER_CACHE_HITS, "缓存命中"),
+                        (COUNTER_CACHE_MISSES, "缓存未命中")):
+        kinds = counters.get(name)
+        if kinds:
+            detail = ", ".join(f"{kind} {value}" for kind, value in kinds.items())
+            parts.append(f"{label} {sum(kinds.values())} ({detail})")
+    return " · ".join(parts)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """
+    进程内汇总所有任务的耗时与计数器
+    - trace_path: 每个任务结束时追加该任务的 JSON Lines 记录
+    - prometheus_path: 每个任务结束时重写 Prometheus 文本格式文件 (可供 node_exporter textfile 收集器读取)
+    - profile: 任务结束时输出耗时分析
+    """
+    def __init__(self, trace_path=None, prometheus_path=None, profile=False):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.profile = profile
+        self.jobs = {True: 0, False: 0}
+        self.job_seconds = 0.0
+        self.phases = {}   # name -> [累计秒数, 次数, 各分桶次数]
+        self.counters = {} # (name, 分类) -> 数值
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def configure(self, trace_path=None, prometheus_path=None, profile=None):
+        with self._lock:
+            if trace_path is not None:
+                self.trace_path = trace_path
+            if prometheus_path is not None:
+                self.prometheus_path = prometheus_path
+            if profile is not None:
+                self.profile = profile
+
+    def record(self, trace):
+        """任务结束: 汇总并导出"""
+        records = trace.records()
+        with self._lock:
+            self.jobs[bool(trace.success)] += 1
+            self.job_seconds += trace.duration or 0.0
+            for name, _, duration, _ in list(trace.spans):
+                phase = self.phases.setdefault(name, [0.0, 0, [0] * len(DURATION_BUCKETS)])
+                phase[0] += duration
+                phase[1] += 1
+                for i, bound in enumerate(DURATION_BUCKETS):
+                    if duration <= bound:
+                        phase[2][i] += 1
+            for name, value in records[-1]["counters"].items():
+                kinds = value if isinstance(value, dict) else {None: value}
+                for kind, n in kinds.items():
+                    self.counters[(name, kind)] = self.counters.get((name, kind), 0) + n
+            trace_path, prometheus_path = self.trace_path, self.prometheus_path
+        with self._write_lock:
+            if trace_path:
+                try:
+                    with open(trace_path, 'a', encoding='utf-8') as f:
+                        for record in records:
+                            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except OSError:
+                    pass
+            if prometheus_path:
+                self.write_prometheus(prometheus_path)
+
+    def render_prometheus(self, stage_depths=None):
+        """
+        Prometheus 文本格式 (exposition format 0.0.4)
+        stage_depths: 可选的各阶段排队/执行数量 (DownloadScheduler.stage_depths), 以 gauge 输出
+        """
+        p = METRIC_PREFIX
+        with self._lock:
+            jobs = dict(self.jobs)
+            job_seconds = self.job_seconds
+            phases = {name: (total, count, list(buckets)) for name, (total, count, buckets) in self.phases.items()}
+            counters = dict(self.counters)
+        lines = [
+            f"# HELP {p}_jobs_total Finished download jobs.",
+            f"# TYPE {p}_jobs_total counter",
+            f'{p}_jobs_total{{result="success"}} {jobs[True]}',
+            f'{p}_jobs_total{{result="failure"}} {jobs[False]}',
+            f"# HELP {p}_job_duration_seconds_total Wall time of finished jobs.",
+            f"# TYPE {p}_job_duration_seconds_total counter",
+            f"{p}_job_duration_seconds_total {job_seconds:.6f}",
+            f"# HELP {p}_phase_duration_seconds Time spent in each job phase.",
+            f"# TYPE {p}_phase_duration_seconds histogram",
+        ]
+        for name, (total, count, buckets) in phases.items():
+            for bound, n in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'{p}_phase_duration_seconds_bucket{{phase="{_escape(name)}",le="{bound}"}} {n}')
+            lines.append(f'{p}_phase_duration_seconds_bucket{{phase="{_escape(name)}",le="+Inf"}} {count}')
+            lines.append(f'{p}_phase_duration_seconds_sum{{phase="{_escape(name)}"}} {total:.6f}')
+            lines.append(f'{p}_phase_duration_seconds_count{{phase="{_escape(name)}"}} {count}')
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{p}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            label = COUNTER_LABELS.get(name, "kind")
+            for (counter, kind), value in sorted(counters.items(), key=lambda item: str(item[0])):
+                if counter != name:
+                    continue
+                labels = f'{{{label}="{_escape(kind)}"}}' if kind is not None else ""
+                lines.append(f"{metric}{labels} {value}")
+        if stage_depths:
+            lines.append(f"# HELP {p}_stage_depth Jobs queued or running in each pipeline stage.")
+            lines.append(f"# TYPE {p}_stage_depth gauge")
+            for stage, value in stage_depths.items():
+                lines.append(f'{p}_stage_depth{{stage="{_escape(stage)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """原子写入 (先写临时文件再替换), 收集器不会读到写了一半的文件"""
+        try:
+            tmp = path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def format_profile(self):
+        """所有任务的阶段耗时汇总 (批量模式结束时输出)"""
+        with self._lock:
+            jobs = self.jobs[True] + self.jobs[False]
+            job_seconds = self.job_seconds
+            phases = sorted(((name, total, count) for name, (total, count, _) in self.phases.items()),
+                            key=lambda item: -item[1])
+            counters = {}
+            for (name, kind), value in self.counters.items():
+                if kind is None:
+                    counters[name] = value
+                else:
+                    counters.setdefault(name, {})[kind] = value
+        if not jobs:
+            return ""
+        lines = ["", f"=== 耗时分析 ({jobs} 个任务, 累计 {job_seconds:.1f}s) ==="]
+        for name, total, count in phases:
+            share = f"{total / job_seconds:6.1%}" if job_seconds > 0 else "   N/A"
+            lines.append(f"  {SPAN_LABELS.get(name, name)}: {total:.2f}s {share} | {count} 次, 平均 {total / count:.2f}s")
+        counter_text = format_counters(counters)
+        if counter_text:
+            lines.append(f"  计数: {counter_text}")
+        return "\n".join(lines)
+
+
+_metrics_lock = threading.Lock()
+_shared_metrics = None
+
+
+def configure_metrics(trace_path=None, prometheus_path=None, profile=None):
+    """设置导出方式; 未指定的参数保持不变"""
+    metrics = get_metrics()
+    metrics.configure(trace_path, prometheus_path, profile)
+    return metrics
+
+
+def get_metrics():
+    """进程内共享的指标汇总"""
+    global _shared_metrics
+    with _metrics_lock:
+        if _shared_metrics is None:
+            _shared_metrics = MetricsRegistry()
+        return _shared_metrics
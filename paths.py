@@ -0,0 +1,21 @@
+import os
+import sys
+
+
+def cache_dir():
+    """
+    本工具的缓存目录 (工具链探测结果等)
+    - macOS: ~/Library/Caches/VideoDownloader
+    - 其他: $XDG_CACHE_HOME/VideoDownloader 或 ~/.cache/VideoDownloader
+    """
+    if sys.platform == 'darwin':
+        base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "VideoDownloader")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_path(name):
+    return os.path.join(cache_dir(), name)
@@ -0,0 +1,138 @@
+import threading
+
+from canonical import canonical_id
+from rate_limit import get_rate_limiter
+
+# 超过该层数的嵌套播放列表不再展开 (频道 → 标签页 → 播放列表)
+MAX_DEPTH = 3
+
+
+def _iter_entries(entries):
+    """逐项迭代播放列表条目; 分页列表按页请求, 不会一次拉取全部页面"""
+    from yt_dlp.utils import PagedList
+
+    if isinstance(entries, PagedList):
+        page = 0
+        while True:
+            items = entries.getpage(page)
+            if not items:
+                return
+            yield from items
+            page += 1
+    else:
+        yield from entries or []
+
+
+def _is_nested(entry):
+    """条目本身是播放列表/频道标签页 (需要继续展开), 而不是单个视频"""
+    if entry.get('_type') == 'playlist':
+        return True
+    ie_key = entry.get('ie_key') or ''
+    return ie_key.endswith(('Tab', 'Playlist')) and not canonical_id(entry.get('url') or '')
+
+
+def entry_key(entry):
+    """扁平条目的下载索引键 (与 canonical_id / info_archive_key 格式一致)"""
+    key = canonical_id(entry.get('url') or '')
+    if key:
+        return key
+    if entry.get('ie_key') and entry.get('id'):
+        return f"{entry['ie_key'].lower()}:{entry['id']}"
+    return None
+
+
+class PlaylistExpander:
+    """
+    惰性展开播放列表/频道: 使用扁平解析 (extract_flat) 只获取条目链接, 不请求每个视频的元数据
+    条目边解析边产出, 由调用方直接提交到下载调度器
+    """
+    def __init__(self, cookies_file=None, log=None):
+        self.cookies_file = cookies_file
+        self.log = log or print
+        self.discovered = 0
+
+    def _ydl_opts(self):
+        opts = {
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'quiet': True,
+            'no_warnings': True,
+            'ignoreerrors': True,
+        }
+        if self.cookies_file:
+            opts['cookiefile'] = self.cookies_file
+        return opts
+
+    def iter_entries(self, url, depth=0):
+        """产出 (条目链接, 索引键, 标题)"""
+        import yt_dlp
+
+        get_rate_limiter().acquire(url)
+        with yt_dlp.YoutubeDL(self._ydl_opts()) as ydl:
+            # process=False: 保留未解析的条目生成器, 翻页在迭代时才发生
+            info = ydl.extract_info(url, download=False, process=False)
+            if not info:
+                return
+            if info.get('_type', 'video') == 'video':
+                self.discovered += 1
+                yield info.get('webpage_url') or url, canonical_id(url), info.get('title')
+                return
+            self.log(f"状态: 展开播放列表: {info.get('title') or url}")
+            for entry in _iter_entries(info.get('entries')):
+                if not entry:
+                    continue
+                entry_url = entry.get('url') or entry.get('webpage_url')
+                if not entry_url:
+                    continue
+                if _is_nested(entry):
+                    if depth < MAX_DEPTH:
+                        yield from self.iter_entries(entry_url, depth + 1)
+                    continue
+                self.discovered += 1
+                yield entry_url, entry_key(entry), entry.get('title')
+
+
+class PlaylistFeeder:
+    """
+    后台线程: 展开播放列表并把条目陆续提交到调度器
+    - 已在下载索引中的条目直接跳过 (不请求视频元数据)
+    - 调度器中排队的任务过多时暂停展开, 避免一次性枚举超大频道
+    """
+    def __init__(self, scheduler, url, archive=None, convert_to_mp4=True, resolution='1080', cookies_file=None,
+                 max_pending=None, log=None):
+        self.scheduler = scheduler
+        self.url = url
+        self.archive = archive
+        self.convert_to_mp4 = convert_to_mp4
+        self.resolution = resolution
+        self.cookies_file = cookies_file
+        self.max_pending = max_pending or scheduler.workers * 4
+        self.log = log or print
+        self.submitted = 0
+        self.skipped = 0
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="playlist-feeder", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        expander = PlaylistExpander(self.cookies_file, log=self.log)
+        try:
+            for entry_url, key, title in expander.iter_entries(self.url):
+                if self.archive is not None and self.archive.lookup(key):
+                    self.skipped += 1
+                    continue
+                self.scheduler.wait_for_queue(self.max_pending)
+                self.scheduler.submit(entry_url, convert_to_mp4=self.convert_to_mp4,
+                                      resolution=self.resolution, cookies_file=self.cookies_file)
+                self.submitted += 1
+        except Exception as e:
+            self.error = str(e)
+            self.log(f"错误: 播放列表展开失败: {e}")
+        self.log(f"状态: 播放列表展开完成: 共 {expander.discovered} 项, 提交 {self.submitted}, "
+                 f"已下载跳过 {self.skipped}")
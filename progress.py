@@ -0,0 +1,171 @@
+import sys
+import time
+import threading
+
+# 进度阶段
+PHASE_DOWNLOAD = "download"
+PHASE_PROCESS = "process"   # 合并/转码
+PHASE_DONE = "done"
+
+FLUSH_INTERVAL = 0.1 # 合并后的进度每秒最多推送 10 次
+
+
+class DownloadCancelled(Exception):
+    """任务被取消: 在进度回调中抛出, 中止正在进行的下载"""
+
+
+class ProgressEvent:
+    """
+    结构化进度事件 (数值字段, 无需解析字符串)
+    task_id: 任务标识 (调度器中为任务日志 ID); downloaded/total: 字节; speed: 字节/秒; eta: 秒
+    """
+    def __init__(self, task_id, phase, downloaded=0, total=None, speed=None, eta=None,
+                 fragment=None, fragment_count=None):
+        self.task_id = task_id
+        self.phase = phase
+        self.downloaded = downloaded
+        self.total = total
+        self.speed = speed
+        self.eta = eta
+        self.fragment = fragment
+        self.fragment_count = fragment_count
+        self.timestamp = time.monotonic()
+
+    @property
+    def percent(self):
+        """0~1, 总大小未知时返回 None"""
+        if self.phase == PHASE_DONE:
+            return 1.0
+        if self.total:
+            return min(1.0, self.downloaded / self.total)
+        if self.fragment_count:
+            return min(1.0, (self.fragment or 0) / self.fragment_count)
+        return None
+
+    @property
+    def speed_text(self):
+        from direct_download import format_bytes
+        if self.phase == PHASE_DONE:
+            return "完成"
+        if self.phase == PHASE_PROCESS:
+            return "处理中"
+        return f"{format_bytes(self.speed)}/s" if self.speed else "N/A"
+
+    @property
+    def eta_text(self):
+        from direct_download import format_eta
+        if self.phase != PHASE_DOWNLOAD:
+            return "0s" if self.phase == PHASE_DONE else "N/A"
+        return format_eta(self.eta)
+
+
+class ProgressBus:
+    """
+    进度事件总线
+    - subscribe(): 每个原始事件都同步回调 (程序化订阅, 回调应尽量轻量)
+    - subscribe_coalesced(): 每个任务只保留最新事件, 后台线程按固定频率批量推送 (GUI 重绘 / 命令行输出)
+    """
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self._raw = []
+        self._coalesced = []
+        self._pending = {} # task_id -> 最新事件
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """订阅原始事件, 返回取消订阅的函数"""
+        with self._lock:
+            self._raw.append(callback)
+        return lambda: self._unsubscribe(self._raw, callback)
+
+    def subscribe_coalesced(self, callback):
+        """订阅合并后的事件: callback(events) 每个周期最多调用一次, events 为各任务的最新事件"""
+        with self._lock:
+            self._coalesced.append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop, name="progress-bus", daemon=True)
+                self._thread.start()
+        return lambda: self._unsubscribe(self._coalesced, callback)
+
+    def _unsubscribe(self, subscribers, callback):
+        with self._lock:
+            if callback in subscribers:
+                subscribers.remove(callback)
+
+    def publish(self, event):
+        with self._lock:
+            raw = list(self._raw)
+            if self._coalesced:
+                self._pending[event.task_id] = event
+        for callback in raw:
+            try:
+                callback(event)
+            except Exception:
+                pass
+        if event.phase == PHASE_DONE:
+            # 结束事件尽快推送, 不等下一个周期
+            self._wakeup.set()
+
+    def flush(self):
+        """立即推送累积的事件 (退出前调用, 确保最后的状态被显示)"""
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._pending.values())
+                self._pending = {}
+                subscribers = list(self._coalesced)
+            if not events:
+                return
+            for callback in subscribers:
+                try:
+                    callback(events)
+                except Exception:
+                    pass
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+class ConsolePrinter:
+    """命令行进度输出: 在同一行刷新当前下载的进度 (订阅合并后的事件)"""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._active = False
+
+    def __call__(self, events):
+        for event in events:
+            if event.phase == PHASE_DOWNLOAD:
+                percent = event.percent
+                percent_text = f"{percent * 100:.1f}%" if percent is not None else "N/A"
+                self.stream.write(f"\r正在下载: {percent_text} | 速度: {event.speed_text} | 剩余时间: {event.eta_text}")
+                self._active = percent is None or percent < 1.0
+                if not self._active:
+                    self.stream.write("\n")
+            elif self._active:
+                self.stream.write("\n")
+                self._active = False
+        self.stream.flush()
+
+    def break_line(self):
+        """输出状态文字前结束正在刷新的进度行"""
+        if self._active:
+            self.stream.write("\n")
+            self._active = False
+
+
+_bus_lock = threading.Lock()
+_shared_bus = None
+
+
+def get_progress_bus():
+    """进程内共享的进度总线"""
+    global _shared_bus
+    with _bus_lock:
+        if _shared_bus is None:
+            _shared_bus = ProgressBus()
+        return _shared_bus
@@ -0,0 +1,142 @@
+import time
+import asyncio
+import threading
+
+from canonical import host_key
+
+# 触发限速的响应特征: 状态码与反爬页面标记
+THROTTLE_STATUS = (403, 429)
+THROTTLE_MARKERS = ('byted_acrawler', 'Too Many Requests', 'HTTP Error 429', 'HTTP Error 403')
+
+
+def is_throttled(status_code=None, text=None):
+    """响应是否为限流/风控信号 (429、403 或 Douyin 的 byted_acrawler 验证页)"""
+    if status_code in THROTTLE_STATUS:
+        return True
+    return bool(text) and any(marker in text for marker in THROTTLE_MARKERS)
+
+
+class HostBucket:
+    """
+    单个站点的令牌桶 (AIMD 调整速率)
+    - 初始速率较宽松, 正常情况下几乎不产生等待
+    - 收到限流信号: 速率减半, 清空令牌并进入冷却 (冷却时间逐次翻倍)
+    - 之后每次成功请求按固定步长恢复速率, 直到回到初始值
+    """
+    def __init__(self, rate=5.0, burst=10, min_rate=0.1, recovery_step=0.25, max_cooldown=60.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.recovery_step = recovery_step
+        self.max_cooldown = max_cooldown
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.cooldown = 0.0        # 下一次限流时的冷却时长
+        self.blocked_until = 0.0
+        self.penalties = 0
+
+    @property
+    def throttled(self):
+        return self.rate < self.max_rate
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """取一个令牌, 返回需要等待的秒数 (令牌已预留)"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        self.tokens -= 1
+        if self.tokens < 0:
+            wait = max(wait, -self.tokens / self.rate)
+        return wait
+
+    def penalize(self):
+        now = time.monotonic()
+        self._refill(now)
+        self.penalties += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        self.cooldown = min(self.max_cooldown, self.cooldown * 2 if self.cooldown else 2.0)
+        self.blocked_until = now + self.cooldown
+
+    def reward(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.recovery_step)
+        if not self.throttled:
+            self.cooldown = 0.0
+
+
+class RateLimiter:
+    """
+    按站点共享的限速器: 同一站点的所有并发任务共用一个令牌桶
+    """
+    def __init__(self, **bucket_options):
+        self.bucket_options = bucket_options
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = HostBucket(**self.bucket_options)
+            self._buckets[host] = bucket
+        return bucket
+
+    def acquire(self, url):
+        """请求前调用: 必要时阻塞等待, 返回实际等待的秒数"""
+        with self._lock:
+            wait = self._bucket(host_key(url)).reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, url):
+        """acquire 的异步版本: 等待期间不占用事件循环"""
+        with self._lock:
+            wait = self._bucket(host_key(url)).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def report(self, url, throttled):
+        """请求后调用: 根据是否收到限流信号调整该站点的速率, 返回调整后的速率"""
+        with self._lock:
+            bucket = self._bucket(host_key(url))
+            if throttled:
+                bucket.penalize()
+            else:
+                bucket.reward()
+            return bucket.rate
+
+    def request_delay(self, url):
+        """
+        yt-dlp 内部请求之间的间隔 (sleep_interval_requests)
+        站点未被限流时为 0, 限流恢复期间按当前速率计算
+        """
+        with self._lock:
+            bucket = self._bucket(host_key(url))
+            return 1.0 / bucket.rate if bucket.throttled else 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                host: {"rate": round(b.rate, 2), "penalties": b.penalties, "throttled": b.throttled}
+                for host, b in self._buckets.items()
+            }
+
+
+_limiter_lock = threading.Lock()
+_shared_limiter = None
+
+
+def get_rate_limiter():
+    """进程内共享的限速器"""
+    global _shared_limiter
+    with _limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
@@ -0,0 +1,190 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from urllib.parse import urlparse, parse_qs
+
+# 签名地址中表示过期时间 (Unix 时间戳) 的常见参数
+_EXPIRY_PARAMS = ('x-expires', 'expire', 'expires', 'deadline', 'e')
+
+# 包含登录凭据的字段 (浏览器 Cookie 等), 不写入缓存; 命中缓存时由 yt-dlp 按当前 Cookie 重新生成
+CREDENTIAL_KEYS = ('cookies', 'http_headers')
+
+SCHEMA_VERSION = 1     # 1: 记录中不含凭据字段
+DEFAULT_TTL = 1800     # 无法从地址推断过期时间时的默认有效期 (秒)
+EXPIRY_MARGIN = 120    # 提前失效, 为下载本身留出时间
+
+
+def url_expiry(url):
+    """从签名地址的查询参数推断过期时间, 无法推断时返回 None"""
+    try:
+        query = parse_qs(urlparse(url).query)
+    except ValueError:
+        return None
+    lowered = {k.lower(): v for k, v in query.items()}
+    for name in _EXPIRY_PARAMS:
+        values = lowered.get(name)
+        if values and values[0].isdigit():
+            value = int(values[0])
+            # 过滤掉明显不是时间戳的值
+            if value > 1_000_000_000:
+                return float(value)
+    return None
+
+
+def info_expiry(info):
+    """yt-dlp 信息字典中所有已选择地址的最早过期时间"""
+    urls = []
+    for fmt in info.get('requested_formats') or []:
+        urls.append(fmt.get('url'))
+    urls.append(info.get('url'))
+    expiries = [url_expiry(u) for u in urls if u]
+    expiries = [e for e in expiries if e]
+    return min(expiries) if expiries else None
+
+
+def strip_credentials(value):
+    """递归移除信息字典 (含每个格式) 中的 cookies 与 http_headers, 返回新的对象"""
+    if isinstance(value, dict):
+        return {k: strip_credentials(v) for k, v in value.items() if k not in CREDENTIAL_KEYS}
+    if isinstance(value, list):
+        return [strip_credentials(v) for v in value]
+    return value
+
+
+def _restrict_permissions(path):
+    """缓存数据库只允许当前用户读写 (0600), WAL/SHM 文件由 SQLite 按数据库文件的权限创建"""
+    if not os.path.exists(path):
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+    for name in (path, path + "-wal", path + "-shm"):
+        try:
+            os.chmod(name, 0o600)
+        except OSError:
+            pass
+
+
+class ResolveCache:
+    """
+    解析结果缓存 (Douyin 直链 / yt-dlp 信息字典)
+    - 内存 LRU, 最多 max_entries 条
+    - 可选持久化到 SQLite (db_path), 进程重启后仍可命中
+    - 每条记录按签名地址的过期参数失效, 无法推断时使用 default_ttl
+    调用方写入前需移除凭据字段 (见 strip_credentials), 数据库文件权限为 0600
+    """
+    def __init__(self, max_entries=256, db_path=None, default_ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        if db_path:
+            _restrict_permissions(db_path)
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS resolve_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                # 旧版本写入的记录可能包含 Cookie: 升级时清空
+                if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    conn.execute("DELETE FROM resolve_cache")
+                    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connect(self):
+        # 每次调用新建连接, 调用方负责关闭 (closing); 连接作为上下文管理器只提交/回滚事务
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._entries[key]
+
+        if self.db_path:
+            try:
+                with closing(self._connect()) as conn:
+                    row = conn.execute(
+                        "SELECT value, expires_at FROM resolve_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                if row and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    with self._lock:
+                        self.hits += 1
+                    return copy.deepcopy(value)
+            except (sqlite3.Error, ValueError):
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value, expires_at=None):
+        """expires_at: 过期时间戳 (通常来自签名地址), 为空时使用默认有效期"""
+        now = time.time()
+        if expires_at:
+            expires_at -= EXPIRY_MARGIN
+        else:
+            expires_at = now + self.default_ttl
+        if expires_at <= now:
+            return
+        self._remember(key, copy.deepcopy(value), expires_at)
+        if self.db_path:
+            try:
+                with closing(self._connect()) as conn, conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO resolve_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires_at),
+                    )
+            except (sqlite3.Error, TypeError, ValueError):
+                pass
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """下载失败 (例如地址提前失效) 时移除记录, 下次重新解析"""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.db_path:
+            try:
+                with closing(self._connect()) as conn, conn:
+                    conn.execute("DELETE FROM resolve_cache WHERE key = ?", (key,))
+            except sqlite3.Error:
+                pass
+
+
+_cache_lock = threading.Lock()
+_shared_cache = None
+
+
+def configure_resolve_cache(max_entries=256, db_path=None):
+    global _shared_cache
+    with _cache_lock:
+        _shared_cache = ResolveCache(max_entries=max_entries, db_path=db_path)
+    return _shared_cache
+
+
+def get_resolve_cache():
+    """进程内共享的解析缓存 (默认仅内存)"""
+    global _shared_cache
+    with _cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResolveCache()
+        return _shared_cache
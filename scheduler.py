@@ -0,0 +1,669 @@
+import threading
+import time
+import heapq
+import itertools
+
+from canonical import canonical_id, canonicalize, host_key
+from bandwidth import get_bandwidth_manager, priority_weight
+from journal import new_job_id, STAGE_QUEUED, STAGE_RESOLVE
+from progress import get_progress_bus
+from executors import run_sync, ensure_blocking_workers
+from transcode import get_transcode_pool
+
+
+# 任务状态
+QUEUED = "queued"
+PAUSED = "paused"
+RUNNING = "running"
+TRANSCODE_QUEUED = "transcode_queued"
+TRANSCODING = "transcoding"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+STATE_LABELS = {
+    QUEUED: "排队中",
+    PAUSED: "已暂停",
+    RUNNING: "下载中",
+    TRANSCODE_QUEUED: "等待转码",
+    TRANSCODING: "转码中",
+    DONE: "已完成",
+    FAILED: "失败",
+    CANCELLED: "已取消",
+}
+
+
+class DownloadJob:
+    """
+    调度器中的单个下载任务
+    on_status / on_state 为可选回调, 供 GUI 卡片同步显示; 下载进度通过进度总线发布 (任务标识为 journal_id)
+    同一视频且输出选项相同 (见 flight_key) 的重复任务不会单独下载, 而是挂到进行中的任务 (leader) 上,
+    共享其状态、进度与结果
+    """
+    def __init__(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None, priority=0,
+                 on_status=None, on_state=None):
+        self.url = url
+        self.convert_to_mp4 = convert_to_mp4
+        self.resolution = resolution
+        self.cookies_file = cookies_file
+        self.priority = priority # 数值越小越优先
+        self.on_status = on_status
+        self.on_state = on_state
+        self.host = host_key(url)
+        self.key = canonical_id(url) # 规范化视频 ID; 短链接在开始执行时展开后补充
+        self.resolved_url = None     # 展开短链接后的地址
+        self.leader = None           # 挂靠的进行中任务 (重复提交时)
+        self.followers = []          # 挂靠到本任务的重复任务
+        self.output_path = None
+        self.bandwidth = None        # 下载阶段的带宽份额 (BandwidthShare), 供界面显示分配与实际速率
+        self.journal_id = None       # 任务日志中的 ID
+        self.stage = STAGE_QUEUED    # 已到达的阶段 (解析/下载/合并/转码)
+        self.resume_task = None      # 从任务日志恢复的后处理步骤 (下载已完成, 直接合并/转码)
+        self.index = 0
+        self.state = QUEUED
+        self._seq = None # 当前有效的队列条目序号, 用于惰性删除过期条目
+        self.success = None
+        self.error = None
+        self.progress = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self.download_time = 0.0   # 下载阶段耗时
+        self.transcode_wait = 0.0  # 等待转码池空位的时间
+        self.transcode_time = 0.0  # 转码阶段耗时
+        self.done_event = threading.Event()
+        self.cancel_event = threading.Event() # 由 cancel_job 设置, 下载中的任务在下一次进度回调时中止
+
+    @property
+    def flight_key(self):
+        """
+        合并重复任务使用的 key: 视频 ID 加上影响输出的选项
+        同一视频以不同分辨率或不同的 MP4 转换设置提交时各自下载
+        """
+        if not self.key:
+            return None
+        return (self.key, str(self.resolution or ''), bool(self.convert_to_mp4))
+
+    @property
+    def state_label(self):
+        return STATE_LABELS.get(self.state, self.state)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class DownloadScheduler:
+    """
+    有界并发下载调度器
+    - workers: 全局并发数 (同时运行的下载任务上限)
+    - per_host: 单个主机的并发上限, 避免同一平台被并发请求触发限流
+    - transcode_pool: 可选的 TranscodePool; 设置后下载与后处理 (合并/转码) 分为两个阶段,
+      任务 N 转码的同时任务 N+1 已在下载
+    每个任务使用独立的 VideoExtractor (工具链探测已在进程内缓存, 创建开销很小),
+    以便后处理阶段在转码池中继续使用该任务的回调
+    支持任务优先级、单任务暂停/恢复 (仅限排队中的任务)、整体暂停派发, 以及运行时调整并发数
+    journal: 可选的 JobJournal; 设置后每次阶段变化都写入日志, 进程重启后可用 restore() 恢复未完成的任务
+    """
+    def __init__(self, workers=4, per_host=2, extractor_factory=None, log=None, transcode_pool=None, journal=None,
+                 progress_bus=None):
+        self.workers = max(1, int(workers))
+        self.per_host = max(1, int(per_host))
+        self.extractor_factory = extractor_factory
+        self.log = log or print
+        self.transcode_pool = transcode_pool
+        self.journal = journal
+        self._by_id = {}       # journal_id -> 任务, 用于把进度事件对应到任务
+        self._unsubscribe_progress = (progress_bus or get_progress_bus()).subscribe(self._on_progress)
+
+        self._cond = threading.Condition()
+        self._queues = {}      # host -> [(priority, seq, job)]
+        self._running = {}     # host -> 正在运行的任务数
+        self._seq = itertools.count()
+        self._threads = []
+        self._live_workers = 0
+        self._closed = False
+        self._paused = False
+        self._unfinished = 0
+        self._inflight = {}    # (视频 ID, 分辨率, 是否转 MP4) -> 进行中的任务 (single-flight)
+
+        self.jobs = []
+        self.started_at = None
+        self.finished_at = None
+
+    def submit(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None, priority=0,
+               on_status=None, on_state=None, journal_id=None, resume_task=None):
+        job = DownloadJob(url, convert_to_mp4, resolution, cookies_file, priority,
+                          on_status=on_status, on_state=on_state)
+        job.journal_id = journal_id or new_job_id()
+        self._by_id[job.journal_id] = job
+        job.resume_task = resume_task
+        if self.journal is not None and journal_id is None:
+            self.journal.submitted(job.journal_id, url, {
+                "convert_to_mp4": convert_to_mp4, "resolution": resolution,
+                "cookies_file": cookies_file, "priority": priority,
+            })
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭, 无法继续提交任务")
+            self.jobs.append(job)
+            job.index = len(self.jobs)
+            self._unfinished += 1
+            leader = self._inflight.get(job.flight_key) if job.key else None
+            if leader is not None:
+                self._attach(job, leader)
+            else:
+                if job.key:
+                    self._inflight[job.flight_key] = job
+                self._enqueue(job)
+                self._cond.notify()
+        self._notify_state(job)
+        if job.leader is not None:
+            self._announce_attach(job)
+        return job
+
+    def restore(self, entry, on_status=None, on_state=None):
+        """
+        恢复任务日志中未完成的任务 (JournalEntry)
+        - 已进入合并/转码阶段且下载产物仍在: 跳过解析与下载, 直接后处理
+        - 其他阶段: 重新排队; 解析结果与已下载的分片保留在缓存/暂存目录中, 不会从头开始
+        """
+        from video_extractor import PostProcessTask
+
+        options = entry.options
+        return self.submit(
+            entry.url,
+            convert_to_mp4=options.get("convert_to_mp4", True),
+            resolution=options.get("resolution", '1080'),
+            cookies_file=options.get("cookies_file"),
+            priority=options.get("priority", 0),
+            on_status=on_status,
+            on_state=on_state,
+            journal_id=entry.job_id,
+            resume_task=PostProcessTask.from_dict(entry.task) if entry.task else None,
+        )
+
+    def find(self, journal_id):
+        """按任务日志 ID 查找任务"""
+        return self._by_id.get(journal_id)
+
+    def _on_progress(self, event):
+        """进度总线的原始事件: 更新任务 (及挂靠的重复任务) 的进度数值"""
+        job = self._by_id.get(event.task_id)
+        percent = event.percent
+        if job is None or percent is None:
+            return
+        job.progress = percent
+        for follower in list(job.followers):
+            follower.progress = percent
+
+    def _journal_stage(self, job, stage, task=None):
+        job.stage = stage
+        if self.journal is not None:
+            self.journal.stage(job.journal_id, stage, task.to_dict() if task is not None else None)
+
+    def _attach(self, job, leader):
+        # 调用方需持有 self._cond
+        job.leader = leader
+        job.state = leader.state
+        job.progress = leader.progress
+        job.started_at = leader.started_at
+        leader.followers.append(job)
+
+    def _announce_attach(self, job):
+        message = f"状态: 与任务 [{job.leader.index}] 为同一视频，共享其下载进度"
+        if job.on_status:
+            try:
+                job.on_status(message)
+            except Exception:
+                pass
+        self.log(f"{self._prefix(job)} {message}")
+
+    def _enqueue(self, job):
+        # 调用方需持有 self._cond
+        job._seq = next(self._seq)
+        heapq.heappush(self._queues.setdefault(job.host, []), (job.priority, job._seq, job))
+
+    def _notify_state(self, job):
+        with self._cond:
+            followers = list(job.followers)
+            for follower in followers:
+                follower.state = job.state
+        for target in [job] + followers:
+            if target.on_state:
+                try:
+                    target.on_state(target)
+                except Exception:
+                    pass
+
+    def set_priority(self, job, priority):
+        """调整排队中任务的优先级, 旧队列条目惰性失效; 下载中的任务按新优先级调整带宽权重"""
+        job = job.leader or job
+        with self._cond:
+            job.priority = priority
+            if job.bandwidth is not None:
+                job.bandwidth.set_weight(priority_weight(priority))
+            if job.state != QUEUED:
+                return False
+            self._enqueue(job)
+            self._cond.notify()
+        return True
+
+    def pause_job(self, job):
+        """暂停排队中的任务 (运行中的任务不可暂停); 重复任务作用于其挂靠的任务"""
+        job = job.leader or job
+        with self._cond:
+            if job.state != QUEUED:
+                return False
+            job.state = PAUSED
+            job._seq = None
+        self._notify_state(job)
+        return True
+
+    def resume_job(self, job):
+        job = job.leader or job
+        with self._cond:
+            if job.state != PAUSED:
+                return False
+            job.state = QUEUED
+            self._enqueue(job)
+            self._cond.notify()
+        self._notify_state(job)
+        return True
+
+    def cancel_job(self, job):
+        """
+        取消任务, 返回是否发出了取消
+        - 排队中/已暂停: 立即结束
+        - 下载中: 在下一次进度回调时中止, 已下载的分片保留在暂存目录 (重新提交时续传)
+        - 等待转码: 不再执行后处理; 转码中的任务等待当前 ffmpeg 结束
+        重复任务只取消自身 (从挂靠的任务上移除); 取消被挂靠的任务时, 其重复任务一并取消
+        """
+        with self._cond:
+            if job.state in FINISHED_STATES or job.cancel_event.is_set():
+                return False
+            job.cancel_event.set()
+            immediate = job.leader is not None or job.state in (QUEUED, PAUSED)
+            if job.leader is not None:
+                job.leader.followers.remove(job)
+                job.leader = None
+            elif immediate:
+                job._seq = None # 队列中的条目惰性失效
+            if immediate:
+                job.state = CANCELLED
+                job.success = False
+            self._cond.notify_all()
+        if immediate:
+            self._complete_job(job)
+        return True
+
+    def pause(self):
+        """暂停派发新任务, 运行中的任务继续完成"""
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    @property
+    def paused(self):
+        return self._paused
+
+    def set_workers(self, workers):
+        """运行时调整并发数: 增加时立即补充线程, 减少时多余线程在当前任务结束后退出"""
+        with self._cond:
+            self.workers = max(1, int(workers))
+            self._cond.notify_all()
+        if self._threads:
+            self._spawn_workers()
+
+    def counts(self):
+        """各状态任务数, 用于界面显示队列情况 (挂靠的重复任务只计入完成/失败)"""
+        with self._cond:
+            result = {QUEUED: 0, PAUSED: 0, RUNNING: 0, TRANSCODE_QUEUED: 0, TRANSCODING: 0, DONE: 0, FAILED: 0,
+                      CANCELLED: 0}
+            for job in self.jobs:
+                if job.leader is not None and job.state not in FINISHED_STATES:
+                    continue
+                result[job.state] = result.get(job.state, 0) + 1
+            return result
+
+    def stage_depths(self):
+        """
+        各阶段的排队/执行数量, 用于判断瓶颈:
+        待转码持续堆积说明 CPU 预算不足, 待下载堆积而转码空闲说明网络是瓶颈
+        """
+        counts = self.counts()
+        depths = {
+            "download_queued": counts[QUEUED],
+            "downloading": counts[RUNNING],
+            "transcode_queued": counts[TRANSCODE_QUEUED],
+            "transcoding": counts[TRANSCODING],
+        }
+        if self.transcode_pool is not None:
+            # 转码池的实际占用 (包括流式转码等不经过后处理阶段的 ffmpeg 进程)
+            pool = self.transcode_pool.depth()
+            depths["ffmpeg_queued"] = pool["queued"]
+            depths["ffmpeg_running"] = pool["running"]
+            depths["ffmpeg_slots"] = self.transcode_pool.workers
+        return depths
+
+    def format_depths(self):
+        d = self.stage_depths()
+        text = (f"待下载 {d['download_queued']} | 下载中 {d['downloading']} | "
+                f"待转码 {d['transcode_queued']} | 转码中 {d['transcoding']}")
+        if "ffmpeg_slots" in d:
+            text += f" | ffmpeg {d['ffmpeg_running']}/{d['ffmpeg_slots']}"
+        return text
+
+    def wait_for_queue(self, limit):
+        """阻塞直到排队中的任务少于 limit (展开播放列表时的背压)"""
+        with self._cond:
+            while not self._closed:
+                queued = sum(1 for j in self.jobs if j.state == QUEUED and j.leader is None)
+                if queued < limit:
+                    return
+                self._cond.wait(1.0)
+
+    def start(self):
+        if self._threads:
+            return
+        if self.started_at is None:
+            self.started_at = time.time()
+        self._spawn_workers()
+
+    def _spawn_workers(self):
+        # 每个运行中的任务最多占用一个 blocking 线程, 线程池不应成为并发上限
+        ensure_blocking_workers(self.workers)
+        with self._cond:
+            missing = self.workers - self._live_workers
+            self._live_workers += max(0, missing)
+        for _ in range(missing):
+            t = threading.Thread(target=self._worker_loop, name=f"download-worker-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def close(self):
+        """不再接受新任务, 队列清空后工作线程自动退出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def shutdown(self):
+        """关闭调度器并取消进度订阅 (可重复调用); 之后本调度器不再被全局进度总线引用"""
+        self.close()
+        self._unsubscribe_progress()
+
+    def join(self):
+        """阻塞直到所有已提交任务完成"""
+        with self._cond:
+            while self._unfinished > 0:
+                self._cond.wait()
+        self.finished_at = time.time()
+
+    def run(self):
+        """启动并等待全部任务完成 (批量模式使用)"""
+        try:
+            self.start()
+            self.close()
+            self.join()
+            for t in self._threads:
+                t.join()
+        finally:
+            self.shutdown()
+        return self.summary()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._live_workers > self.workers:
+                    # 并发数被调小, 当前线程退出
+                    self._live_workers -= 1
+                    return None
+                best = None
+                for host, heap in self._queues.items():
+                    # 丢弃已暂停/已重排的过期条目
+                    while heap and (heap[0][2].state != QUEUED or heap[0][1] != heap[0][2]._seq):
+                        heapq.heappop(heap)
+                    if not heap or self._running.get(host, 0) >= self.per_host:
+                        continue
+                    if best is None or heap[0] < best:
+                        best = heap[0]
+                if best is not None and not self._paused:
+                    job = best[2]
+                    heapq.heappop(self._queues[job.host])
+                    job.state = RUNNING
+                    self._running[job.host] = self._running.get(job.host, 0) + 1
+                    return job
+                if self._closed and not any(self._queues.values()) and not self._has_paused_jobs():
+                    self._live_workers -= 1
+                    return None
+                self._cond.wait()
+
+    def _has_paused_jobs(self):
+        return any(j.state == PAUSED and j.leader is None for j in self.jobs)
+
+    def _claim_key(self, job):
+        """
+        短链接在提交时无法离线识别视频 ID: 执行前展开并重新检查是否有相同视频正在进行
+        返回 False 表示任务已挂靠到其他任务, 无需下载
+        """
+        if job.key is not None:
+            return True
+        key, resolved = canonicalize(job.url)
+        job.resolved_url = resolved
+        job.key = key
+        if not key:
+            return True
+        with self._cond:
+            leader = self._inflight.get(job.flight_key)
+            if leader is None:
+                self._inflight[job.flight_key] = job
+                return True
+            self._attach(job, leader)
+            self._running[job.host] -= 1
+            self._cond.notify_all()
+        self._notify_state(leader)
+        self._announce_attach(job)
+        return False
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if not self._claim_key(job):
+                continue
+            self._notify_state(job)
+            extractor = None
+            pending = None
+            try:
+                extractor = self.extractor_factory()
+                pending = self._run_job(job, extractor)
+            except Exception as e:
+                job.success = False
+                job.error = f"运行异常: {e}"
+            finally:
+                job.download_time = job.elapsed
+                # 下载阶段结束即释放站点并发名额
+                with self._cond:
+                    self._running[job.host] -= 1
+                    self._cond.notify_all()
+            if pending is not None:
+                self._submit_postprocess(job, extractor, pending)
+            else:
+                self._complete_job(job)
+
+    def _prefix(self, job):
+        return f"[{job.index}/{len(self.jobs)}]"
+
+    def _set_state(self, job, state):
+        with self._cond:
+            job.state = state
+        self._notify_state(job)
+
+    def _submit_postprocess(self, job, extractor, pending):
+        queued_at = time.time()
+        self._set_state(job, TRANSCODE_QUEUED)
+
+        def work(threads):
+            started = time.time()
+            job.transcode_wait = started - queued_at
+            # 等待转码期间被取消时 run_postprocess 直接返回
+            if not job.cancel_event.is_set():
+                self._set_state(job, TRANSCODING)
+            try:
+                return extractor.run_postprocess(pending, threads=threads)
+            finally:
+                job.transcode_time = time.time() - started
+
+        def done(result, error):
+            job.success = bool(result)
+            if error is not None:
+                job.error = f"运行异常: {error}"
+            elif not job.success:
+                job.error = extractor.last_error or "任务失败"
+            else:
+                job.output_path = extractor.last_output
+            self._complete_job(job)
+
+        # 转码队列已满时在此阻塞, 当前下载线程暂停领取新任务
+        self.transcode_pool.submit(work, done)
+
+    def _complete_job(self, job):
+        job.finished_at = time.time()
+        with self._cond:
+            if not job.success and job.cancel_event.is_set():
+                job.state = CANCELLED
+                job.error = "已取消"
+            else:
+                job.state = DONE if job.success else FAILED
+            if job.key and self._inflight.get(job.flight_key) is job:
+                del self._inflight[job.flight_key]
+            # 挂靠的重复任务共享同一结果
+            followers = list(job.followers)
+            for follower in followers:
+                follower.success = job.success
+                follower.error = job.error
+                follower.output_path = job.output_path
+                follower.progress = job.progress
+                follower.finished_at = job.finished_at
+            self._unfinished -= 1 + len(followers)
+            self._cond.notify_all()
+        if self.journal is not None:
+            for target in [job] + followers:
+                self.journal.finished(target.journal_id, target.success, target.output_path, target.error)
+        for target in [job] + followers:
+            target.done_event.set()
+        self._notify_state(job)
+        outcome = "完成" if job.success else job.state_label # 失败 / 已取消
+        line = f"{self._prefix(job)} {outcome} ({job.elapsed:.1f}s)"
+        if followers:
+            line += f" (含 {len(followers)} 个重复任务)"
+        if self.transcode_pool is not None:
+            line += f" [{self.format_depths()}]"
+        self.log(line)
+
+    def _run_job(self, job, extractor):
+        """执行下载阶段; 返回待执行的后处理 (流水线模式), 否则返回 None"""
+        prefix = self._prefix(job)
+
+        def on_status(msg):
+            if job.on_status:
+                job.on_status(msg)
+            else:
+                self.log(f"{prefix} {msg}")
+            for follower in list(job.followers):
+                if follower.on_status:
+                    follower.on_status(msg)
+
+        extractor.task_id = job.journal_id
+        extractor.status_callback = on_status
+        extractor.stage_callback = lambda stage, task=None: self._journal_stage(job, stage, task)
+        extractor.cancel_event = job.cancel_event
+
+        job.started_at = time.time()
+        for follower in list(job.followers):
+            follower.started_at = job.started_at
+        self.log(f"{prefix} 开始: {job.url}")
+
+        task, job.resume_task = job.resume_task, None
+        if task is not None and task.ready():
+            # 重启前已下载完成: 直接进入合并/转码
+            on_status("状态: 恢复未完成的任务, 下载已完成, 继续后处理")
+            if self.transcode_pool is not None:
+                job.success = True
+                return task
+            job.success = bool(get_transcode_pool().call(lambda threads: extractor.run_postprocess(task, threads)))
+            if not job.success:
+                job.error = extractor.last_error or "任务失败"
+            job.output_path = extractor.last_output
+            return None
+        self._journal_stage(job, STAGE_RESOLVE)
+        # 下载阶段加入全局带宽分配, 结束后 (转码前) 释放份额
+        job.bandwidth = get_bandwidth_manager().register(prefix, priority_weight(job.priority))
+        extractor.bandwidth = job.bandwidth
+        try:
+            # 网络请求在共享的事件循环中与其他任务并发执行, 下载与解析在 blocking 线程池中执行;
+            # 当前工作线程只等待结果 (占用一个并发名额)
+            job.success = bool(run_sync(extractor.extract_async(
+                job.resolved_url or job.url,
+                convert_to_mp4=job.convert_to_mp4,
+                resolution=job.resolution,
+                cookies_file=job.cookies_file,
+                defer_postprocess=self.transcode_pool is not None,
+            )))
+        finally:
+            extractor.bandwidth = None
+            job.bandwidth.close()
+        if not job.success:
+            job.error = extractor.last_error or "任务失败"
+            return None
+        job.output_path = extractor.last_output
+        return extractor.pending_postprocess
+
+    def summary(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        done = [j for j in self.jobs if j.state in FINISHED_STATES]
+        failed = [j for j in done if j.state == FAILED]
+        cancelled = sum(1 for j in done if j.state == CANCELLED)
+        return {
+            "total": len(self.jobs),
+            "succeeded": len(done) - len(failed) - cancelled,
+            "failed": len(failed),
+            "cancelled": cancelled,
+            "elapsed": elapsed,
+            "jobs_per_minute": (len(done) / elapsed * 60) if elapsed > 0 else 0.0,
+            "download_time": sum(j.download_time for j in done),
+            "transcode_wait": sum(j.transcode_wait for j in done),
+            "transcode_time": sum(j.transcode_time for j in done),
+            "coalesced": sum(1 for j in self.jobs if j.leader is not None),
+            "failures": [(j.url, j.error) for j in failed],
+        }
+
+    def format_summary(self, stats=None):
+        stats = stats or self.summary()
+        lines = [
+            "",
+            "=== 批量下载汇总 ===",
+            f"任务总数: {stats['total']} | 成功: {stats['succeeded']} | 失败: {stats['failed']}"
+            + (f" | 已取消: {stats['cancelled']}" if stats.get("cancelled") else ""),
+            f"总耗时: {stats['elapsed']:.1f}s | 吞吐: {stats['jobs_per_minute']:.2f} 个/分钟",
+        ]
+        if stats["coalesced"]:
+            lines.append(f"重复视频: {stats['coalesced']} 个任务共享了进行中的下载")
+        if self.transcode_pool is not None:
+            lines.append(
+                f"阶段累计: 下载 {stats['download_time']:.1f}s | 等待转码 {stats['transcode_wait']:.1f}s"
+                f" | 转码 {stats['transcode_time']:.1f}s"
+            )
+        if stats["failures"]:
+            lines.append("失败列表:")
+            for url, error in stats["failures"]:
+                lines.append(f"  - {url}: {error}")
+        return "\n".join(lines)
@@ -0,0 +1,125 @@
+import os
+import re
+import shutil
+import hashlib
+import itertools
+import threading
+
+STAGING_DIR = ".staging"
+# 输出文件名带上视频 ID (与直链下载的 "标题 [ID]" 一致): 同名的不同视频不会被当作已下载或互相覆盖
+OUTPUT_TEMPLATE = '%(title)s [%(id)s].%(ext)s'
+
+
+def move_unique(path, directory, name=None):
+    """
+    将文件移动到 directory 下 (文件名默认不变), 返回新路径
+    不覆盖已有文件: 同名文件存在时依次尝试 "名称 (1).mp4"、"名称 (2).mp4"...
+    优先用硬链接 + 删除完成移动 (目标已存在时链接失败, 不会在检查与移动之间被其他任务抢先写入)
+    """
+    base, ext = os.path.splitext(name or os.path.basename(path))
+    for n in itertools.count():
+        target = os.path.join(directory, f"{base}{ext}" if n == 0 else f"{base} ({n}){ext}")
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            continue
+        except OSError:
+            # 不支持硬链接的文件系统: 检查后移动
+            if os.path.exists(target):
+                continue
+            os.replace(path, target)
+            return target
+        os.remove(path)
+        return target
+
+
+class JobStaging:
+    """
+    单个任务的暂存目录与输出清单
+    - yt-dlp 输出到下载目录下的独立子目录, 不同任务互不干扰
+    - 真实输出路径由 yt-dlp 的下载进度/后处理回调记录, 无需扫描下载目录猜测文件名
+    - 完成后将最终文件移动到下载目录, 并删除暂存目录
+    同一视频 (相同 key) 使用同一暂存目录, 重试时可以续传未完成的分片
+    """
+    def __init__(self, download_dir, key):
+        self.download_dir = download_dir
+        self.key = key
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+        self.path = os.path.join(download_dir, STAGING_DIR, digest)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self.downloads = []     # 下载完成的文件: (路径, vcodec, acodec)
+        self.final = None       # 后处理 (合并/修正扩展名等) 之后的文件
+
+    def outtmpl(self, template=OUTPUT_TEMPLATE):
+        return os.path.join(self.path, template)
+
+    def progress_hook(self, d):
+        if d.get('status') != 'finished' or not d.get('filename'):
+            return
+        info = d.get('info_dict') or {}
+        with self._lock:
+            self.downloads.append((d['filename'], info.get('vcodec'), info.get('acodec')))
+
+    def postprocessor_hook(self, d):
+        if d.get('status') != 'finished':
+            return
+        filepath = (d.get('info_dict') or {}).get('filepath')
+        if filepath:
+            with self._lock:
+                self.final = filepath
+
+    def final_path(self, info=None):
+        """
+        按可信度依次尝试: 后处理输出 → yt-dlp 返回的 filepath → 唯一的下载文件
+        均不存在时返回 None (例如缺少 FFmpeg 导致分轨未合并)
+        """
+        candidates = [self.final]
+        for download in (info or {}).get('requested_downloads') or []:
+            candidates.append(download.get('filepath'))
+        with self._lock:
+            existing = list(dict.fromkeys(p for p, _, _ in self.downloads if os.path.exists(p)))
+        if len(existing) == 1:
+            candidates.append(existing[0])
+        for path in candidates:
+            if path and os.path.exists(path):
+                return path
+        return None
+
+    def split_parts(self):
+        """未合并的分轨文件: 返回 (视频分轨, 音频分轨), 按各格式的编码信息区分"""
+        video_part = audio_part = None
+        with self._lock:
+            downloads = list(self.downloads)
+        for path, vcodec, acodec in downloads:
+            if not os.path.exists(path):
+                continue
+            if vcodec and vcodec != 'none':
+                video_part = video_part or path
+            elif acodec and acodec != 'none':
+                audio_part = audio_part or path
+        return video_part, audio_part
+
+    def merged_path(self, part_path):
+        """分轨文件 (Title [id].f137.mp4) 对应的合并输出路径 (Title [id].mp4)"""
+        base = os.path.splitext(os.path.basename(part_path))[0]
+        base = re.sub(r'\.f[\w-]+$', '', base)
+        return os.path.join(self.path, base + ".mp4")
+
+    def publish(self, path):
+        """将暂存目录中的最终文件移动到下载目录 (不覆盖已有文件, 见 move_unique), 返回新路径"""
+        if not path or not os.path.exists(path):
+            return path
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.path):
+            return path
+        return move_unique(path, self.download_dir)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def release(self):
+        """任务失败时调用: 保留未完成的分片以便重试续传, 仅删除空的暂存目录"""
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
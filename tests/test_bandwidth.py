@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from bandwidth import BandwidthManager, MIN_ALLOCATION, priority_weight
+
+MiB = 1024 * 1024
+
+
+def _active(manager, name, weight=1.0):
+    """已开始传输的任务 (处于预热期, 需求不受限)"""
+    share = manager.register(name, weight)
+    share.first_byte_at = time.monotonic()
+    return share
+
+
+def test_priority_weight():
+    assert priority_weight(0) == 1.0
+    assert priority_weight(-1) == 2.0
+    assert priority_weight(1) == 0.5
+    assert priority_weight(-10) == 16.0
+    assert priority_weight(10) == 1 / 16
+
+
+def test_unlimited():
+    manager = BandwidthManager()
+    share = _active(manager, "a")
+    manager.set_limit(None)
+    assert share.allocation is None
+    assert share.consume(MiB) == 0
+
+
+def test_weighted_split():
+    manager = BandwidthManager()
+    low = _active(manager, "low", 1.0)
+    high = _active(manager, "high", 3.0)
+    manager.set_limit(4 * MiB)
+    assert low.allocation == pytest.approx(1 * MiB)
+    assert high.allocation == pytest.approx(3 * MiB)
+    high.set_weight(1.0)
+    assert low.allocation == pytest.approx(2 * MiB)
+
+
+def test_idle_share_keeps_minimum():
+    manager = BandwidthManager(4 * MiB)
+    active = _active(manager, "active")
+    idle = manager.register("idle")
+    manager.set_limit(4 * MiB)
+    assert idle.allocation == MIN_ALLOCATION
+    assert active.allocation == pytest.approx(4 * MiB - MIN_ALLOCATION)
+
+
+def test_unused_share_is_redistributed():
+    # 用不满份额的任务 (上游慢) 只保留实测速率的 1.5 倍, 其余分给其他任务
+    manager = BandwidthManager()
+    slow = _active(manager, "slow")
+    fast = _active(manager, "fast")
+    manager.set_limit(2 * MiB)
+    now = time.monotonic()
+    for share, rate in ((slow, 100 * 1024), (fast, 2 * MiB)):
+        share.first_byte_at = now - 10
+        share._sample_at = now - 1.0
+        share._sample_bytes = rate
+    manager.set_limit(2 * MiB)
+    assert slow.allocation == pytest.approx(150 * 1024, rel=0.05)
+    assert fast.allocation == pytest.approx(2 * MiB - slow.allocation)
+
+
+def test_release_returns_bandwidth():
+    manager = BandwidthManager()
+    a = _active(manager, "a")
+    b = _active(manager, "b")
+    manager.set_limit(2 * MiB)
+    assert a.allocation == pytest.approx(MiB)
+    b.close()
+    b.close()
+    assert a.allocation == pytest.approx(2 * MiB)
+    assert [s["name"] for s in manager.stats()] == ["a"]
+
+
+def test_consume_waits_for_allocation():
+    manager = BandwidthManager()
+    share = _active(manager, "a")
+    manager.set_limit(MiB)
+    started = time.monotonic()
+    wait = share.consume(MiB // 10)
+    assert 0.05 < wait <= 0.11
+    assert time.monotonic() - started >= wait
+    assert share.total_bytes == MiB // 10
@@ -0,0 +1,59 @@
+import pytest
+
+from canonical import canonical_id, cache_key, canonicalize, host_key, is_short_link
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://www.douyin.com/video/7598633843184143662", "douyin:7598633843184143662"),
+    ("https://www.douyin.com/video/7598633843184143662?previous_page=app_code_link", "douyin:7598633843184143662"),
+    ("https://www.douyin.com/jingxuan?modal_id=7598633843184143662", "douyin:7598633843184143662"),
+    ("https://www.iesdouyin.com/share/video/7598633843184143662/", "douyin:7598633843184143662"),
+    ("www.douyin.com/video/7598633843184143662", "douyin:7598633843184143662"),
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", "youtube:dQw4w9WgXcQ"),
+    ("https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42", "youtube:dQw4w9WgXcQ"),
+    ("https://youtu.be/dQw4w9WgXcQ?si=abc", "youtube:dQw4w9WgXcQ"),
+    ("https://www.youtube.com/shorts/dQw4w9WgXcQ", "youtube:dQw4w9WgXcQ"),
+    ("https://www.youtube.com/embed/dQw4w9WgXcQ", "youtube:dQw4w9WgXcQ"),
+    ("https://www.youtube.com/live/dQw4w9WgXcQ", "youtube:dQw4w9WgXcQ"),
+    ("https://www.bilibili.com/video/BV1xx411c7mD", "bilibili:BV1xx411c7mD"),
+    ("https://www.bilibili.com/video/BV1xx411c7mD?p=1", "bilibili:BV1xx411c7mD"),
+    ("https://www.bilibili.com/video/BV1xx411c7mD/?p=3&vd_source=x", "bilibili:BV1xx411c7mD_p3"),
+])
+def test_canonical_id(url, expected):
+    assert canonical_id(url) == expected
+
+
+@pytest.mark.parametrize("url", [
+    None,
+    "",
+    "https://www.youtube.com/watch?v=short",
+    "https://www.youtube.com/playlist?list=PL123",
+    "https://www.douyin.com/user/MS4wLjABAAAA",
+    "https://www.bilibili.com/bangumi/play/ep123",
+    "https://v.douyin.com/iRNBho6u/",
+    "https://example.com/video/7598633843184143662",
+])
+def test_canonical_id_unrecognized(url):
+    assert canonical_id(url) is None
+
+
+def test_cache_key_falls_back_to_url():
+    assert cache_key("https://youtu.be/dQw4w9WgXcQ") == "youtube:dQw4w9WgXcQ"
+    assert cache_key("https://example.com/a.mp4") == "url:https://example.com/a.mp4"
+
+
+def test_short_links():
+    assert is_short_link("https://v.douyin.com/iRNBho6u/")
+    assert is_short_link("b23.tv/abc")
+    assert not is_short_link("https://www.douyin.com/video/7598633843184143662")
+
+
+def test_canonicalize_without_network():
+    # 可离线识别的链接不发起请求
+    assert canonicalize("https://youtu.be/dQw4w9WgXcQ") == ("youtube:dQw4w9WgXcQ", "https://youtu.be/dQw4w9WgXcQ")
+    assert canonicalize("https://example.com/a.mp4") == (None, "https://example.com/a.mp4")
+
+
+def test_host_key():
+    assert host_key("https://v.douyin.com/abc/") == host_key("https://www.douyin.com/video/1") == "douyin.com"
+    assert host_key("127.0.0.1:8000/a") == "127.0.0.1"
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import direct_download
+from direct_download import SegmentedDownloader
+
+CHUNK = 256 * 1024
+DATA = os.urandom(CHUNK * 6 + 123)
+
+
+class RangeServer:
+    """
+    支持 Range 的本地文件服务器
+    - truncate: 这些偏移的分段在第一次请求时只返回一半数据后断开 (模拟连接中断)
+    - fail: 这些偏移的分段始终返回 500
+    - slow: 每写 16KiB 暂停一次 (模拟慢镜像)
+    """
+    def __init__(self, data=DATA, truncate=(), fail=(), slow=False):
+        self.data = data
+        self.truncate = set(truncate)
+        self.fail = set(fail)
+        self.slow = slow
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests += 1
+                start, end = self.headers["Range"].split("=")[1].split("-")
+                start, end = int(start), min(int(end), len(server.data) - 1)
+                if start in server.fail:
+                    self.send_response(500)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = server.data[start:end + 1]
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(server.data)}")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if start in server.truncate:
+                    server.truncate.discard(start)
+                    self.wfile.write(body[:len(body) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                if server.slow and len(body) > 1:
+                    for offset in range(0, len(body), 16 * 1024):
+                        self.wfile.write(body[offset:offset + 16 * 1024])
+                        self.wfile.flush()
+                        time.sleep(0.1)
+                    return
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/media.mp4"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**options):
+        server = RangeServer(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _downloader(url, path, reports=None, **options):
+    callback = (lambda *args: reports.append(args)) if reports is not None else None
+    return SegmentedDownloader(url, str(path), chunk_size=CHUNK, min_connections=2, max_connections=4,
+                               progress_callback=callback, timeout=10, **options)
+
+
+def test_download_complete(serve, tmp_path):
+    server = serve()
+    out = tmp_path / "out.mp4"
+    reports = []
+    downloader = _downloader(server.url, out, reports)
+    assert downloader.download() == str(out)
+    assert out.read_bytes() == DATA
+    assert not os.path.exists(str(out) + ".part")
+    assert not os.path.exists(str(out) + ".part.json")
+    assert downloader.retries == 0
+    assert downloader.transferred == len(DATA)
+    assert reports[-1][0] == len(DATA)
+
+
+def test_retry_does_not_double_count(serve, tmp_path):
+    # 中断的分段重试时整段重新下载, 已计入的部分字节需要扣除
+    server = serve(truncate=(CHUNK, CHUNK * 3, CHUNK * 5))
+    out = tmp_path / "out.mp4"
+    reports = []
+    downloader = _downloader(server.url, out, reports)
+    downloader.download()
+    assert out.read_bytes() == DATA
+    assert downloader.retries == 3
+    assert downloader.transferred == len(DATA)
+    assert max(report[0] for report in reports) == len(DATA)
+
+
+def test_resume_counts_only_remaining_bytes(serve, tmp_path):
+    out = tmp_path / "out.mp4"
+    failing = serve(fail=(CHUNK * 4,))
+    first = _downloader(failing.url, out, max_retries=1)
+    with pytest.raises(RuntimeError):
+        first.download()
+    assert os.path.exists(str(out) + ".part")
+    assert os.path.exists(str(out) + ".part.json")
+    assert 4 not in first.done
+
+    healthy = serve()
+    reports = []
+    second = _downloader(healthy.url, out, reports)
+    second.download()
+    assert out.read_bytes() == DATA
+    completed = sum(min(CHUNK, len(DATA) - i * CHUNK) for i in first.done)
+    assert second.resumed_bytes == completed
+    assert second.transferred == len(DATA) - completed
+    assert reports[-1][0] == len(DATA)
+
+
+def test_resume_ignores_state_of_other_file(serve, tmp_path):
+    out = tmp_path / "out.mp4"
+    (tmp_path / "out.mp4.part").write_bytes(b"\0" * 10)
+    (tmp_path / "out.mp4.part.json").write_text('{"total": 10, "chunk_size": 262144, "done": [0]}')
+    server = serve()
+    downloader = _downloader(server.url, out)
+    downloader.download()
+    assert out.read_bytes() == DATA
+    assert downloader.resumed_bytes == 0
+    assert downloader.transferred == len(DATA)
+
+
+def test_failover_when_first_mirror_unavailable(serve, tmp_path):
+    server = serve()
+    dead = serve()
+    dead_url = dead.url
+    dead.stop()
+    out = tmp_path / "out.mp4"
+    downloader = _downloader([dead_url, server.url], out)
+    downloader.download()
+    assert out.read_bytes() == DATA
+    assert downloader.failovers == 1
+
+
+def test_slow_mirror_is_abandoned_while_reading(serve, tmp_path, monkeypatch):
+    # 慢镜像在读取分段的过程中被发现并切换, 不必等整段读完
+    monkeypatch.setattr(direct_download, "SPEED_CHECK_AFTER", 0.2)
+    slow = serve(slow=True)
+    fast = serve()
+    out = tmp_path / "out.mp4"
+    downloader = _downloader([slow.url, fast.url], out, min_speed=1024 * 1024)
+    started = time.time()
+    downloader.download()
+    assert out.read_bytes() == DATA
+    assert downloader.failovers >= 1
+    assert downloader.transferred == len(DATA)
+    # 慢镜像读完一整段需要 1.6 秒
+    assert time.time() - started < 1.6 * 2
@@ -0,0 +1,102 @@
+import asyncio
+import itertools
+import os
+
+import pytest
+
+import video_extractor
+from executors import run_sync
+from server import BenchServer
+from video_extractor import VideoExtractor
+
+MEDIA_SIZE = 512 * 1024
+_video_ids = itertools.count(7100000000000000001)
+
+
+@pytest.fixture(scope="module")
+def bench_server():
+    server = BenchServer(media_size=MEDIA_SIZE, segment_count=4, segment_size=64 * 1024, latency=0.0,
+                         connection_rate=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def douyin(bench_server, monkeypatch):
+    """Douyin 分享页指向本地模拟服务器, 返回生成视频链接的函数 (每次调用使用新的视频 ID)"""
+    monkeypatch.setattr(video_extractor, "DOUYIN_SHARE_URL", f"{bench_server.url}/share/video/{{video_id}}/")
+    return lambda: f"https://www.douyin.com/video/{next(_video_ids)}"
+
+
+def _extractor(tmp_path):
+    messages = []
+    extractor = VideoExtractor(download_dir=str(tmp_path / "downloads"), status_callback=messages.append)
+    return extractor, messages
+
+
+def test_extract_inside_running_event_loop(douyin, tmp_path):
+    # 同步接口在已运行事件循环的线程中调用 (例如 GUI 回调) 时不应报错
+    extractor, messages = _extractor(tmp_path)
+    url = douyin()
+    video_id = url.rsplit("/", 1)[-1]
+
+    async def caller():
+        return extractor.extract(url)
+
+    assert asyncio.run(caller())
+    assert f"[{video_id}]" in os.path.basename(extractor.last_output)
+    assert os.path.getsize(extractor.last_output) == MEDIA_SIZE
+    # 暂存目录已清理
+    downloads = tmp_path / "downloads"
+    assert [name for name in os.listdir(downloads) if not name.startswith(".")] == [
+        os.path.basename(extractor.last_output)]
+    assert os.listdir(downloads / ".staging") == []
+
+
+def test_concurrent_extract_async(douyin, tmp_path):
+    urls = [douyin() for _ in range(4)]
+    extractors = [_extractor(tmp_path)[0] for _ in urls]
+
+    async def run_all():
+        return await asyncio.gather(*(e.extract_async(u) for e, u in zip(extractors, urls)))
+
+    assert run_sync(run_all()) == [True] * len(urls)
+    outputs = {e.last_output for e in extractors}
+    assert len(outputs) == len(urls)
+    assert all(os.path.getsize(path) == MEDIA_SIZE for path in outputs)
+
+
+def test_archived_video_is_skipped(douyin, tmp_path):
+    url = douyin()
+    first, _ = _extractor(tmp_path)
+    assert first.extract(url)
+    second, messages = _extractor(tmp_path)
+    assert second.extract(url)
+    assert second.last_output == first.last_output
+    assert any("已下载过" in message for message in messages)
+
+
+def test_existing_output_requires_matching_id(tmp_path):
+    # 同名的其他视频不应被当作已下载
+    from yt_dlp import YoutubeDL
+    from staging import JobStaging
+
+    extractor, _ = _extractor(tmp_path)
+    staging = JobStaging(extractor.download_dir, "youtube:abc")
+    info = {"id": "abc", "title": "Same Title", "ext": "webm", "extractor": "youtube", "webpage_url": "x"}
+    with YoutubeDL({"outtmpl": staging.outtmpl(), "quiet": True}) as ydl:
+        (tmp_path / "downloads" / "Same Title.mp4").write_bytes(b"old")
+        (tmp_path / "downloads" / "Same Title [xyz].mp4").write_bytes(b"other")
+        assert extractor._existing_output(ydl, info) is None
+        (tmp_path / "downloads" / "Same Title [abc].mp4").write_bytes(b"this")
+        assert os.path.basename(extractor._existing_output(ydl, info)) == "Same Title [abc].mp4"
+
+
+@pytest.mark.parametrize("ext, expected", [("mp4", False), ("MOV", False), ("m4v", False), ("webm", True),
+                                           ("flv", True)])
+def test_streaming_skips_mp4_family(tmp_path, ext, expected):
+    # MP4/MOV 从管道读取时 moov 可能在末尾, 直接下载
+    extractor, _ = _extractor(tmp_path)
+    info = {"url": "https://cdn.example.com/v", "protocol": "https", "ext": ext}
+    assert extractor._is_streamable(info) is expected
+    assert not extractor._is_streamable(dict(info, requested_formats=[{}, {}]))
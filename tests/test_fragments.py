@@ -0,0 +1,74 @@
+import pytest
+
+from fragments import FragmentTuner, DEFAULT_CONCURRENCY, MAX_CONCURRENCY, REPROBE_AFTER, is_backoff_error
+
+HOST = "youtube.com"
+
+
+@pytest.mark.parametrize("text", [
+    "HTTP Error 429: Too Many Requests",
+    "HTTP Error 403: Forbidden",
+    "Read timed out. (read timeout=20)",
+    "Connection reset by peer",
+    "Connection aborted.",
+])
+def test_backoff_errors(text):
+    assert is_backoff_error(text)
+
+
+@pytest.mark.parametrize("text", [None, "", "HTTP Error 404: Not Found", "Video unavailable in your country",
+                                  "Unable to extract uploader id"])
+def test_unrelated_errors_do_not_back_off(text):
+    assert not is_backoff_error(text)
+
+
+def test_grows_while_throughput_improves_then_settles():
+    tuner = FragmentTuner()
+    assert tuner.concurrency(HOST) == DEFAULT_CONCURRENCY
+    assert tuner.record(HOST, 2, 100.0) == 3
+    assert tuner.record(HOST, 3, 200.0) == 5
+    # 提升不足 10%: 回到吞吐最高的并发数并保持
+    assert tuner.record(HOST, 5, 210.0) == 3
+    assert tuner.stats()[HOST]["settled"]
+    assert tuner.record(HOST, 3, 190.0) == 3
+
+
+def test_failure_halves_and_caps():
+    tuner = FragmentTuner()
+    tuner.record(HOST, 2, 100.0)
+    tuner.record(HOST, 3, 200.0)
+    assert tuner.record(HOST, 5, 0.0, failed=True) == 2
+    assert tuner.stats()[HOST]["ceiling"] == 4
+    # 之后增加并发不超过出错时的并发数以下
+    assert tuner.record(HOST, 2, 100.0) == 3
+    assert tuner.record(HOST, 3, 200.0) == 4
+    assert tuner.record(HOST, 4, 400.0) == 4
+
+
+def test_growth_is_bounded():
+    tuner = FragmentTuner()
+    concurrency, throughput = 2, 100.0
+    for _ in range(20):
+        concurrency = tuner.record(HOST, concurrency, throughput)
+        throughput *= 2
+    assert concurrency == MAX_CONCURRENCY
+
+
+def test_reprobes_after_stable_runs():
+    tuner = FragmentTuner()
+    tuner.record(HOST, 2, 100.0)
+    tuner.record(HOST, 3, 100.0)
+    assert tuner.stats()[HOST]["settled"]
+    for _ in range(REPROBE_AFTER - 1):
+        assert tuner.record(HOST, 2, 100.0) == 2
+    assert tuner.record(HOST, 2, 100.0) == 3
+
+
+def test_state_persists(tmp_path):
+    path = str(tmp_path / "fragments.json")
+    tuner = FragmentTuner(path)
+    tuner.record(HOST, 2, 100.0)
+    tuner.record(HOST, 3, 200.0)
+    assert FragmentTuner(path).concurrency(HOST) == 5
+    (tmp_path / "fragments.json").write_text("not json")
+    assert FragmentTuner(path).concurrency(HOST) == DEFAULT_CONCURRENCY
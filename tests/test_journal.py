@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+
+from journal import (JobJournal, get_journal, MODE_CLI, MODE_GUI, MODE_DAEMON, JOURNAL_FILES,
+                     STAGE_QUEUED, STAGE_DOWNLOAD, STAGE_MERGE)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_unfinished_follows_last_record(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.jsonl"))
+    journal.submitted("a", "https://a", {"resolution": "720"})
+    journal.submitted("b", "https://b", {})
+    journal.submitted("c", "https://c", {})
+    journal.stage("a", STAGE_DOWNLOAD)
+    journal.stage("a", STAGE_MERGE, {"kind": "merge"})
+    journal.finished("b", True, "/out/b.mp4")
+    journal.finished("c", False, error="404")
+
+    entries = journal.unfinished()
+    assert [e.job_id for e in entries] == ["a"]
+    assert entries[0].stage == STAGE_MERGE and entries[0].task == {"kind": "merge"}
+    assert entries[0].options == {"resolution": "720"}
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    journal = JobJournal(str(path))
+    journal.submitted("a", "https://a", {})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": "a", "event": "do')
+    assert [e.job_id for e in journal.unfinished()] == ["a"]
+
+
+def test_compact_keeps_only_unfinished(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    journal = JobJournal(str(path))
+    for n in range(10):
+        journal.submitted(str(n), f"https://{n}", {})
+        journal.stage(str(n), STAGE_DOWNLOAD)
+        if n % 2:
+            journal.finished(str(n), True)
+    entries = journal.compact()
+    assert [e.job_id for e in entries] == ["0", "2", "4", "6", "8"]
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 10
+    after = journal.unfinished()
+    assert [(e.job_id, e.stage) for e in after] == [(e.job_id, STAGE_DOWNLOAD) for e in entries]
+    assert JobJournal(str(path)).compact()[0].stage != STAGE_QUEUED
+
+
+def test_journal_per_mode(isolated_cache):
+    paths = {mode: get_journal(mode).path for mode in (MODE_CLI, MODE_GUI, MODE_DAEMON)}
+    assert len(set(paths.values())) == 3
+    assert {os.path.basename(p) for p in paths.values()} == set(JOURNAL_FILES.values())
+    assert get_journal(MODE_GUI) is get_journal(MODE_GUI)
+
+
+WRITER = """
+import sys
+from journal import JobJournal
+journal = JobJournal(sys.argv[1])
+for n in range(int(sys.argv[3])):
+    journal.submitted(f"{sys.argv[2]}-{n}", "https://example.com", {})
+"""
+
+COMPACTOR = """
+import sys
+from journal import JobJournal
+journal = JobJournal(sys.argv[1])
+for _ in range(int(sys.argv[2])):
+    journal.compact()
+"""
+
+
+def test_compact_does_not_lose_appends_from_other_processes(tmp_path):
+    # 两个进程追加的同时第三个进程反复压缩, 所有追加的记录都应保留
+    path = str(tmp_path / "jobs.jsonl")
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    processes = [
+        subprocess.Popen([sys.executable, "-c", WRITER, path, "x", "150"], env=env),
+        subprocess.Popen([sys.executable, "-c", WRITER, path, "y", "150"], env=env),
+        subprocess.Popen([sys.executable, "-c", COMPACTOR, path, "100"], env=env),
+    ]
+    for process in processes:
+        assert process.wait(timeout=60) == 0
+    assert len(JobJournal(path).unfinished()) == 300
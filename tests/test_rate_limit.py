@@ -0,0 +1,63 @@
+import pytest
+
+from rate_limit import HostBucket, RateLimiter, is_throttled
+
+
+def test_is_throttled():
+    assert is_throttled(429) and is_throttled(403)
+    assert is_throttled(200, "<script>byted_acrawler</script>")
+    assert is_throttled(text="ERROR: HTTP Error 429: Too Many Requests")
+    assert not is_throttled(404, "Not Found")
+    assert not is_throttled()
+
+
+def test_penalize_halves_rate_and_doubles_cooldown():
+    bucket = HostBucket(rate=4.0, min_rate=0.5, max_cooldown=5.0)
+    bucket.penalize()
+    assert bucket.rate == 2.0 and bucket.cooldown == 2.0 and bucket.tokens == 0.0
+    assert bucket.throttled
+    bucket.penalize()
+    assert bucket.rate == 1.0 and bucket.cooldown == 4.0
+    bucket.penalize()
+    bucket.penalize()
+    # 速率与冷却时间分别受 min_rate / max_cooldown 限制
+    assert bucket.rate == 0.5 and bucket.cooldown == 5.0
+    assert bucket.penalties == 4
+
+
+def test_reward_recovers_additively():
+    bucket = HostBucket(rate=2.0, recovery_step=0.25)
+    bucket.penalize()
+    assert bucket.rate == 1.0
+    for _ in range(3):
+        bucket.reward()
+    assert bucket.rate == pytest.approx(1.75)
+    assert bucket.cooldown == 2.0
+    bucket.reward()
+    bucket.reward()
+    assert bucket.rate == 2.0 and not bucket.throttled
+    # 恢复到初始速率后冷却时间重置
+    assert bucket.cooldown == 0.0
+
+
+def test_reserve_uses_burst_then_waits():
+    bucket = HostBucket(rate=10.0, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_reserve_waits_for_cooldown():
+    bucket = HostBucket(rate=10.0, burst=3)
+    bucket.penalize()
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.05)
+
+
+def test_limiter_shares_bucket_per_site():
+    limiter = RateLimiter(rate=4.0)
+    assert limiter.request_delay("https://www.douyin.com/video/1") == 0
+    assert limiter.report("https://v.douyin.com/abc/", throttled=True) == 2.0
+    # 同一站点的不同子域共用一个令牌桶
+    assert limiter.request_delay("https://www.douyin.com/video/1") == 0.5
+    assert limiter.request_delay("https://www.youtube.com/watch?v=dQw4w9WgXcQ") == 0
+    assert limiter.stats()["douyin.com"] == {"rate": 2.0, "penalties": 1, "throttled": True}
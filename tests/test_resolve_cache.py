@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import stat
+import time
+
+import pytest
+
+from resolve_cache import ResolveCache, SCHEMA_VERSION, EXPIRY_MARGIN, strip_credentials, url_expiry, info_expiry
+
+
+def test_strip_credentials_removes_nested_keys():
+    info = {
+        "id": "abc",
+        "cookies": "SESSDATA=secret",
+        "http_headers": {"Cookie": "SESSDATA=secret"},
+        "formats": [{"format_id": "1", "url": "https://a", "http_headers": {"Cookie": "x"}, "cookies": "y"}],
+        "requested_formats": [{"format_id": "2", "http_headers": {}}],
+    }
+    cleaned = strip_credentials(info)
+    assert cleaned == {
+        "id": "abc",
+        "formats": [{"format_id": "1", "url": "https://a"}],
+        "requested_formats": [{"format_id": "2"}],
+    }
+    # 原对象不变
+    assert "cookies" in info and "http_headers" in info["formats"][0]
+
+
+def test_url_expiry():
+    assert url_expiry("https://cdn.example.com/v.mp4?x-expires=1900000000&sig=a") == 1900000000.0
+    assert url_expiry("https://cdn.example.com/v.mp4?e=12") is None
+    assert url_expiry("https://cdn.example.com/v.mp4") is None
+    info = {"requested_formats": [{"url": "https://a?expire=1900000100"}, {"url": "https://b?expire=1900000000"}]}
+    assert info_expiry(info) == 1900000000.0
+
+
+def test_memory_cache_expiry_and_copy():
+    cache = ResolveCache()
+    value = {"url": "https://a"}
+    cache.put("douyin:1", value)
+    value["url"] = "changed"
+    assert cache.get("douyin:1") == {"url": "https://a"}
+    # 过期时间已在安全余量之内: 不写入
+    cache.put("douyin:2", {"url": "b"}, expires_at=time.time() + EXPIRY_MARGIN - 1)
+    assert cache.get("douyin:2") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction():
+    cache = ResolveCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_persistent_cache_permissions_and_reload(tmp_path):
+    path = str(tmp_path / "resolve_cache.sqlite3")
+    cache = ResolveCache(db_path=path)
+    cache.put("youtube:dQw4w9WgXcQ", {"title": "t"})
+    for name in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(name):
+            assert stat.S_IMODE(os.stat(name).st_mode) == 0o600
+    reloaded = ResolveCache(db_path=path)
+    assert reloaded.get("youtube:dQw4w9WgXcQ") == {"title": "t"}
+    reloaded.invalidate("youtube:dQw4w9WgXcQ")
+    assert ResolveCache(db_path=path).get("youtube:dQw4w9WgXcQ") is None
+
+
+def test_old_schema_is_cleared(tmp_path):
+    # 旧版本写入的记录可能含 Cookie, 升级后不再使用
+    path = str(tmp_path / "resolve_cache.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE resolve_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+    conn.execute("INSERT INTO resolve_cache VALUES (?, ?, ?)", ("k", '{"cookies": "secret"}', time.time() + 3600))
+    conn.commit()
+    conn.close()
+    cache = ResolveCache(db_path=path)
+    assert cache.get("k") is None
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    conn.close()
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="需要 /proc 统计打开的文件")
+def test_persistent_cache_closes_connections(tmp_path):
+    cache = ResolveCache(db_path=str(tmp_path / "resolve_cache.sqlite3"))
+    cache.put("warmup", {"n": 0})
+    cache.get("warmup")
+    before = len(os.listdir("/proc/self/fd"))
+    for n in range(50):
+        cache.put(f"k{n}", {"n": n})
+        cache._entries.clear()
+        assert cache.get(f"k{n}") == {"n": n}
+        cache.invalidate(f"k{n}")
+    assert len(os.listdir("/proc/self/fd")) <= before + 2
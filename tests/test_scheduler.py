@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from progress import ProgressBus
+from scheduler import DownloadJob, DownloadScheduler, QUEUED, RUNNING, DONE, CANCELLED
+
+VIDEO = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+VIDEO_SHORT = "https://youtu.be/dQw4w9WgXcQ"
+OTHER = "https://www.youtube.com/watch?v=9bZkp7q19f0"
+
+
+class FakeExtractor:
+    """代替 VideoExtractor: 记录调用, 在 gate 打开 (或任务被取消) 前保持下载中"""
+    def __init__(self, calls, gate):
+        self.calls = calls
+        self.gate = gate
+        self.last_error = None
+        self.last_output = None
+        self.pending_postprocess = None
+        self.cancel_event = None
+        self.task_id = None
+        self.status_callback = None
+        self.stage_callback = None
+        self.bandwidth = None
+
+    async def extract_async(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None,
+                            defer_postprocess=False):
+        self.calls.append((url, resolution, convert_to_mp4))
+        while not self.gate.is_set():
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self.last_error = "已取消"
+                return False
+            await asyncio.sleep(0.01)
+        self.last_output = f"/downloads/{url.rsplit('=', 1)[-1]}-{resolution}.{'mp4' if convert_to_mp4 else 'webm'}"
+        return True
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(workers=4, per_host=2):
+        calls = []
+        gate = threading.Event()
+        scheduler = DownloadScheduler(workers=workers, per_host=per_host,
+                                      extractor_factory=lambda: FakeExtractor(calls, gate),
+                                      log=lambda msg: None, progress_bus=ProgressBus())
+        schedulers.append((scheduler, gate))
+        return scheduler, calls, gate
+
+    yield make
+    for scheduler, gate in schedulers:
+        gate.set()
+        scheduler.shutdown()
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_flight_key():
+    job = DownloadJob(VIDEO, convert_to_mp4=True, resolution='1080')
+    assert job.flight_key == ("youtube:dQw4w9WgXcQ", "1080", True)
+    assert DownloadJob(VIDEO_SHORT).flight_key == job.flight_key
+    assert DownloadJob(VIDEO, resolution='720').flight_key != job.flight_key
+    assert DownloadJob(VIDEO, convert_to_mp4=False).flight_key != job.flight_key
+    assert DownloadJob("https://example.com/a.mp4").flight_key is None
+
+
+def test_duplicates_share_one_download(make_scheduler):
+    scheduler, calls, gate = make_scheduler(per_host=4)
+    leader = scheduler.submit(VIDEO)
+    duplicate = scheduler.submit(VIDEO_SHORT)
+    other_resolution = scheduler.submit(VIDEO, resolution='720')
+    other_container = scheduler.submit(VIDEO, convert_to_mp4=False)
+    assert duplicate.leader is leader
+    assert other_resolution.leader is None and other_container.leader is None
+
+    scheduler.start()
+    assert wait_for(lambda: len(calls) == 3)
+    gate.set()
+    scheduler.close()
+    scheduler.join()
+
+    assert sorted((resolution, mp4) for _, resolution, mp4 in calls) == [('1080', False), ('1080', True),
+                                                                         ('720', True)]
+    assert duplicate.state == DONE and duplicate.success
+    assert duplicate.output_path == leader.output_path
+    assert other_resolution.output_path != leader.output_path
+    assert scheduler.summary()["coalesced"] == 1
+    # 完成后同一视频可以重新下载
+    assert not scheduler._inflight
+
+
+def test_duplicate_after_completion_downloads_again(make_scheduler):
+    scheduler, calls, gate = make_scheduler()
+    gate.set()
+    scheduler.start()
+    first = scheduler.submit(VIDEO)
+    assert first.done_event.wait(5)
+    second = scheduler.submit(VIDEO)
+    assert second.leader is None
+    assert second.done_event.wait(5)
+    assert len(calls) == 2
+
+
+def test_cancel_queued_job(make_scheduler):
+    scheduler, calls, gate = make_scheduler(workers=1, per_host=1)
+    running = scheduler.submit(VIDEO)
+    queued = scheduler.submit(OTHER)
+    scheduler.start()
+    assert wait_for(lambda: running.state == RUNNING)
+    assert queued.state == QUEUED
+
+    assert scheduler.cancel_job(queued)
+    assert queued.state == CANCELLED and queued.done_event.is_set()
+    assert not scheduler.cancel_job(queued)
+
+    gate.set()
+    scheduler.close()
+    scheduler.join()
+    assert running.state == DONE
+    assert [url for url, _, _ in calls] == [VIDEO]
+
+
+def test_cancel_running_job(make_scheduler):
+    scheduler, calls, gate = make_scheduler()
+    job = scheduler.submit(VIDEO)
+    scheduler.start()
+    assert wait_for(lambda: len(calls) == 1)
+
+    assert scheduler.cancel_job(job)
+    assert job.done_event.wait(5)
+    assert job.state == CANCELLED
+    assert job.error == "已取消"
+    assert not scheduler._inflight
+
+
+def test_cancel_duplicate_keeps_leader(make_scheduler):
+    scheduler, calls, gate = make_scheduler()
+    leader = scheduler.submit(VIDEO)
+    duplicate = scheduler.submit(VIDEO)
+    scheduler.start()
+    assert wait_for(lambda: len(calls) == 1)
+
+    assert scheduler.cancel_job(duplicate)
+    assert duplicate.state == CANCELLED
+    assert duplicate not in leader.followers
+
+    gate.set()
+    scheduler.close()
+    scheduler.join()
+    assert leader.state == DONE
+    assert len(calls) == 1
+
+
+def test_cancel_leader_cancels_duplicates(make_scheduler):
+    scheduler, calls, gate = make_scheduler()
+    leader = scheduler.submit(VIDEO)
+    duplicate = scheduler.submit(VIDEO)
+    scheduler.start()
+    assert wait_for(lambda: len(calls) == 1)
+
+    scheduler.cancel_job(leader)
+    assert duplicate.done_event.wait(5)
+    assert leader.state == CANCELLED
+    assert duplicate.state == CANCELLED
+    assert not duplicate.success
+
+
+def test_per_host_limit(make_scheduler):
+    scheduler, calls, gate = make_scheduler(workers=4, per_host=1)
+    first = scheduler.submit(VIDEO)
+    second = scheduler.submit(OTHER)
+    other_host = scheduler.submit("https://www.bilibili.com/video/BV1xx411c7mD")
+    scheduler.start()
+    assert wait_for(lambda: len(calls) == 2)
+    assert first.state == RUNNING and other_host.state == RUNNING
+    assert second.state == QUEUED
+    gate.set()
+    scheduler.close()
+    scheduler.join()
+    assert all(job.state == DONE for job in (first, second, other_host))
+
+
+def test_run_unsubscribes_from_progress_bus():
+    bus = ProgressBus()
+    gate = threading.Event()
+    gate.set()
+    scheduler = DownloadScheduler(workers=1, extractor_factory=lambda: FakeExtractor([], gate),
+                                  log=lambda msg: None, progress_bus=bus)
+    assert scheduler._on_progress in bus._raw
+    scheduler.submit(VIDEO)
+    scheduler.run()
+    assert scheduler._on_progress not in bus._raw
+    scheduler.shutdown()
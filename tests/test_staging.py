@@ -0,0 +1,61 @@
+import os
+
+from staging import JobStaging, move_unique
+
+
+def _staged(staging, name, data):
+    path = os.path.join(staging.path, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_publish_moves_into_download_dir(tmp_path):
+    staging = JobStaging(str(tmp_path), "youtube:abc")
+    target = staging.publish(_staged(staging, "Title [abc].mp4", b"a"))
+    assert target == str(tmp_path / "Title [abc].mp4")
+    assert (tmp_path / "Title [abc].mp4").read_bytes() == b"a"
+    assert os.listdir(staging.path) == []
+
+
+def test_publish_does_not_overwrite(tmp_path):
+    (tmp_path / "Title.mp4").write_bytes(b"existing")
+    first = JobStaging(str(tmp_path), "url:a")
+    second = JobStaging(str(tmp_path), "url:b")
+    assert first.publish(_staged(first, "Title.mp4", b"first")) == str(tmp_path / "Title (1).mp4")
+    assert second.publish(_staged(second, "Title.mp4", b"second")) == str(tmp_path / "Title (2).mp4")
+    assert (tmp_path / "Title.mp4").read_bytes() == b"existing"
+    assert (tmp_path / "Title (1).mp4").read_bytes() == b"first"
+    assert (tmp_path / "Title (2).mp4").read_bytes() == b"second"
+
+
+def test_publish_without_hard_links(tmp_path, monkeypatch):
+    def no_link(src, dst):
+        raise PermissionError("hard links not supported")
+
+    monkeypatch.setattr(os, "link", no_link)
+    (tmp_path / "Title.mp4").write_bytes(b"existing")
+    staging = JobStaging(str(tmp_path), "url:a")
+    assert staging.publish(_staged(staging, "Title.mp4", b"new")) == str(tmp_path / "Title (1).mp4")
+    assert (tmp_path / "Title.mp4").read_bytes() == b"existing"
+
+
+def test_publish_ignores_files_outside_staging(tmp_path):
+    staging = JobStaging(str(tmp_path), "url:a")
+    outside = tmp_path / "elsewhere.mp4"
+    outside.write_bytes(b"x")
+    assert staging.publish(str(outside)) == str(outside)
+    assert staging.publish(None) is None
+
+
+def test_merged_path_strips_format_suffix(tmp_path):
+    staging = JobStaging(str(tmp_path), "youtube:abc")
+    assert staging.merged_path("/x/Title [abc].f137.mp4") == os.path.join(staging.path, "Title [abc].mp4")
+
+
+def test_move_unique_with_new_name(tmp_path):
+    source = tmp_path / "v.temp.mp4"
+    source.write_bytes(b"new")
+    (tmp_path / "v.mp4").write_bytes(b"existing")
+    assert move_unique(str(source), str(tmp_path), "v.mp4") == str(tmp_path / "v (1).mp4")
+    assert not source.exists()
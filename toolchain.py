@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+import threading
+
+from paths import cache_path
+
+# 常见硬件 H.264 编码器 (按优先级)
+HW_H264_ENCODERS = (
+    'h264_videotoolbox', # macOS
+    'h264_nvenc',        # NVIDIA
+    'h264_qsv',          # Intel Quick Sync
+    'h264_amf',          # AMD
+    'h264_vaapi',        # Linux VA-API
+)
+
+# 常见系统路径列表 (macOS/Linux)
+EXTRA_BIN_DIRS = [
+    "/usr/local/bin",
+    "/opt/homebrew/bin",
+    "/opt/local/bin",
+    "/usr/bin",
+    "/bin",
+    os.path.join(os.path.expanduser("~"), "bin"),
+]
+
+CACHE_FILE = "toolchain.json"
+
+_lock = threading.Lock()
+_toolchain = None
+_path_ready = False
+
+
+class Toolchain:
+    """
+    FFmpeg / FFprobe 探测结果
+    转码与合并逻辑据此选择策略, 无需重复探测
+    """
+    def __init__(self, ffmpeg=None, ffprobe=None, version=None, encoders=(), muxers=()):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.version = version
+        self.encoders = set(encoders)
+        self.muxers = set(muxers)
+
+    @property
+    def available(self):
+        return bool(self.ffmpeg)
+
+    def has_encoder(self, name):
+        return name in self.encoders
+
+    def has_muxer(self, name):
+        return name in self.muxers
+
+    @property
+    def hw_encoders(self):
+        return [e for e in HW_H264_ENCODERS if e in self.encoders]
+
+    def h264_encoder(self):
+        """优先 libx264, 缺失时回退到可用的硬件编码器"""
+        if 'libx264' in self.encoders:
+            return 'libx264'
+        hw = self.hw_encoders
+        if hw:
+            return hw[0]
+        return None
+
+    def to_dict(self):
+        return {
+            "ffmpeg": self.ffmpeg,
+            "ffprobe": self.ffprobe,
+            "version": self.version,
+            "encoders": sorted(self.encoders),
+            "muxers": sorted(self.muxers),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            ffmpeg=data.get("ffmpeg"),
+            ffprobe=data.get("ffprobe"),
+            version=data.get("version"),
+            encoders=data.get("encoders", ()),
+            muxers=data.get("muxers", ()),
+        )
+
+
+def ensure_search_path():
+    """
+    将内置/常见的 FFmpeg 目录加入 PATH (每个进程只执行一次)
+    yt-dlp 的合并后处理同样依赖 PATH 查找 ffmpeg
+    """
+    global _path_ready
+    if _path_ready:
+        return
+
+    # 1. 优先尝试 PyInstaller 打包后的内置路径
+    if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
+        bundle_bin = os.path.join(sys._MEIPASS, "bin")
+        if os.path.exists(bundle_bin) and bundle_bin not in os.environ.get("PATH", ""):
+            os.environ["PATH"] = bundle_bin + os.pathsep + os.environ.get("PATH", "")
+
+    # 2. 尝试将常见系统路径添加到 PATH
+    current_path = os.environ.get("PATH", "")
+    for p in EXTRA_BIN_DIRS:
+        if os.path.exists(p) and p not in current_path:
+            os.environ["PATH"] += os.pathsep + p
+
+    _path_ready = True
+
+
+def _cache_key(ffmpeg, ffprobe):
+    parts = []
+    for path in (ffmpeg, ffprobe):
+        try:
+            parts.append(f"{path}:{os.path.getmtime(path)}")
+        except (OSError, TypeError):
+            parts.append(f"{path}:-")
+    return "|".join(parts)
+
+
+def _run(cmd):
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+    return result.stdout
+
+
+def _parse_table(output, flag_char):
+    """
+    解析 `ffmpeg -encoders` / `ffmpeg -muxers` 的输出
+    表头以 '--' 分隔线结束, 之后每行为: 标志位 名称 描述
+    """
+    names = set()
+    started = False
+    for line in output.splitlines():
+        line = line.strip()
+        if not started:
+            if line.startswith("--"):
+                started = True
+            continue
+        fields = line.split(None, 2)
+        if len(fields) < 2 or (flag_char and flag_char not in fields[0]):
+            continue
+        for name in fields[1].split(","):
+            names.add(name)
+    return names
+
+
+def _probe(ffmpeg, ffprobe):
+    version = None
+    encoders = set()
+    muxers = set()
+    try:
+        first_line = _run([ffmpeg, '-hide_banner', '-version']).splitlines()[:1]
+        if first_line:
+            # "ffmpeg version 6.1.1 Copyright ..."
+            fields = first_line[0].split()
+            if len(fields) >= 3:
+                version = fields[2]
+        encoders = _parse_table(_run([ffmpeg, '-hide_banner', '-encoders']), None)
+        muxers = _parse_table(_run([ffmpeg, '-hide_banner', '-muxers']), 'E')
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return Toolchain(ffmpeg, ffprobe, version, encoders, muxers)
+
+
+def _load_disk_cache(key):
+    try:
+        with open(cache_path(CACHE_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("key") == key:
+            return Toolchain.from_dict(data.get("toolchain", {}))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _save_disk_cache(key, toolchain):
+    try:
+        tmp = cache_path(CACHE_FILE + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"key": key, "toolchain": toolchain.to_dict()}, f)
+        os.replace(tmp, cache_path(CACHE_FILE))
+    except OSError:
+        pass
+
+
+def get_toolchain(disk_cache=True, refresh=False):
+    """
+    返回进程级缓存的工具链信息
+    disk_cache: 按 ffmpeg/ffprobe 路径与修改时间缓存到磁盘, 下次启动免探测
+    refresh: 强制重新探测
+    """
+    global _toolchain
+    with _lock:
+        if _toolchain is not None and not refresh:
+            return _toolchain
+
+        ensure_search_path()
+        ffmpeg = shutil.which("ffmpeg")
+        ffprobe = shutil.which("ffprobe")
+        if not ffmpeg:
+            _toolchain = Toolchain(None, ffprobe)
+            return _toolchain
+
+        key = _cache_key(ffmpeg, ffprobe)
+        toolchain = None
+        if disk_cache and not refresh:
+            toolchain = _load_disk_cache(key)
+        if toolchain is None:
+            toolchain = _probe(ffmpeg, ffprobe)
+            if disk_cache and toolchain.version:
+                _save_disk_cache(key, toolchain)
+
+        _toolchain = toolchain
+        return _toolchain
@@ -0,0 +1,367 @@
+import os
+import json
+import queue
+import asyncio
+import threading
+import subprocess
+
+# 可以直接封装进 MP4 容器的编码 (无需重新编码)
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'opus', 'alac', 'ac3', 'eac3'}
+
+
+def probe_streams(toolchain, path):
+    """
+    使用 ffprobe 读取文件中的音视频流信息
+    返回 [{'index': 0, 'codec_type': 'video', 'codec_name': 'h264', ...}], 失败时返回 None
+    """
+    if not toolchain.ffprobe:
+        return None
+    cmd = [
+        toolchain.ffprobe, '-v', 'error',
+        '-show_entries', 'stream=index,codec_type,codec_name:stream_disposition=attached_pic',
+        '-of', 'json', path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            return None
+        return json.loads(result.stdout).get("streams", [])
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def probe_tags(toolchain, path):
+    """读取容器级元数据标签 (如 comment), 失败时返回 None"""
+    if not toolchain.ffprobe:
+        return None
+    cmd = [toolchain.ffprobe, '-v', 'error', '-show_entries', 'format_tags', '-of', 'json', path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            return None
+        tags = json.loads(result.stdout).get("format", {}).get("tags", {})
+        return {k.lower(): v for k, v in tags.items()}
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def _pick_stream(streams_per_input, codec_type):
+    """在所有输入中找到第一个指定类型的流, 返回 (输入序号, 流信息)"""
+    for input_idx, streams in enumerate(streams_per_input):
+        for stream in streams or []:
+            if stream.get("codec_type") != codec_type:
+                continue
+            # 跳过内嵌封面图
+            if stream.get("disposition", {}).get("attached_pic"):
+                continue
+            return input_idx, stream
+    return None, None
+
+
+class Mp4Plan:
+    """
+    MP4 输出方案: 兼容的流直接复制, 仅重新编码不兼容的流
+    """
+    def __init__(self, inputs, maps, video_args, audio_args, video_codec=None, audio_codec=None):
+        self.inputs = inputs
+        self.maps = maps
+        self.video_args = video_args
+        self.audio_args = audio_args
+        self.video_codec = video_codec
+        self.audio_codec = audio_codec
+
+    @property
+    def copy_video(self):
+        return self.video_args[:2] == ['-c:v', 'copy']
+
+    @property
+    def copy_audio(self):
+        return self.audio_args[:2] == ['-c:a', 'copy']
+
+    @property
+    def is_remux(self):
+        """所有流均复制 (纯封装转换, 几乎不耗 CPU)"""
+        return (not self.video_args or self.copy_video) and (not self.audio_args or self.copy_audio)
+
+    def command(self, ffmpeg, output_path, input_args=None, threads=None, stats=True, metadata=None):
+        """
+        构建 ffmpeg 命令
+        input_args: 替换默认的 ['-i', path, ...] (例如从管道读取时使用 ['-i', 'pipe:0'])
+        threads: 限制编码线程数 (仅在需要重新编码时有意义)
+        stats: 是否输出转码进度 (由程序读取 stderr 时关闭)
+        metadata: 写入输出文件的元数据标签 (例如 {'comment': 来源链接}, 用于重建下载索引)
+        """
+        cmd = [ffmpeg or 'ffmpeg', '-y']
+        if input_args is None:
+            input_args = []
+            for path in self.inputs:
+                input_args += ['-i', path]
+        cmd += input_args
+        cmd += self.maps + self.video_args + self.audio_args
+        if threads and not self.is_remux:
+            cmd += ['-threads', str(threads)]
+        for key, value in (metadata or {}).items():
+            if value:
+                cmd += ['-metadata', f'{key}={value}']
+        cmd += ['-movflags', '+faststart', '-loglevel', 'error', '-stats' if stats else '-nostats', output_path]
+        return cmd
+
+    def describe(self):
+        parts = []
+        if self.video_args:
+            action = "复制" if self.copy_video else f"转码 {self.video_args[1]}"
+            parts.append(f"视频: {action} ({self.video_codec or '?'})")
+        if self.audio_args:
+            action = "复制" if self.copy_audio else f"转码 {self.audio_args[1]}"
+            parts.append(f"音频: {action} ({self.audio_codec or '?'})")
+        return " | ".join(parts)
+
+
+def _map_spec(input_idx, stream, kind):
+    """ffmpeg -map 参数: 有流序号时精确指定, 否则取该类型的第一条流 (optional 时允许不存在)"""
+    if 'index' in stream:
+        return f"{input_idx}:{stream['index']}"
+    return f"{input_idx}:{kind}:0" + ("?" if stream.get("optional") else "")
+
+
+def plan_from_streams(toolchain, inputs, streams_per_input):
+    """
+    根据流信息生成 MP4 方案
+    streams_per_input 与 inputs 一一对应, 每项为 ffprobe 风格的流列表
+    """
+    v_input, v_stream = _pick_stream(streams_per_input, "video")
+    a_input, a_stream = _pick_stream(streams_per_input, "audio")
+
+    maps = []
+    video_args = []
+    audio_args = []
+    video_codec = audio_codec = None
+
+    if v_stream is not None:
+        video_codec = v_stream.get("codec_name")
+        maps += ['-map', _map_spec(v_input, v_stream, 'v')]
+        if video_codec in MP4_VIDEO_CODECS:
+            video_args = ['-c:v', 'copy']
+            if video_codec == 'hevc':
+                # Apple 设备要求 HEVC 使用 hvc1 标签
+                video_args += ['-tag:v', 'hvc1']
+        else:
+            encoder = toolchain.h264_encoder() or 'libx264'
+            video_args = ['-c:v', encoder]
+            if encoder == 'libx264':
+                video_args += ['-crf', '23', '-preset', 'fast']
+
+    if a_stream is not None:
+        audio_codec = a_stream.get("codec_name")
+        maps += ['-map', _map_spec(a_input, a_stream, 'a')]
+        if audio_codec in MP4_AUDIO_CODECS:
+            audio_args = ['-c:a', 'copy']
+            if audio_codec == 'opus':
+                # 旧版 FFmpeg 将 MP4 中的 Opus 视为实验特性
+                audio_args += ['-strict', 'experimental']
+        else:
+            audio_args = ['-c:a', 'aac']
+
+    return Mp4Plan(inputs, maps, video_args, audio_args, video_codec, audio_codec)
+
+
+# yt-dlp 的编码标识 (如 avc1.64001F / mp4a.40.2) → ffprobe 的 codec_name
+_YTDLP_CODEC_PREFIXES = (
+    ('avc', 'h264'), ('h264', 'h264'),
+    ('hev', 'hevc'), ('hvc', 'hevc'), ('h265', 'hevc'),
+    ('av01', 'av1'), ('av1', 'av1'),
+    ('vp09', 'vp9'), ('vp9', 'vp9'), ('vp8', 'vp8'),
+    ('mp4a', 'aac'), ('aac', 'aac'),
+    ('opus', 'opus'), ('vorbis', 'vorbis'), ('mp3', 'mp3'),
+    ('ac-3', 'ac3'), ('ac3', 'ac3'), ('ec-3', 'eac3'), ('eac3', 'eac3'),
+)
+
+
+def _normalize_codec(codec):
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    for prefix, name in _YTDLP_CODEC_PREFIXES:
+        if codec.startswith(prefix):
+            return name
+    return codec
+
+
+def plan_from_info(toolchain, info, inputs=('pipe:0',)):
+    """
+    根据 yt-dlp 信息字典中的 vcodec/acodec 生成方案 (无需 ffprobe, 适用于尚未下载的流)
+    编码未知时退回保守方案
+    """
+    vcodec = _normalize_codec(info.get('vcodec'))
+    acodec = _normalize_codec(info.get('acodec'))
+    if not vcodec:
+        return fallback_plan(toolchain, list(inputs))
+    streams = [{"codec_type": "video", "codec_name": vcodec}]
+    if acodec:
+        streams.append({"codec_type": "audio", "codec_name": acodec})
+    elif info.get('acodec') != 'none':
+        # 音频编码未知 (yt-dlp 用 'none' 表示确实无音轨): 若存在则转码 AAC
+        streams.append({"codec_type": "audio", "codec_name": None, "optional": True})
+    return plan_from_streams(toolchain, list(inputs), [streams])
+
+
+def plan_mp4(toolchain, inputs):
+    """
+    探测输入文件并生成 MP4 方案
+    无法探测 (缺少 ffprobe 或文件损坏) 时退回到完整转码, 与旧行为一致
+    """
+    streams_per_input = []
+    for path in inputs:
+        streams = probe_streams(toolchain, path)
+        if streams is None:
+            return fallback_plan(toolchain, inputs)
+        streams_per_input.append(streams)
+    return plan_from_streams(toolchain, inputs, streams_per_input)
+
+
+def fallback_plan(toolchain, inputs):
+    """未知编码时的保守方案: 视频 H.264 + 音频 AAC"""
+    encoder = toolchain.h264_encoder() or 'libx264'
+    video_args = ['-c:v', encoder]
+    if encoder == 'libx264':
+        video_args += ['-crf', '23', '-preset', 'fast']
+    maps = []
+    if len(inputs) > 1:
+        # 分轨合并: 第一个输入取视频 (保持原有的视频流复制), 第二个输入取音频
+        maps = ['-map', '0:v:0', '-map', '1:a:0']
+        video_args = ['-c:v', 'copy']
+    return Mp4Plan(inputs, maps, video_args, ['-c:a', 'aac'])
+
+
+class TranscodePool:
+    """
+    转码阶段的执行池 (合并 / 转 MP4)
+    实际工作由 ffmpeg 子进程完成, 这里的线程只负责启动和等待子进程
+    - cpu_budget: 分配给转码的 CPU 核数, 决定并发 ffmpeg 进程数与每个进程的线程数
+    - queue_size: 等待转码的任务上限, 队列满时 submit 阻塞, 对下载阶段形成背压
+    """
+    def __init__(self, cpu_budget=None, workers=None, queue_size=None):
+        cores = os.cpu_count() or 2
+        self.cpu_budget = max(1, int(cpu_budget or cores))
+        # 每个 ffmpeg 进程至少分到 2 个线程
+        self.workers = max(1, int(workers or self.cpu_budget // 2))
+        self.threads_per_job = max(1, self.cpu_budget // self.workers)
+        self._queue = queue.Queue(maxsize=queue_size or self.workers * 2)
+        self._lock = threading.Lock()
+        self._running = 0
+        self.closed = False
+        self._threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"transcode-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn, callback=None):
+        """
+        提交后处理任务: fn(threads) -> 结果, 完成后调用 callback(result, error)
+        队列已满时阻塞
+        """
+        self._queue.put((fn, callback))
+
+    def call(self, fn):
+        """同步提交并等待结果 (fn 抛出的异常原样抛出), 供线程池中的下载步骤运行 ffmpeg 使用"""
+        done = threading.Event()
+        outcome = []
+
+        def callback(result, error):
+            outcome.append((result, error))
+            done.set()
+
+        self.submit(fn, callback)
+        done.wait()
+        result, error = outcome[0]
+        if error is not None:
+            raise error
+        return result
+
+    async def run(self, fn):
+        """
+        异步提交并等待结果 (异步提取核心使用)
+        队列已满时的等待放在 blocking 线程池中, 不阻塞事件循环
+        """
+        from executors import run_blocking
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def settle(result, error):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        def callback(result, error):
+            loop.call_soon_threadsafe(settle, result, error)
+
+        await run_blocking(self.submit, fn, callback)
+        return await future
+
+    def depth(self):
+        with self._lock:
+            return {"queued": self._queue.qsize(), "running": self._running}
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            fn, callback = item
+            with self._lock:
+                self._running += 1
+            result, error = None, None
+            try:
+                result = fn(self.threads_per_job)
+            except Exception as e:
+                error = e
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+            if callback:
+                try:
+                    callback(result, error)
+                except Exception:
+                    pass
+
+    def shutdown(self, wait=True):
+        self.closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+
+_pool_lock = threading.Lock()
+_shared_pool = None
+
+
+def configure_transcode_pool(cpu_budget=None):
+    """
+    按 CPU 预算重建共享的转码池并返回 (调度器的后处理阶段与提取器的流式转码共用同一预算)
+    旧的转码池在已提交的工作完成后退出
+    """
+    global _shared_pool
+    with _pool_lock:
+        if _shared_pool is not None and not _shared_pool.closed:
+            _shared_pool.shutdown(wait=False)
+        _shared_pool = TranscodePool(cpu_budget=cpu_budget)
+        return _shared_pool
+
+
+def get_transcode_pool():
+    """进程内共享的转码池 (默认使用全部 CPU 核心作为预算)"""
+    global _shared_pool
+    with _pool_lock:
+        if _shared_pool is None or _shared_pool.closed:
+            _shared_pool = TranscodePool()
+        return _shared_pool
@@ -2,86 +2,183 @@ import sys
 import os
 import re
 import json
-from curl_cffi import requests as cffi_requests # 使用 curl_cffi 绕过 TLS 指纹
+import time
+import threading
+from contextlib import nullcontext
+from toolchain import get_toolchain
+from canonical import cache_key, canonical_id, host_key, is_short_link, expand_short_link_async
+from archive import get_archive, info_archive_key
+from staging import JobStaging, move_unique
+from rate_limit import get_rate_limiter, is_throttled
+from cookie_cache import get_cookie_cache
+from formats import build_format_selector, parse_resolution, parse_size, platform_of, estimate_savings, savings
+from resolve_cache import get_resolve_cache, configure_resolve_cache, url_expiry, info_expiry, strip_credentials
+from paths import cache_path
+from bandwidth import configure_bandwidth, get_bandwidth_manager
+from fragments import get_fragment_tuner, is_backoff_error
+from journal import STAGE_DOWNLOAD, STAGE_MERGE, STAGE_TRANSCODE, new_job_id
+from metrics import (JobTrace, get_metrics, configure_metrics, SPAN_EXPAND, SPAN_DOUYIN_PAGE, SPAN_MIRROR_PROBE,
+                     SPAN_RATE_WAIT, SPAN_METADATA, SPAN_DOWNLOAD, SPAN_STREAM, SPAN_QUEUE, SPAN_MERGE, SPAN_TRANSCODE,
+                     SPAN_PUBLISH, COUNTER_BYTES, COUNTER_RETRIES, COUNTER_CACHE_HITS, COUNTER_CACHE_MISSES)
+from executors import run_sync, run_blocking
+from transcode import plan_mp4, get_transcode_pool, configure_transcode_pool
+from progress import (get_progress_bus, ProgressEvent, ConsolePrinter, DownloadCancelled, PHASE_DOWNLOAD, PHASE_PROCESS,
+                      PHASE_DONE)
 # import yt_dlp # 移除顶层导入，优化启动速度
 
+# Douyin 移动端页面与直链使用的 User-Agent
+MOBILE_USER_AGENT = "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Mobile Safari/537.36"
+# Douyin 移动端分享页 (基准测试时指向本地服务器)
+DOUYIN_SHARE_URL = "https://www.iesdouyin.com/share/video/{video_id}/"
+# 不做流式转码的源容器 (MP4/MOV 族): 直接下载, 需要时再转码
+NON_STREAMABLE_EXTS = ('mp4', 'm4v', 'mov')
+
+class PostProcessTask:
+    """
+    下载完成后的处理步骤 (分轨合并 → 转为 MP4)
+    与下载阶段分离, 可以交给独立的转码池执行
+    """
+    def __init__(self, path, convert_to_mp4=True, merge_parts=None, fallback_path=None, strict=False,
+                 source_url=None, archive_key=None, staging=None):
+        self.path = path                    # 待处理文件 (需要合并时为合并输出路径)
+        self.convert_to_mp4 = convert_to_mp4
+        self.merge_parts = merge_parts      # (视频分轨, 音频分轨), 需要手动合并时设置
+        self.fallback_path = fallback_path  # 合并失败时保留的文件
+        self.strict = strict                # 转码失败即任务失败, 且不覆盖已存在的 MP4 (YouTube)
+        self.source_url = source_url        # 来源链接, 写入 MP4 的 comment 标签
+        self.archive_key = archive_key      # 下载索引中的键 (平台:视频 ID), 完成后记录
+        self.staging = staging              # 任务暂存目录 (JobStaging), 完成后将最终文件移入下载目录
+        self.output_path = None             # 最终文件路径
+
+    def to_dict(self):
+        """写入任务日志的形式 (进程重启后从合并/转码阶段继续)"""
+        return {
+            "path": self.path,
+            "convert_to_mp4": self.convert_to_mp4,
+            "merge_parts": list(self.merge_parts) if self.merge_parts else None,
+            "fallback_path": self.fallback_path,
+            "strict": self.strict,
+            "source_url": self.source_url,
+            "archive_key": self.archive_key,
+            "staging": [self.staging.download_dir, self.staging.key] if self.staging else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        staging = data.get("staging")
+        return cls(
+            data.get("path"),
+            convert_to_mp4=data.get("convert_to_mp4", True),
+            merge_parts=tuple(data["merge_parts"]) if data.get("merge_parts") else None,
+            fallback_path=data.get("fallback_path"),
+            strict=data.get("strict", False),
+            source_url=data.get("source_url"),
+            archive_key=data.get("archive_key"),
+            staging=JobStaging(*staging) if staging else None,
+        )
+
+    def ready(self):
+        """下载阶段的产物是否仍然存在 (不存在时需要重新下载)"""
+        if self.merge_parts:
+            return all(os.path.exists(p) for p in self.merge_parts)
+        return bool(self.path) and os.path.exists(self.path)
+
+def default_download_dir():
+    # 默认为用户下载目录下的 VideoDownloads 文件夹
+    return os.path.join(os.path.expanduser("~"), "Downloads", "VideoDownloads")
+
 class VideoExtractor:
-    def __init__(self, download_dir=None, progress_callback=None, status_callback=None):
+    def __init__(self, download_dir=None, progress_bus=None, status_callback=None, stream_transcode=False,
+                 max_bitrate=None, max_filesize=None, concurrent_fragments=None):
         if download_dir is None:
-            # 默认为用户下载目录下的 VideoDownloads 文件夹
-            download_dir = os.path.join(os.path.expanduser("~"), "Downloads", "VideoDownloads")
+            download_dir = default_download_dir()
             
         self.download_dir = download_dir
-        self.progress_callback = progress_callback # 用于同步进度的回调 (percent, speed, eta)
+        self.progress_bus = progress_bus or get_progress_bus() # 进度事件 (数值) 发布到总线, 由 GUI/命令行按固定频率显示
+        self.task_id = None # 进度事件中的任务标识 (调度器中为任务日志 ID)
         self.status_callback = status_callback     # 用于同步状态文字的回调
         self.last_error = None # 记录最后一次错误信息
+        self.pending_postprocess = None # defer_postprocess 模式下待执行的后处理
+        self.stream_transcode = stream_transcode # 单流资源边下载边转码, 不落地中间文件
+        self.last_resolve_latency = None # 最近一次 Douyin 页面请求耗时 (秒)
+        self.last_output = None # 最近一次任务的最终文件路径
+        self.max_bitrate = max_bitrate   # 格式总码率上限 (kbps)
+        self.max_filesize = max_filesize # 格式文件大小上限 (字节)
+        self.bandwidth = None # 全局带宽管理分配给当前任务的份额 (BandwidthShare), 由调度器设置
+        self._ydl_params = None
+        self._transferred = {}
+        self.concurrent_fragments = concurrent_fragments # HLS/DASH 分片并发数, None 为按站点自动调整
+        self.stage_callback = None # 任务进入新阶段时调用 (stage, task), 用于写入任务日志
+        self._fragment_sample = None
+        self.trace = None # 当前任务的阶段耗时与计数器 (JobTrace), 任务结束时汇总到 get_metrics()
+        self._metered_bytes = 0
+        self._deferred_at = None
+        self.cancel_event = None # 设置后 (threading.Event) 在下一次进度回调时中止当前任务, 由调度器设置
         
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
+
+        # 已下载视频索引 (平台+视频 ID → 文件), 下载前查询以跳过重复视频
+        self.archive = get_archive(self.download_dir)
         
-        # 检查 FFmpeg 是否可用 (增强路径检测)
-        import shutil
-        
-        # 1. 优先尝试 PyInstaller 打包后的内置路径
-        if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
-            bundle_bin = os.path.join(sys._MEIPASS, "bin")
-            if os.path.exists(bundle_bin) and bundle_bin not in os.environ.get("PATH", ""):
-                os.environ["PATH"] = bundle_bin + os.pathsep + os.environ.get("PATH", "")
-                # self._log(f"状态: 已加载内置 FFmpeg 路径")
-
-        # 2. 常见系统路径列表 (macOS/Linux)
-        possible_paths = [
-            "/usr/local/bin",
-            "/opt/homebrew/bin",
-            "/opt/local/bin",
-            "/usr/bin",
-            "/bin",
-            os.path.join(os.path.expanduser("~"), "bin")
-        ]
-        
-        # 尝试将这些路径添加到 PATH
-        current_path = os.environ.get("PATH", "")
-        for p in possible_paths:
-            if os.path.exists(p) and p not in current_path:
-                os.environ["PATH"] += os.pathsep + p
-                
-        if not shutil.which("ffmpeg"):
+        # 检查 FFmpeg 是否可用 (进程内只探测一次, 结果按二进制路径+修改时间缓存到磁盘)
+        self.toolchain = get_toolchain()
+        if not self.toolchain.available:
             self._log("警告: 系统中未检测到 FFmpeg，部分平台(如B站)可能无法下载高清或视频合并。")
-        else:
-            # self._log(f"FFmpeg 已就绪: {shutil.which('ffmpeg')}")
-            pass
 
     def _extract_douyin_video_url(self, original_url):
         """
         使用 curl_cffi 模拟移动端请求，解析 Douyin 真实播放地址
         绕过 yt-dlp 无法处理的 WAF/Signature
         """
+        info = self._resolve_douyin(original_url)
+        return info["url"] if info else None
+
+    def _resolve_douyin(self, original_url):
+        """
+        解析 Douyin 视频信息, 返回 {'video_id', 'title', 'url', 'urls'}, 失败时返回 None
+        urls 为 play_addr 中的全部 CDN 镜像, url 为第一个
+        """
+        return run_sync(self._resolve_douyin_async(original_url))
+
+    async def _resolve_douyin_async(self, original_url):
+        """_resolve_douyin 的异步版本: 页面请求使用 AsyncSession, 限流退避时不占用事件循环"""
+        from http_pool import get_async_session_pool
+
         try:
-            # 1. 提取 Video ID
-            video_id = ""
-            # 匹配 /video/73... based pattern
-            match = re.search(r'/video/(\d+)', original_url)
-            if match:
-                video_id = match.group(1)
-            else:
-                match = re.search(r'modal_id=(\d+)', original_url)
-                if match: video_id = match.group(1)
+            # 1. 提取 Video ID (/video/<id> 或 modal_id=<id>, 与调度器去重使用同一规则)
+            key = canonical_id(original_url) or ""
+            video_id = key.split(":", 1)[1] if key.startswith("douyin:") else ""
             
             if not video_id:
                 return None
 
+            # 重试或重复提交同一视频时直接使用缓存的直链 (按签名地址的过期时间失效)
+            cached = get_resolve_cache().get(f"direct:douyin:{video_id}")
+            if cached:
+                self._count(COUNTER_CACHE_HITS, kind="resolve")
+                self._log(f"状态: 命中解析缓存 (ID={video_id}), 跳过页面请求")
+                return cached
+            self._count(COUNTER_CACHE_MISSES, kind="resolve")
+
             self._log(f"状态: 尝试 Douyin 专用解析 (ID={video_id})")
             
             # 2. 构造移动端分享链接
-            mobile_url = f"https://www.iesdouyin.com/share/video/{video_id}/"
+            mobile_url = DOUYIN_SHARE_URL.format(video_id=video_id)
             
-            # 3. 使用 curl_cffi 请求
+            # 3. 使用 curl_cffi 请求 (共享 AsyncSession, 连续解析时复用已建立的连接)
+            # 按站点限速: 正常情况下不等待, 被风控后退避
+            limiter = get_rate_limiter()
+            waited = await limiter.acquire_async(mobile_url)
+            self._add_span(SPAN_RATE_WAIT, waited)
+            if waited > 0.05:
+                self._log(f"状态: Douyin 限流退避, 等待 {waited:.1f}s")
+            started = time.perf_counter()
             try:
-                response = cffi_requests.get(
+                response = await get_async_session_pool().get(
                     mobile_url,
-                    impersonate="chrome120",
                     headers={
-                        "User-Agent": "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Mobile Safari/537.36",
+                        "User-Agent": MOBILE_USER_AGENT,
                         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
                     },
                     allow_redirects=True,
@@ -90,95 +187,621 @@ class VideoExtractor:
             except Exception as net_err:
                 self._log(f"Douyin 解析连接失败: {net_err}")
                 return None
+            finally:
+                self.last_resolve_latency = time.perf_counter() - started
+                self._add_span(SPAN_DOUYIN_PAGE, self.last_resolve_latency)
+            self._log(f"状态: Douyin 页面请求耗时 {self.last_resolve_latency * 1000:.0f}ms")
+
+            # 429/403 或 byted_acrawler 验证页: 降低该站点的请求速率
+            if is_throttled(response.status_code, response.text):
+                limiter.report(mobile_url, throttled=True)
+                self._log("警告: Douyin 返回风控验证页, 已降低请求频率")
+                return None
+            limiter.report(mobile_url, throttled=False)
 
             if response.status_code != 200:
                 self._log(f"Douyin 解析请求返回: {response.status_code}")
                 return None
             
-            html = response.text
-            
-            # 4. 解析 _ROUTER_DATA
-            # 尝试更宽松的正则匹配 (移动端页面结构多变)
-            match_data = re.search(r'window\._ROUTER_DATA\s*=\s*(\{.*?\})(?:\s*;)?\s*</script>', html, re.DOTALL)
-            if not match_data:
-                 match_data = re.search(r'window\._ROUTER_DATA\s*=\s*(\{.*\})', html)
-            
-            if match_data:
-                json_str = match_data.group(1)
-                try:
-                    data = json.loads(json_str)
-                    loader_data = data.get("loaderData", {})
-                    
-                    video_info = None
-                    for key, val in loader_data.items():
-                        if isinstance(val, dict) and "videoInfoRes" in val:
-                            video_info = val["videoInfoRes"]
-                            break
-                    
-                    if video_info:
-                        if "item_list" in video_info and video_info["item_list"]:
-                            item = video_info["item_list"][0]
-                            play_addr = item.get("video", {}).get("play_addr", {})
-                            url_list = play_addr.get("url_list", [])
-                            
-                            if url_list:
-                                final_url = url_list[0]
-                                no_wm_url = final_url.replace("/playwm/", "/play/")
-                                self._log(f"状态: Douyin 直链解析成功")
-                                return no_wm_url
-                except Exception as parse_err:
-                    self._log(f"Douyin 数据解析警告: {parse_err}")
-            
-            # 5. 备用正则
-            raw_match = re.search(r'https://[^"]+/playwm/[^"]+', html)
-            if raw_match:
-                 self._log(f"状态: Douyin 直链匹配成功 (Regex)")
-                 return raw_match.group(0).replace("/playwm/", "/play/")
-                 
-            self._log("Douyin 解析失败: 未找到视频链接")
-            return None
+            return self._parse_douyin_page(video_id, response.text)
             
         except Exception as e:
             self._log(f"Douyin 解析异常: {e}")
             return None
 
+    def _parse_douyin_page(self, video_id, html):
+        """从移动端分享页提取播放地址, 成功时缓存并返回解析结果"""
+        # 4. 解析 _ROUTER_DATA
+        # 尝试更宽松的正则匹配 (移动端页面结构多变)
+        match_data = re.search(r'window\._ROUTER_DATA\s*=\s*(\{.*?\})(?:\s*;)?\s*</script>', html, re.DOTALL)
+        if not match_data:
+             match_data = re.search(r'window\._ROUTER_DATA\s*=\s*(\{.*\})', html)
+        
+        if match_data:
+            json_str = match_data.group(1)
+            try:
+                data = json.loads(json_str)
+                loader_data = data.get("loaderData", {})
+                
+                video_info = None
+                for key, val in loader_data.items():
+                    if isinstance(val, dict) and "videoInfoRes" in val:
+                        video_info = val["videoInfoRes"]
+                        break
+                
+                if video_info:
+                    if "item_list" in video_info and video_info["item_list"]:
+                        item = video_info["item_list"][0]
+                        play_addr = item.get("video", {}).get("play_addr", {})
+                        url_list = play_addr.get("url_list", [])
+                        
+                        if url_list:
+                            no_wm_urls = [u.replace("/playwm/", "/play/") for u in url_list]
+                            self._log(f"状态: Douyin 直链解析成功 ({len(no_wm_urls)} 个镜像)")
+                            return self._cache_douyin({
+                                "video_id": video_id,
+                                "title": item.get("desc") or video_id,
+                                "url": no_wm_urls[0],
+                                "urls": no_wm_urls,
+                            })
+            except Exception as parse_err:
+                self._log(f"Douyin 数据解析警告: {parse_err}")
+        
+        # 5. 备用正则
+        raw_matches = re.findall(r'https://[^"]+/playwm/[^"]+', html)
+        if raw_matches:
+             self._log(f"状态: Douyin 直链匹配成功 (Regex)")
+             no_wm_urls = list(dict.fromkeys(u.replace("/playwm/", "/play/") for u in raw_matches))
+             return self._cache_douyin({
+                 "video_id": video_id,
+                 "title": video_id,
+                 "url": no_wm_urls[0],
+                 "urls": no_wm_urls,
+             })
+             
+        self._log("Douyin 解析失败: 未找到视频链接")
+        return None
+
+    def _cache_douyin(self, douyin):
+        """缓存 Douyin 解析结果, 有效期取所有镜像中最早的过期时间"""
+        expiries = [e for e in (url_expiry(u) for u in douyin["urls"]) if e]
+        get_resolve_cache().put(f"direct:douyin:{douyin['video_id']}", douyin, min(expiries) if expiries else None)
+        return douyin
+
+    def _extract_info_cached(self, ydl, url, refresh=False):
+        """
+        解析但不下载, 单个视频的信息字典按规范化视频 ID 缓存
+        返回 (info, from_cache); 之后交给 process_ie_result 下载, 无需重复解析
+        """
+        key = f"info:{cache_key(url)}"
+        cache = get_resolve_cache()
+        if refresh:
+            cache.invalidate(key)
+        else:
+            info = cache.get(key)
+            if info:
+                self._count(COUNTER_CACHE_HITS, kind="resolve")
+                self._log("状态: 命中解析缓存, 跳过解析")
+                return info, True
+        self._count(COUNTER_CACHE_MISSES, kind="resolve")
+
+        waited = get_rate_limiter().acquire(url)
+        self._add_span(SPAN_RATE_WAIT, waited)
+        if waited > 0.05:
+            self._log(f"状态: 站点限流退避, 等待 {waited:.1f}s")
+        with self._span(SPAN_METADATA):
+            info = ydl.extract_info(url, download=False)
+        if info:
+            self._report_savings(info)
+        # 播放列表等包含 entries 的结果不缓存 (清理后 entries 会被移除)
+        # Cookie 与请求头不进入缓存 (缓存可能持久化到磁盘), 下载时由 yt-dlp 重新计算
+        if info and info.get('_type', 'video') == 'video':
+            try:
+                cache.put(key, strip_credentials(ydl.sanitize_info(info, remove_private_keys=True)), info_expiry(info))
+            except Exception:
+                pass
+        return info, False
+
+    def _download_info(self, ydl, url, info, from_cache):
+        """按解析结果下载; 来自缓存的地址已失效时重新解析一次"""
+        self._stage(STAGE_DOWNLOAD)
+        if not from_cache:
+            with self._span(SPAN_DOWNLOAD):
+                return ydl.process_ie_result(info, download=True)
+        try:
+            with self._span(SPAN_DOWNLOAD):
+                result = ydl.process_ie_result(info, download=True)
+            if result and any(os.path.exists(d.get('filepath') or '') for d in result.get('requested_downloads') or []):
+                return result
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            self._log(f"提示: 使用缓存的解析结果下载失败: {e}")
+        self._log("状态: 缓存的解析结果已失效, 重新解析")
+        self._count(COUNTER_RETRIES, kind="resolve")
+        info, _ = self._extract_info_cached(ydl, url, refresh=True)
+        if not info:
+            return None
+        with self._span(SPAN_DOWNLOAD):
+            return ydl.process_ie_result(info, download=True)
+
+    def _stage(self, stage, task=None):
+        if self.stage_callback:
+            self.stage_callback(stage, task)
+
+    def _span(self, name):
+        """当前任务的阶段计时 (没有进行中的任务时不记录)"""
+        return self.trace.span(name) if self.trace is not None else nullcontext()
+
+    def _add_span(self, name, duration):
+        if self.trace is not None:
+            self.trace.add_span(name, duration)
+
+    def _count(self, name, value=1, kind=None):
+        if self.trace is not None:
+            self.trace.count(name, value, kind)
+
+    def _finish_trace(self, success):
+        """任务结束: 耗时与计数器汇总到进程内指标并导出, --profile 时输出耗时分析"""
+        trace, self.trace = self.trace, None
+        if trace is None:
+            return
+        trace.finish(success)
+        metrics = get_metrics()
+        metrics.record(trace)
+        if metrics.profile:
+            self._log(trace.format_profile())
+
+    def _skip_archived(self, key):
+        """视频已在下载索引中且文件仍存在时跳过, 返回是否跳过"""
+        record = self.archive.lookup(key)
+        if not record:
+            return False
+        self.last_output = record["path"]
+        self._count(COUNTER_CACHE_HITS, kind="archive")
+        self._log(f"状态: 已下载过，跳过 ({os.path.basename(record['path'])})")
+        self._emit(PHASE_DONE)
+        return True
+
+    def _record_archive(self, key, path):
+        if not key or not path:
+            return
+        from transcode import probe_streams
+        streams = probe_streams(self.toolchain, path) or []
+        codec = next((st.get('codec_name') for st in streams if st.get('codec_type') == 'video'), None)
+        self.archive.record(key, path, codec)
+
+    def _existing_output(self, ydl, info):
+        """
+        预期的输出文件已在下载目录中 (例如建立下载索引之前下载的文件) 时返回其路径
+        仅检查两个确定的文件名, 不扫描目录; 文件名包含视频 ID (见 staging.OUTPUT_TEMPLATE),
+        同名的其他视频不会被当作已下载
+        """
+        if not info or info.get('_type', 'video') != 'video':
+            return None
+        base = os.path.splitext(os.path.basename(ydl.prepare_filename(info)))[0]
+        for ext in dict.fromkeys((info.get('ext'), 'mp4')):
+            if not ext:
+                continue
+            path = os.path.join(self.download_dir, f"{base}.{ext}")
+            if os.path.exists(path):
+                self.last_output = path
+                self._count(COUNTER_CACHE_HITS, kind="existing")
+                self._log(f"状态: 文件已存在，跳过下载 ({os.path.basename(path)})")
+                self._emit(PHASE_DONE)
+                return path
+        return None
+
+    def _watch_errors(self, ydl):
+        """记录 yt-dlp 报告的错误 (ignoreerrors 模式下错误不会抛出), 用于识别限流信号"""
+        self._ydl_errors = []
+        self._fragment_errors = []
+        original = ydl.trouble
+        original_screen = ydl.to_screen
+
+        def trouble(message=None, *args, **kwargs):
+            if message:
+                self._ydl_errors.append(message)
+            return original(message, *args, **kwargs)
+
+        def to_screen(message, *args, **kwargs):
+            # 分片重试/跳过只输出提示而不报错, 单独计数用于调整分片并发
+            if message and ('Got error' in message or 'Skipping fragment' in message):
+                self._fragment_errors.append(message)
+            return original_screen(message, *args, **kwargs)
+
+        ydl.trouble = trouble
+        ydl.to_screen = to_screen
+
+    def _report_throttle(self, url, error=None):
+        """根据本次任务的结果调整站点速率: 成功则逐步恢复, 收到 429/403 则退避"""
+        errors = list(getattr(self, '_ydl_errors', [])) + ([error] if error else [])
+        fragment_errors = getattr(self, '_fragment_errors', [])
+        self._count(COUNTER_RETRIES, len(fragment_errors), kind="fragment")
+        # 只有限流/超时类错误才降低分片并发 (404、地区限制等与并发无关)
+        self._report_fragments(failed=any(is_backoff_error(message) for message in errors + fragment_errors))
+        limiter = get_rate_limiter()
+        if not errors:
+            limiter.report(url, throttled=False)
+        elif is_throttled(text="\n".join(errors)):
+            rate = limiter.report(url, throttled=True)
+            self._log(f"警告: 站点返回限流信号, 请求速率降至 {rate:.2f} 次/秒")
+
+    def _apply_rate_limit(self, url, ydl_opts):
+        """站点处于限流恢复期时, 让 yt-dlp 在内部请求之间按当前速率间隔"""
+        delay = get_rate_limiter().request_delay(url)
+        if delay:
+            ydl_opts['sleep_interval_requests'] = delay
+            self._log(f"状态: 站点限流恢复中, 请求间隔 {delay:.1f}s")
+
+    def _attach_bandwidth(self, ydl):
+        """yt-dlp 按当前分配的带宽限速 (下载过程中随重新分配更新 ratelimit 参数)"""
+        self._ydl_params = ydl.params
+        self._transferred = {}
+        if self.bandwidth is not None:
+            ydl.params['ratelimit'] = self.bandwidth.allocation
+
+    def _track_bandwidth(self, d):
+        """根据 yt-dlp 的进度统计实际速率, 并同步最新分配"""
+        if self.bandwidth is None:
+            return
+        name = d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        # 首次出现的文件以当前值为基准 (断点续传时已有的部分不计入速率)
+        self.bandwidth.record(downloaded - self._transferred.get(name, downloaded))
+        self._transferred[name] = downloaded
+        if self._ydl_params is not None:
+            allocation = self.bandwidth.allocation
+            if allocation and d.get('fragment_index') is not None:
+                # 并发分片各自按 ratelimit 限速, 总和需与分配一致
+                allocation /= self._ydl_params.get('concurrent_fragment_downloads') or 1
+            self._ydl_params['ratelimit'] = allocation
+
+    def _throttle(self):
+        return self.bandwidth.consume if self.bandwidth is not None else None
+
+    def _apply_fragment_concurrency(self, url, ydl_opts):
+        """HLS/DASH 分片并发下载: 指定了并发数时直接使用, 否则使用该站点自动调整的值"""
+        host = host_key(url)
+        concurrency = self.concurrent_fragments or get_fragment_tuner().concurrency(host)
+        ydl_opts['concurrent_fragment_downloads'] = concurrency
+        self._fragment_sample = {'host': host, 'concurrency': concurrency, 'files': {}}
+
+    def _track_fragments(self, d):
+        """记录分片下载的字节数与耗时 (只统计分片格式, 单文件下载不受分片并发影响)"""
+        sample = self._fragment_sample
+        if sample is None:
+            return
+        name = d.get('filename')
+        if d['status'] == 'downloading' and d.get('fragment_index') is not None:
+            sample['files'].setdefault(name, None)
+        elif d['status'] == 'finished' and name in sample['files'] and d.get('elapsed'):
+            sample['files'][name] = (d.get('total_bytes') or d.get('downloaded_bytes') or 0, d['elapsed'])
+
+    def _report_fragments(self, failed):
+        """任务结束后把分片下载的吞吐反馈给调整器 (手动指定并发数时不调整)"""
+        sample, self._fragment_sample = self._fragment_sample, None
+        if sample is None or self.concurrent_fragments or not sample['files']:
+            return
+        finished = [result for result in sample['files'].values() if result]
+        size = sum(result[0] for result in finished)
+        elapsed = sum(result[1] for result in finished)
+        if not failed and (not size or not elapsed):
+            return
+        throughput = size / elapsed if elapsed else 0.0
+        tuner = get_fragment_tuner()
+        concurrency = tuner.record(sample['host'], sample['concurrency'], throughput, failed=failed)
+        if concurrency != sample['concurrency']:
+            self._log(f"状态: {sample['host']} 分片并发 {sample['concurrency']} → {concurrency}")
+
+    def _format_selector(self, url, resolution):
+        """按平台生成格式选择字符串, 并记录目标分辨率"""
+        try:
+            height = parse_resolution(resolution)
+        except ValueError:
+            self._log(f"提示: 分辨率参数错误 '{resolution}', 使用默认最佳画质")
+            height = None
+        if height:
+            self._log(f"状态: 目标分辨率 <= {height}P")
+        else:
+            self._log("状态: 目标分辨率: 最高画质")
+        if self.max_bitrate or self.max_filesize:
+            from direct_download import format_bytes
+            limits = []
+            if self.max_bitrate:
+                limits.append(f"码率 <= {self.max_bitrate}kbps")
+            if self.max_filesize:
+                limits.append(f"大小 <= {format_bytes(self.max_filesize)}")
+            self._log(f"状态: 格式限制: {', '.join(limits)}")
+        return build_format_selector(height, platform_of(url), self.max_bitrate, self.max_filesize,
+                                     can_merge=self.toolchain.available)
+
+    def _report_savings(self, info):
+        """对比所选格式与最佳画质的预计大小, 记录节省的流量"""
+        estimate = estimate_savings(info)
+        if not estimate:
+            return
+        best, chosen = estimate
+        if best <= chosen:
+            return
+        from direct_download import format_bytes
+        savings.record(best, chosen)
+        self._log(f"状态: 所选格式约 {format_bytes(chosen)} (最佳画质约 {format_bytes(best)}, "
+                  f"节省 {(best - chosen) / best:.0%})")
+
     def _log(self, message):
         if self.status_callback:
             self.status_callback(message)
         else:
+            # 先输出尚未推送的进度, 保持命令行输出的先后顺序
+            self.progress_bus.flush()
             print(message)
 
+    def _check_cancel(self):
+        """任务已被取消时抛出 DownloadCancelled (yt-dlp/分段下载器会将其传出, 由 extract 统一处理)"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise DownloadCancelled("任务已取消")
+
+    def _cancelled(self, staging=None):
+        """取消后的清理: 保留暂存目录中的部分文件以便重新提交时续传"""
+        if staging:
+            staging.release()
+        self.last_error = "已取消"
+        self._log("状态: 任务已取消")
+        return False
+
+    def _emit(self, phase, downloaded=0, total=None, speed=None, eta=None, fragment=None, fragment_count=None):
+        self.progress_bus.publish(ProgressEvent(self.task_id, phase, downloaded, total, speed, eta,
+                                                fragment, fragment_count))
+
+    def _meter_progress(self, downloaded, total, speed, eta):
+        """分段下载/流式转码的进度回调 (ProgressMeter)"""
+        self._check_cancel()
+        self._metered_bytes = downloaded
+        self._emit(PHASE_DOWNLOAD, downloaded, total, speed, eta)
+
     def progress_hook(self, d):
+        self._check_cancel()
+        self._track_fragments(d)
         if d['status'] == 'downloading':
-            p_str = d.get('_percent_str', '0%').replace('%','').strip()
-            s_str = d.get('_speed_str', 'N/A')
-            e_str = d.get('_eta_str', 'N/A')
-            
-            if self.progress_callback:
+            self._track_bandwidth(d)
+            # 直接使用 yt-dlp 提供的数值字段, 不解析 _percent_str 等显示字符串
+            self._emit(PHASE_DOWNLOAD, d.get('downloaded_bytes') or 0,
+                       d.get('total_bytes') or d.get('total_bytes_estimate'),
+                       d.get('speed'), d.get('eta'), d.get('fragment_index'), d.get('fragment_count'))
+        elif d['status'] == 'finished':
+            downloaded = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            speed = downloaded / d['elapsed'] if d.get('elapsed') else None
+            self._count(COUNTER_BYTES, downloaded)
+            self._emit(PHASE_DOWNLOAD, downloaded, downloaded or None, speed, 0)
+
+    def _can_stream(self, convert_to_mp4):
+        return self.stream_transcode and convert_to_mp4 and self.toolchain.available
+
+    def _is_streamable(self, info):
+        """
+        单文件 HTTP(S) 资源且需要转为 MP4 时, 适合流式转码
+        MP4/MOV 源不适合: moov 在文件末尾时无法从管道解封装 (传输完才失败), 且 MP4 之间的复制封装没有收益
+        """
+        return (
+            info.get('_type', 'video') == 'video'
+            and not info.get('requested_formats')
+            and bool(info.get('url'))
+            and info.get('protocol') in ('http', 'https')
+            and (info.get('ext') or '').lower() not in NON_STREAMABLE_EXTS
+        )
+
+    @staticmethod
+    def _output_name(title, video_id=None):
+        """直链下载的文件名 (不含扩展名): 带上视频 ID, 同名视频不会互相覆盖"""
+        from yt_dlp.utils import sanitize_filename
+
+        name = sanitize_filename(title or "video")
+        return f"{name} [{sanitize_filename(video_id)}]" if video_id else name
+
+    def _stream_to_mp4(self, media_url, headers, title, codec_info=None, source_url=None, video_id=None):
+        """
+        流式转码: HTTP 响应体直接送入 ffmpeg 标准输入, 只写入最终 MP4
+        成功返回最终路径; 失败返回 None, 由调用方回退到常规下载
+        """
+        from transcode import plan_from_info
+        from direct_download import stream_to_ffmpeg, remove_quietly
+
+        name = self._output_name(title, video_id)
+        output_path = os.path.join(self.download_dir, name + ".mp4")
+        temp_path = os.path.join(self.download_dir, name + ".temp.mp4")
+
+        plan = plan_from_info(self.toolchain, codec_info or {})
+        cmd = plan.command(self.toolchain.ffmpeg, temp_path, input_args=['-i', 'pipe:0'], stats=False,
+                           metadata={'comment': source_url})
+        self._log(f"状态: 流式转码 (边下载边处理) [{plan.describe()}]")
+        self._stage(STAGE_DOWNLOAD)
+        self._metered_bytes = 0
+        try:
+            with self._span(SPAN_STREAM):
+                stream_to_ffmpeg(media_url, headers, cmd, progress_callback=self._meter_progress,
+                                 throttle=self._throttle())
+            output_path = move_unique(temp_path, self.download_dir, os.path.basename(output_path))
+        except DownloadCancelled:
+            remove_quietly(temp_path)
+            raise
+        except Exception as e:
+            remove_quietly(temp_path)
+            self._log(f"提示: 流式转码失败 ({e})，回退到常规下载")
+            return None
+        finally:
+            self._count(COUNTER_BYTES, self._metered_bytes)
+
+        self._emit(PHASE_DONE)
+        self._log("状态: 任务全部完成")
+        return output_path
+
+    def _download_direct(self, media_url, headers, title, video_id, staging, ext="mp4"):
+        """
+        使用分段下载器获取直链文件, 成功返回暂存目录中的文件路径, 失败返回 None
+        media_url 可以是按速度排序的镜像列表, 下载中途镜像失效或过慢时自动切换
+        文件写入任务的暂存目录 (staging), 后处理完成后移入下载目录; 是否已下载由下载索引判断
+        中断后再次下载同一视频时从暂存目录中已完成的分段继续
+        """
+        from direct_download import SegmentedDownloader
+
+        output_path = os.path.join(staging.path, f"{self._output_name(title, video_id)}.{ext}")
+
+        self._log("状态: 开始分段下载...")
+        self._stage(STAGE_DOWNLOAD)
+        downloader = SegmentedDownloader(
+            media_url,
+            output_path,
+            headers=headers,
+            progress_callback=self._meter_progress,
+            log=self._log,
+            throttle=self._throttle(),
+        )
+        try:
+            with self._span(SPAN_DOWNLOAD):
+                return downloader.download()
+        except DownloadCancelled:
+            # 保留 .part 与状态文件, 重新提交时断点续传
+            raise
+        except Exception as e:
+            staging.release()
+            self._log(f"提示: 分段下载失败 ({e})，改用 yt-dlp 下载")
+            return None
+        finally:
+            self._count(COUNTER_BYTES, downloader.transferred)
+            self._count(COUNTER_RETRIES, downloader.retries, kind="segment")
+            self._count(COUNTER_RETRIES, downloader.failovers, kind="mirror")
+
+    def convert_to_mp4_ffmpeg(self, input_path, output_path, threads=None, metadata=None):
+        """
+        转换为 MP4: 兼容的音视频流直接复制 (-c copy), 仅重新编码不兼容的流
+        """
+        self.run_mp4_plan(plan_mp4(self.toolchain, [input_path]), output_path, threads, metadata)
+
+    def run_mp4_plan(self, plan, output_path, threads=None, metadata=None):
+        import subprocess
+        if plan.is_remux:
+            self._log(f"状态: 正在封装为 MP4 (无需转码) [{plan.describe()}]")
+        else:
+            self._log(f"状态: 正在转码 (FFmpeg) [{plan.describe()}]")
+        subprocess.run(plan.command(self.toolchain.ffmpeg, output_path, threads=threads, metadata=metadata), check=True)
+
+    def _finish_download(self, task, defer_postprocess):
+        """下载阶段结束: 立即后处理, 或留给转码池 (流水线模式)"""
+        self._stage(STAGE_MERGE if task.merge_parts else STAGE_TRANSCODE, task)
+        if defer_postprocess:
+            self.pending_postprocess = task
+            self._deferred_at = time.perf_counter()
+            self._log("状态: 下载完成，等待后处理...")
+            return True
+        return self.run_postprocess(task)
+
+    def run_postprocess(self, task, threads=None):
+        """
+        执行下载后的处理 (合并分轨 → 转为 MP4), 返回任务是否成功
+        threads: 单个 ffmpeg 进程可用的线程数 (由转码池按 CPU 预算分配)
+        成功后将最终文件记录到下载索引
+        """
+        if self.trace is None:
+            # 进程重启后直接恢复后处理的任务
+            self.trace = JobTrace(self.task_id or new_job_id(), task.source_url)
+        if self._deferred_at is not None:
+            self._add_span(SPAN_QUEUE, time.perf_counter() - self._deferred_at)
+            self._deferred_at = None
+        ok = False
+        try:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return self._cancelled(task.staging)
+            self._emit(PHASE_PROCESS)
+            ok = self._postprocess(task, threads)
+            with self._span(SPAN_PUBLISH):
+                if task.staging:
+                    if ok:
+                        task.output_path = task.staging.publish(task.output_path)
+                    task.staging.cleanup()
+                if ok:
+                    self._emit(PHASE_DONE)
+                    self.last_output = task.output_path
+                    self._record_archive(task.archive_key, task.output_path)
+            return ok
+        finally:
+            self._finish_trace(ok)
+
+    def _postprocess(self, task, threads=None):
+        metadata = {'comment': task.source_url}
+        if task.merge_parts:
+            video_part, audio_part = task.merge_parts
+            self._log(f"状态: 检测到分轨资源，尝试手动合并...")
+            self._log(f"视频: {os.path.basename(video_part)}")
+            self._log(f"音频: {os.path.basename(audio_part)}")
+            try:
+                # 与转码共用方案: 仅在音频不兼容 MP4 时转码 AAC
+                with self._span(SPAN_MERGE):
+                    self.run_mp4_plan(plan_mp4(self.toolchain, [video_part, audio_part]), task.path, threads, metadata)
+                self._log("状态: 手动合并成功")
+                
+                # 清理分轨文件
                 try:
-                    p_val = float(p_str) / 100.0
-                    self.progress_callback(p_val, s_str, e_str)
+                    os.remove(video_part)
+                    os.remove(audio_part)
                 except:
                     pass
+            except Exception as e:
+                self._log(f"手动合并失败: {e}")
+                self.last_error = "下载成功但未合并"
+                task.path = task.fallback_path
+
+        downloaded_path = task.path
+        # 默认最终路径就是下载路径
+        output_path = downloaded_path
+
+        if task.convert_to_mp4 and downloaded_path and os.path.exists(downloaded_path):
+            base, ext = os.path.splitext(downloaded_path)
+            target_mp4 = base + ".mp4"
+            if ext.lower() == '.mp4':
+                self._log("状态: 校验完成 (已是 MP4)")
+            elif task.strict and os.path.exists(target_mp4):
+                self._log("状态: MP4 文件已存在")
+                output_path = target_mp4
             else:
-                print(f"\r正在下载: {p_str}% | 速度: {s_str} | 剩余时间: {e_str}", end='')
-        elif d['status'] == 'finished':
-            if self.progress_callback:
-                self.progress_callback(1.0, "下载完成，准备处理...", "0s")
+                self._log(f"状态: 正在转码为 MP4...")
+                try:
+                    with self._span(SPAN_TRANSCODE):
+                        self.convert_to_mp4_ffmpeg(downloaded_path, target_mp4, threads, metadata)
+                    self._log(f"状态: 转码成功")
+                    output_path = target_mp4 # 更新最终路径
+                    if os.path.exists(downloaded_path):
+                        os.remove(downloaded_path)
+                except Exception as e:
+                    if task.strict:
+                        self.last_error = f"转码失败: {e}"
+                        self._log(f"错误: {self.last_error}")
+                        return False
+                    self.last_error = f"转码异常: {str(e)}"
+                    self._log(f"警告: {self.last_error}")
+                    # 转码失败不应导致任务失败，只要源文件还在
+                    output_path = downloaded_path
 
-    def convert_to_mp4_ffmpeg(self, input_path, output_path):
-        import subprocess
-        cmd = [
-            'ffmpeg', '-y', '-i', input_path, 
-            '-c:v', 'libx264', '-c:a', 'aac', 
-            '-crf', '23', '-preset', 'fast', 
-            '-loglevel', 'error', '-stats',
-            output_path
-        ]
-        self._log("状态: 正在转码 (FFmpeg)...")
-        subprocess.run(cmd, check=True)
-
-    def _extract_youtube_cli(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None):
+        task.output_path = output_path
+
+        if task.strict:
+            self._log("状态: 下载完成")
+            return True
+
+        # 最终校验：只要有一个文件存在，就返回成功
+        if output_path and os.path.exists(output_path):
+            self._log("状态: 任务全部完成")
+            return True
+        elif downloaded_path and os.path.exists(downloaded_path):
+            task.output_path = downloaded_path
+            self._log("状态: 任务完成 (未转码)")
+            return True
+        else:
+            self.last_error = "最终文件校验失败"
+            return False
+
+    def _extract_youtube_cli(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None, defer_postprocess=False,
+                             archive_key=None):
         """
         使用 yt_dlp Python 库下载 YouTube 视频 (修复版 API 调用)
         替代命令行调用,以解决打包后找不到可执行文件的问题
@@ -189,34 +812,24 @@ class VideoExtractor:
         self._log("状态: 正在解析链接...")
         
         # 配置 yt-dlp 参数
-        # 优化: 根据 resolution 参数构建 format 字符串
         # 逻辑: 优先下载指定分辨率(或更低)的最佳视频+音频，如果不可用则回退到最佳预合并格式('b')
-        
-        format_str = 'b' # 默认为最佳预合并 (兼容性最强)
-        
-        if resolution and resolution != 'max':
-            try:
-                res_val = int(resolution.replace('P', '').lower().replace('p', ''))
-                # 格式选择器: 
-                # 1.bestvideo[height<=res]+bestaudio (指定分辨率的最佳分离流)
-                # 2.best[height<=res] (指定分辨率的最佳预合并流)
-                # 3.b (最终后备: 最佳可用)
-                format_str = f'bestvideo[height<={res_val}]+bestaudio/best[height<={res_val}]/b'
-                self._log(f"状态: 目标分辨率 <= {res_val}P")
-            except ValueError:
-                self._log(f"提示: 分辨率参数错误 '{resolution}', 使用默认最佳画质")
-                format_str = 'bestvideo+bestaudio/b'
-        else:
-            self._log("状态: 目标分辨率: 最高画质")
-            format_str = 'bestvideo+bestaudio/b'
+        format_str = self._format_selector(url, resolution)
 
+        # 输出到任务独立的暂存目录 (按视频与分辨率区分), 真实路径由回调记录
+        staging = JobStaging(self.download_dir, f"{cache_key(url)}|{resolution}")
         ydl_opts = {
             'format': format_str, 
-            'outtmpl': os.path.join(self.download_dir, '%(title)s.%(ext)s'),
-            'progress_hooks': [self.progress_hook], 
+            # 单视频模式: 带 list= 的链接只下载当前视频, 纯播放列表链接只取第一项 (整个列表请使用 --playlist)
+            'noplaylist': True,
+            'playlist_items': '1',
+            'outtmpl': staging.outtmpl(),
+            'progress_hooks': [self.progress_hook, staging.progress_hook], 
+            'postprocessor_hooks': [staging.postprocessor_hook],
             'quiet': True,
             'no_warnings': True,
         }
+        if self.toolchain.ffmpeg:
+            ydl_opts['ffmpeg_location'] = self.toolchain.ffmpeg
         
         # 添加 cookies 文件 (如果提供)
         if cookies_file and os.path.exists(cookies_file):
@@ -224,49 +837,43 @@ class VideoExtractor:
             self._log(f"状态: 使用 Cookies 文件: {os.path.basename(cookies_file)}")
         
         # 注意: 即使是 API 模式,也不要启用 cookiesfrombrowser,因为会导致 YouTube 下载失败
+        self._apply_rate_limit(url, ydl_opts)
+        self._apply_fragment_concurrency(url, ydl_opts)
         
         try:
             self._log("状态: 开始下载...")
             
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # 提取信息但不下载,先检查是否已存在(通过文件名预测)或获取元数据
-                # 这里直接下载,让 yt-dlp 处理文件存在的情况
-                info = ydl.extract_info(url, download=True)
+                self._watch_errors(ydl)
+                self._attach_bandwidth(ydl)
+                # 先解析 (结果按视频 ID 缓存, 重试时跳过解析), 再下载
+                info, from_cache = self._extract_info_cached(ydl, url)
+                existing = self._existing_output(ydl, info)
+                if existing:
+                    staging.cleanup()
+                    self._record_archive(archive_key or info_archive_key(info), existing)
+                    return True
+                info = self._download_info(ydl, url, info, from_cache)
                 
                 if 'entries' in info:
                     # 播放列表，取第一个或处理逻辑(这里假设单视频)
                     info = info['entries'][0]
                 
-                downloaded_file = ydl.prepare_filename(info)
+
+                downloaded_file = staging.final_path(info) or ydl.prepare_filename(info)
                 
-                # 检查文件扩展名，如果需要转码
-                if convert_to_mp4:
-                    base, ext = os.path.splitext(downloaded_file)
-                    if ext.lower() == '.mp4':
-                        self._log("状态: 校验完成 (已是 MP4)")
-                    else:
-                        target_mp4 = base + ".mp4"
-                        if os.path.exists(target_mp4):
-                             self._log("状态: MP4 文件已存在")
-                        else:
-                            self._log(f"状态: 正在转码为 MP4...")
-                            try:
-                                self.convert_to_mp4_ffmpeg(downloaded_file, target_mp4)
-                                if os.path.exists(downloaded_file):
-                                    os.remove(downloaded_file)
-                                self._log("状态: 转码完成")
-                            except Exception as e:
-                                self.last_error = f"转码失败: {e}"
-                                self._log(f"错误: {self.last_error}")
-                                return False
-                                
-            self._log("状态: 下载完成")
-            if self.progress_callback:
-                self.progress_callback(1.0, "完成", "0s")
-            return True
+            self._report_throttle(url)
+            # 检查文件扩展名，如果需要转码
+            task = PostProcessTask(downloaded_file, convert_to_mp4, strict=True, source_url=url,
+                                   archive_key=archive_key or info_archive_key(info), staging=staging)
+            return self._finish_download(task, defer_postprocess)
             
+        except DownloadCancelled:
+            return self._cancelled(staging)
         except Exception as e:
+            staging.release()
             error_str = str(e)
+            self._report_throttle(url, error_str)
             if "Fresh cookies" in error_str:
                  self.last_error = "Anti-Crawler: 请在 Chrome 中登录/刷新页面，或把 cookies.txt 放于同目录"
                  self._log(f"错误: 抖音反爬拦截。请在 Chrome 浏览器打开抖音并登录，然后重试。")
@@ -276,245 +883,256 @@ class VideoExtractor:
             return False
 
 
-    def extract(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None):
+    def extract(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None, defer_postprocess=False):
         """
         统一的视频下载入口
         - YouTube: 使用命令行调用 (避免 Python API 的格式问题)
         - 其他平台: 使用 Python API
+        defer_postprocess: 只执行下载阶段, 合并/转码步骤保存在 self.pending_postprocess 中,
+                           由调用方交给转码池执行 (见 run_postprocess)
+        设置 self.cancel_event 后, 下载在下一次进度回调时中止并返回 False (last_error 为 "已取消")
+        各阶段耗时记录在 self.trace 中, 任务结束 (含延后的后处理) 时导出
+        同步接口: 在共享的后台事件循环中运行 extract_async 并等待结果, 可在任意线程调用
         """
-        import yt_dlp
-        
+        try:
+            return run_sync(self.extract_async(url, convert_to_mp4, resolution, cookies_file, defer_postprocess))
+        except KeyboardInterrupt:
+            # 后台线程中的下载在下一次进度回调时中止
+            if self.cancel_event is None:
+                self.cancel_event = threading.Event()
+            self.cancel_event.set()
+            raise
+
+    async def extract_async(self, url, convert_to_mp4=True, resolution='1080', cookies_file=None,
+                            defer_postprocess=False):
+        """
+        异步下载入口 (参数与返回值同 extract)
+        网络请求 (短链展开、Douyin 页面、镜像测速) 在事件循环中执行, 单个事件循环可同时解析大量链接;
+        yt-dlp、分段下载与下载索引读写在 blocking 线程池 (见 executors.py)、合并/转码在共享的转码池中执行
+        同时进行的任务需各自使用一个 VideoExtractor
+        """
+        self.trace = JobTrace(self.task_id or new_job_id(), url)
+        self._deferred_at = None
+        ok = False
+        try:
+            self._check_cancel()
+            ok = await self._extract(url, convert_to_mp4, resolution, cookies_file, defer_postprocess)
+            return ok
+        except DownloadCancelled:
+            # Douyin 直链下载/流式转码等 yt-dlp 之外的步骤被取消
+            return self._cancelled()
+        finally:
+            if not ok or self.pending_postprocess is None:
+                self._finish_trace(ok)
+
+    async def _finish_pending(self, ok, defer_postprocess):
+        """
+        下载阶段总是以延后后处理的方式结束 (不在 blocking 线程池中运行 ffmpeg),
+        调用方未要求延后时再交给共享的转码池执行
+        """
+        if not ok or defer_postprocess or self.pending_postprocess is None:
+            return ok
+        task, self.pending_postprocess = self.pending_postprocess, None
+        return await get_transcode_pool().run(lambda threads: self.run_postprocess(task, threads))
+
+    async def _extract(self, url, convert_to_mp4, resolution, cookies_file, defer_postprocess):
         self.last_error = None
+        self.pending_postprocess = None
+        self.last_output = None
         
         # 自动补全协议头
         if not url.startswith(("http://", "https://")):
             url = "https://" + url
+        # 短链接 (v.douyin.com / b23.tv) 先展开, 以便识别视频 ID
+        if is_short_link(url):
+            with self._span(SPAN_EXPAND):
+                url = await expand_short_link_async(url)
+        
+        # 已下载过的视频: 一次索引查询即可跳过, 不发起任何网络请求
+        archive_key = canonical_id(url)
+        if await run_blocking(self._skip_archived, archive_key):
+            return True
+        source_url = url
         
         # YouTube 特殊处理: 使用命令行调用
         if 'youtube.com' in url or 'youtu.be' in url:
-            return self._extract_youtube_cli(url, convert_to_mp4, resolution, cookies_file)
+            ok = await run_blocking(self._extract_youtube_cli, url, convert_to_mp4, resolution, cookies_file, True,
+                                    archive_key=archive_key)
+            return await self._finish_pending(ok, defer_postprocess)
             
         # Douyin 特殊处理: 使用 curl_cffi 绕过 WAF
         if 'douyin.com' in url:
-            cffi_url = self._extract_douyin_video_url(url)
-            if cffi_url:
+            douyin = await self._resolve_douyin_async(url)
+            if douyin:
+                # 并发探测全部 CDN 镜像, 使用最快的一个 (其余作为下载中途的备用)
+                from direct_download import race_mirrors_async
+                with self._span(SPAN_MIRROR_PROBE):
+                    mirrors = await race_mirrors_async(douyin["urls"], {'User-Agent': MOBILE_USER_AGENT}, log=self._log)
                 # 成功获取真实地址，替换 URL 并添加 Headers 提示
-                url = cffi_url
+                url = mirrors[0]
+                # 直链本身就是 MP4 (H.264/AAC), 不走流式转码 (见 _is_streamable):
+                # 多连接分段下载 (支持断点续传), 失败时再交给 yt-dlp
+                staging = JobStaging(self.download_dir, archive_key or f"douyin:{douyin['video_id']}")
+                downloaded = await run_blocking(self._download_direct, mirrors, {'User-Agent': MOBILE_USER_AGENT},
+                                                douyin["title"], douyin["video_id"], staging)
+                if downloaded:
+                    task = PostProcessTask(downloaded, convert_to_mp4, source_url=source_url, archive_key=archive_key,
+                                           staging=staging)
+                    ok = self._finish_download(task, True)
+                    return await self._finish_pending(ok, defer_postprocess)
+                # 直链可能已失效, 下次重新解析
+                get_resolve_cache().invalidate(f"direct:douyin:{douyin['video_id']}")
+        
+        ok = await run_blocking(self._extract_generic, url, source_url, archive_key, convert_to_mp4, resolution,
+                                cookies_file, True)
+        return await self._finish_pending(ok, defer_postprocess)
+
+    def _extract_generic(self, url, source_url, archive_key, convert_to_mp4, resolution, cookies_file,
+                         defer_postprocess):
+        """其他平台: 使用 Python API (原有逻辑), 阻塞执行"""
+        import yt_dlp
         
-        # 其他平台: 使用 Python API (原有逻辑)
         
         self._log(f"状态: 正在解析链接...")
         
-        # 格式选择策略优化
-        # 根据 yt-dlp 官方建议和测试结果,完全不指定格式让其自动选择最佳格式
-        # 这样可以避免 "Requested format is not available" 错误
+        # 格式选择: 按分辨率/码率/大小限制选择, 每级都有不加限制的后备,
+        # 避免 "Requested format is not available" 错误; 未设置限制时让 yt-dlp 自动选择最佳格式
         # 参考: https://github.com/yt-dlp/yt-dlp#format-selection
-        
-        # 对于 YouTube,完全不指定格式,让 yt-dlp 自动选择
-        format_str = None
-        
-        # 注意: resolution 参数在当前实现中被忽略
-        # 如果需要限制分辨率,可以在后续版本中通过其他方式实现
-        if resolution.lower() != 'max':
-            self._log(f"提示: 当前版本暂不支持指定分辨率,将下载最佳画质")
+        format_str = self._format_selector(url, resolution)
 
         # 动态构建 Headers
         headers = {}
         
         # 针对 Douyin 直链 (snssdk) 或 Bilibili
         if 'snssdk.com' in url: # CFFI 提取后的直链
-             headers['User-Agent'] = 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Mobile Safari/537.36'
+             headers['User-Agent'] = MOBILE_USER_AGENT
         
         # 仅针对 Bilibili 添加 Referer（保持最简配置）
         if 'bilibili.com' in url or 'b23.tv' in url:
             headers['Referer'] = 'https://www.bilibili.com/'
 
+        # 输出到任务独立的暂存目录 (按视频与分辨率区分), 真实路径由下载/后处理回调记录 (不扫描共享的下载目录)
+        staging = JobStaging(self.download_dir, f"{archive_key or cache_key(url)}|{resolution}")
         ydl_opts = {
-            'outtmpl': os.path.join(self.download_dir, '%(title)s.%(ext)s'), 
-            'progress_hooks': [self.progress_hook],
+            'outtmpl': staging.outtmpl(),
+            'progress_hooks': [self.progress_hook, staging.progress_hook],
+            'postprocessor_hooks': [staging.postprocessor_hook],
             'noplaylist': True, 
             'ignoreerrors': True,
             'no_warnings': True,
             'http_headers': headers,
-            
-            # 请求延迟,避免被限流
-            'sleep_interval': 1,
-            'max_sleep_interval': 3,
-            'sleep_interval_requests': 1,
         }
+        if self.toolchain.ffmpeg:
+            ydl_opts['ffmpeg_location'] = self.toolchain.ffmpeg
+        # 按站点自适应限速 (替代固定的 sleep_interval): 未被限流时不额外等待
+        self._apply_rate_limit(url, ydl_opts)
+        self._apply_fragment_concurrency(url, ydl_opts)
         
         # 只有在指定了格式时才添加 format 参数
         if format_str:
             ydl_opts['format'] = format_str
         
-        # 如果提供了 cookies 文件,添加到配置中
+        # 如果提供了 cookies 文件,与浏览器 cookies 一起加载
         if cookies_file:
             if os.path.exists(cookies_file):
-                ydl_opts['cookiefile'] = cookies_file
                 self._log(f"状态: 使用 Cookies 文件: {os.path.basename(cookies_file)}")
             else:
                 self._log(f"警告: Cookies 文件不存在: {cookies_file}")
+                cookies_file = None
         
         # 尝试使用浏览器 cookies 解决反爬问题 (如抖音、B站高清)
         # 注意: macOS 下读取 Chrome cookies 需要访问钥匙串,首次会弹出授权提示(仅一次)
+        # Chrome 数据库的复制与解密在进程内只做一次, 数据库或 cookies.txt 更新后才重新加载
+        cookie_jar = None
         try:
-            ydl_opts['cookiesfrombrowser'] = ('chrome',)
-            self._log("状态: 尝试加载 Chrome Cookies")
+            cookie_jar = get_cookie_cache().get(cookies_file, log=self._log)
         except Exception as e:
             self._log(f"提示: 未加载浏览器 Cookies: {e}")
+            if cookies_file:
+                ydl_opts['cookiefile'] = cookies_file
         
         try:
             downloaded_path = None
-            output_path = None # 最终文件路径
+            merge_parts = None
+            fallback_path = None
             
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                if cookie_jar is not None:
+                    # 在首次请求之前替换 (cookiejar 为惰性属性), 本任务使用缓存 Cookies 的副本
+                    ydl.cookiejar = cookie_jar
+                self._watch_errors(ydl)
+                self._attach_bandwidth(ydl)
                 self._log("状态: 开始提取下载...")
-                info = ydl.extract_info(url, download=True)
+                # 先解析不下载 (按视频 ID 缓存, 重试/重复提交时直接进入下载)
+                info, from_cache = self._extract_info_cached(ydl, url)
+                # 无法从链接识别视频 ID 的平台: 解析后再按 平台+ID 查询索引
+                if info and not archive_key:
+                    archive_key = info_archive_key(info)
+                    if self._skip_archived(archive_key):
+                        staging.cleanup()
+                        return True
+                existing = self._existing_output(ydl, info)
+                if existing:
+                    staging.cleanup()
+                    self._record_archive(archive_key, existing)
+                    return True
+                if info and self._can_stream(convert_to_mp4):
+                    # 单流资源走流式转码, 其余沿用解析结果继续下载 (不重复解析)
+                    if self._is_streamable(info):
+                        stream_headers = dict(info.get('http_headers') or headers)
+                        try:
+                            cookie_header = ydl.cookiejar.get_cookie_header(info['url'])
+                            if cookie_header:
+                                stream_headers['Cookie'] = cookie_header
+                        except Exception:
+                            pass
+                        # ffmpeg 进程占用共享转码池的一个位置 (与后处理使用同一 CPU 预算)
+                        streamed = get_transcode_pool().call(lambda threads: self._stream_to_mp4(
+                            info['url'], stream_headers, info.get('title'), info, source_url, info.get('id')))
+                        if streamed:
+                            staging.cleanup()
+                            self.last_output = streamed
+                            self._record_archive(archive_key, streamed)
+                            return True
+                if info:
+                    info = self._download_info(ydl, url, info, from_cache)
                 if not info:
+                    staging.release()
+                    self._report_throttle(url, "无法获取视频信息")
                     self.last_error = "无法获取视频信息"
                     self._log(f"错误: {self.last_error}")
                     return False
                 
-                title = info.get('title', 'Unknown')
-                # self._log(f"下载已完成: {title}")
-                
-                # 修复：下载失败时 requested_downloads 可能为空或不包含 filepath
-                if 'requested_downloads' in info and info['requested_downloads']:
-                    try:
-                        downloaded_path = info['requested_downloads'][0].get('filepath')
-                    except (KeyError, IndexError):
-                        pass
-                
-                if not downloaded_path:
-                    downloaded_path = ydl.prepare_filename(info)
-                
-                # 检查文件是否真实存在（下载失败时可能只有路径但无文件）
-                if not downloaded_path or not os.path.exists(downloaded_path):
-                    # 策略1: 尝试寻找 mp4 后缀的文件（自动修正扩展名）
-                    if downloaded_path:
-                        base_chk, _ = os.path.splitext(downloaded_path)
-                        mp4_path = base_chk + ".mp4"
-                        if os.path.exists(mp4_path):
-                            downloaded_path = mp4_path
-                            # self._log(f"自适应修正路径: {os.path.basename(downloaded_path)}")
-                        else:
-                            # 策略2: 模糊搜索 (应对 FFmpeg 未安装导致无法合并，文件名带有格式后缀的情况)
-                            # 例如: "Title.f10086.mp4" 而不是 "Title.mp4"
-                            dir_path = os.path.dirname(downloaded_path)
-                            base_name = os.path.basename(base_chk) # 去除后缀的文件名部分
-                            
-                            found_candidate = None
-                            if os.path.exists(dir_path):
-                                for f in os.listdir(dir_path):
-                                    # 检查文件名是否包含预期的标题，且是视频/音频格式
-                                    if base_name in f and f.lower().endswith(('.mp4', '.m4a', '.webm', '.mkv')):
-                                        found_candidate = os.path.join(dir_path, f)
-                                        # 如果找到视频文件，优先使用；如果是音频，继续找看看有没有视频
-                                        if f.lower().endswith('.mp4'):
-                                            break
-                            
-                            if found_candidate:
-                                downloaded_path = found_candidate
-                                # 尝试手动合并分轨文件
-                                try:
-                                    video_part = None
-                                    audio_part = None
-                                    # 简单判断：found_candidate 是视频，那还得找音频
-                                    # 假设命名规则: Title.fxxx.mp4 (video) 和 Title.fxxx.m4a (audio)
-                                    # 或者 yt-dlp 风格: Title.mp4, Title.m4a
-                                    
-                                    # 扫描目录下所有同名不同后缀文件
-                                    candidates = []
-                                    for f in os.listdir(dir_path):
-                                        if base_name in f:
-                                            candidates.append(os.path.join(dir_path, f))
-                                    
-                                    for c in candidates:
-                                        if c.lower().endswith(('.mp4', '.webm', '.mkv')) and not c.lower().endswith('.temp.mp4'): # 排除正在生成的temp
-                                            video_part = c
-                                        elif c.lower().endswith(('.m4a', '.mp3', '.aac')):
-                                            audio_part = c
-                                    
-                                    if video_part and audio_part and shutil.which("ffmpeg"):
-                                        merged_output = os.path.join(dir_path, base_name + ".mp4")
-                                        self._log(f"状态: 检测到分轨资源，尝试手动合并...")
-                                        self._log(f"视频: {os.path.basename(video_part)}")
-                                        self._log(f"音频: {os.path.basename(audio_part)}")
-                                        
-                                        cmd = [
-                                            'ffmpeg', '-y',
-                                            '-i', video_part,
-                                            '-i', audio_part,
-                                            '-c:v', 'copy',
-                                            '-c:a', 'aac', # 音频转码 AAC 以保证兼容性
-                                            '-strict', 'experimental',
-                                            '-loglevel', 'error',
-                                            merged_output
-                                        ]
-                                        import subprocess
-                                        subprocess.run(cmd, check=True)
-                                        
-                                        self._log("状态: 手动合并成功")
-                                        downloaded_path = merged_output
-                                        output_path = merged_output
-                                        
-                                        # 清理分轨文件
-                                        try:
-                                            os.remove(video_part)
-                                            os.remove(audio_part)
-                                        except:
-                                            pass
-                                    else:
-                                        self.last_error = "下载成功但未合并 (缺少 FFmpeg 或 音频轨)"
-                                        self._log(f"警告: {self.last_error}")
-                                except Exception as e:
-                                    self._log(f"手动合并失败: {e}")
-                                    self.last_error = "下载成功但未合并"
-
-                            else:
-                                self.last_error = f"文件未找到: {os.path.basename(downloaded_path)}"
-                                self._log(f"错误: {self.last_error}")
-                                return False
-                    else:
-                        self.last_error = "无法确定文件下载路径"
-                        self._log(f"错误: {self.last_error}")
-                        return False
-                
-                # 默认最终路径就是下载路径
-                output_path = downloaded_path
-
-                if convert_to_mp4 and downloaded_path and os.path.exists(downloaded_path):
-                    base, ext = os.path.splitext(downloaded_path)
-                    if ext.lower() == '.mp4':
-                        self._log("状态: 校验完成 (已是 MP4)")
-                        return True
-                        
-                    target_mp4 = base + ".mp4"
-                    self._log(f"状态: 正在转码为 MP4...")
-                    try:
-                        self.convert_to_mp4_ffmpeg(downloaded_path, target_mp4)
-                        self._log(f"状态: 转码成功")
-                        output_path = target_mp4 # 更新最终路径
-                        os.remove(downloaded_path)
-                        # self._log("已清理源文件")
-                    except Exception as e:
-                        self.last_error = f"转码异常: {str(e)}"
-                        self._log(f"警告: {self.last_error}")
-                        # 转码失败不应导致任务失败，只要源文件还在
-                        output_path = downloaded_path
+                downloaded_path = staging.final_path(info)
                 
-                # 最终校验：只要有一个文件存在，就返回成功
-                if output_path and os.path.exists(output_path):
-                    self._log("状态: 任务全部完成")
-                    return True
-                elif downloaded_path and os.path.exists(downloaded_path):
-                    self._log("状态: 任务完成 (未转码)")
-                    return True
+            self._report_throttle(url)
+            if not downloaded_path:
+                # 分轨未合并 (例如缺少 FFmpeg): 按回调记录的格式信息找到视频与音频分轨
+                video_part, audio_part = staging.split_parts()
+                if video_part and audio_part and self.toolchain.available:
+                    # 合并放到后处理阶段执行
+                    merge_parts = (video_part, audio_part)
+                    fallback_path = video_part
+                    downloaded_path = staging.merged_path(video_part)
+                elif video_part or audio_part:
+                    downloaded_path = video_part or audio_part
+                    self.last_error = "下载成功但未合并 (缺少 FFmpeg 或 音频轨)"
+                    self._log(f"警告: {self.last_error}")
                 else:
-                    self.last_error = "最终文件校验失败"
+                    staging.release()
+                    self.last_error = "文件未找到: 下载未产生输出文件"
+                    self._log(f"错误: {self.last_error}")
                     return False
+            
+            task = PostProcessTask(downloaded_path, convert_to_mp4, merge_parts=merge_parts, fallback_path=fallback_path,
+                                   source_url=source_url, archive_key=archive_key, staging=staging)
+            return self._finish_download(task, defer_postprocess)
                 
+        except DownloadCancelled:
+            return self._cancelled(staging)
         except Exception as e:
+            staging.release()
+            self._report_throttle(url, str(e))
             self.last_error = f"运行异常: {str(e)}"
             self._log(f"错误: {self.last_error}")
             
@@ -532,14 +1150,133 @@ class VideoExtractor:
             
             return False
 
+def read_batch_urls(source):
+    """
+    读取批量链接: source 为文件路径, '-' 表示从标准输入读取
+    忽略空行和以 # 开头的注释行
+    """
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            urls.append(line)
+    return urls
+
+def run_batch(urls, convert_to_mp4=True, resolution='1080', cookies_file=None, workers=4, per_host=2, cpu_budget=None,
+              stream_transcode=False, playlist=False, max_bitrate=None, max_filesize=None, concurrent_fragments=None,
+              resume=False):
+    """
+    批量模式: 所有链接共用一个进程和一个调度器
+    下载与转码分为两个阶段, 转码在按 CPU 预算分配的转码池中执行
+    playlist: 将链接作为播放列表/频道展开, 条目边解析边提交到调度器
+    resume: 同时恢复任务日志中上次未完成的任务 (从已完成的阶段继续)
+    """
+    from scheduler import DownloadScheduler
+    from playlist import PlaylistFeeder
+    from journal import get_journal
+
+    # 任务状态写入日志; 解析结果同样保存到磁盘, 中断后恢复的任务无需重新解析
+    journal = get_journal()
+    configure_resolve_cache(db_path=cache_path("resolve_cache.sqlite3"))
+    resumed = journal.compact() if resume else []
+    if resume and not resumed and not urls:
+        print("状态: 没有未完成的任务")
+        return None
+
+    # 后处理阶段与流式转码共用同一个转码池 (同一份 CPU 预算)
+    pool = configure_transcode_pool(cpu_budget=cpu_budget)
+    scheduler = DownloadScheduler(
+        workers=workers,
+        per_host=per_host,
+        extractor_factory=lambda: VideoExtractor(stream_transcode=stream_transcode, max_bitrate=max_bitrate,
+                                                 max_filesize=max_filesize,
+                                                 concurrent_fragments=concurrent_fragments),
+        transcode_pool=pool,
+        journal=journal,
+    )
+    if resumed:
+        print(f"状态: 恢复上次未完成的任务 {len(resumed)} 个")
+        for entry in resumed:
+            scheduler.restore(entry)
+    kind = "播放列表" if playlist else "批量任务"
+    print(f"状态: {kind} {len(urls)} 个 (并发 {scheduler.workers}, 单站点上限 {scheduler.per_host}, "
+          f"转码进程 {pool.workers} x {pool.threads_per_job} 线程)")
+    try:
+        if playlist:
+            # 边展开边下载: 调度器先启动, 全部播放列表展开完毕后再关闭
+            scheduler.start()
+            archive = get_archive(default_download_dir())
+            feeders = [
+                PlaylistFeeder(scheduler, u, archive=archive, convert_to_mp4=convert_to_mp4,
+                               resolution=resolution, cookies_file=cookies_file).start()
+                for u in urls
+            ]
+            for feeder in feeders:
+                feeder.join()
+        else:
+            for u in urls:
+                scheduler.submit(u, convert_to_mp4=convert_to_mp4, resolution=resolution, cookies_file=cookies_file)
+        stats = scheduler.run()
+    finally:
+        pool.shutdown()
+    print(scheduler.format_summary(stats))
+    if savings.saved_bytes:
+        from direct_download import format_bytes
+        print(f"格式限制: {savings.jobs} 个任务共节省约 {format_bytes(savings.saved_bytes)} "
+              f"(最佳画质合计约 {format_bytes(savings.best_bytes)})")
+    cookie_cache = get_cookie_cache()
+    if cookie_cache.loads:
+        print(cookie_cache.format_stats())
+    metrics = get_metrics()
+    if metrics.profile:
+        print(metrics.format_profile())
+    return stats
+
 def main():
     if len(sys.argv) > 1:
         # 命令行模式
-        # Usage: ./video-extractor URL [--no-mp4] [--res 720] [--cookies cookies.txt]
+        # Usage: ./video-extractor URL [--no-mp4] [--stream] [--res 720] [--cookies cookies.txt] [--persist-cache]
+        #                          [--max-bitrate 3000] [--max-filesize 500M] [--limit-rate 5M] [--fragments 8]
+        #                          [--profile] [--trace trace.jsonl] [--metrics metrics.prom]
+        #        ./video-extractor --batch urls.txt [--workers 4] [--per-host 2] [--cpu-budget 4]
+        #        ./video-extractor --rebuild-archive
+        #        ./video-extractor --resume [--batch urls.txt]
+        #        ./video-extractor PLAYLIST_URL --playlist [--workers 4] [--per-host 4]
+        #        ./video-extractor --daemon [--port 17865] [--workers 4] [--per-host 2] [--cpu-budget 4] [--resume]
+        #        ./video-extractor --jobs | --cancel JOB_ID
+        #        (后台服务运行时 URL/--batch 提交给服务执行, --no-daemon 在当前进程执行)
         url = None
         convert_to_mp4 = True
         resolution = '1080'
         cookies_file = None
+        batch_source = None
+        workers = 4
+        per_host = 2
+        cpu_budget = None
+        stream_transcode = False
+        pool_size = None
+        persist_cache = False
+        rebuild_archive = False
+        playlist = False
+        max_bitrate = None
+        max_filesize = None
+        limit_rate = None
+        concurrent_fragments = None
+        resume = False
+        profile = False
+        trace_path = None
+        metrics_path = None
+        daemon_mode = False
+        daemon_port = None
+        use_daemon = True
+        list_jobs = False
+        cancel_id = None
+        daemon_ignored = []   # 显式指定、但由后台服务的启动参数决定的选项
         
         args = sys.argv[1:]
         skip_next = False
@@ -551,6 +1288,40 @@ def main():
                 
             if arg == "--no-mp4":
                 convert_to_mp4 = False
+            elif arg == "--stream":
+                stream_transcode = True
+            elif arg == "--persist-cache":
+                persist_cache = True
+            elif arg == "--rebuild-archive":
+                rebuild_archive = True
+            elif arg == "--playlist":
+                playlist = True
+            elif arg == "--resume":
+                resume = True
+            elif arg == "--profile":
+                profile = True
+            elif arg == "--daemon":
+                daemon_mode = True
+            elif arg == "--no-daemon":
+                use_daemon = False
+            elif arg == "--jobs":
+                list_jobs = True
+            elif arg == "--port":
+                if i + 1 < len(args):
+                    daemon_port = int(args[i+1])
+                    skip_next = True
+            elif arg == "--cancel":
+                if i + 1 < len(args):
+                    cancel_id = args[i+1]
+                    skip_next = True
+            elif arg == "--trace":
+                if i + 1 < len(args):
+                    trace_path = args[i+1]
+                    skip_next = True
+            elif arg == "--metrics":
+                if i + 1 < len(args):
+                    metrics_path = args[i+1]
+                    skip_next = True
             elif arg == "--res" or arg == "--resolution":
                 if i + 1 < len(args):
                     resolution = args[i+1]
@@ -559,13 +1330,156 @@ def main():
                 if i + 1 < len(args):
                     cookies_file = args[i+1]
                     skip_next = True
+            elif arg == "--batch":
+                if i + 1 < len(args):
+                    batch_source = args[i+1]
+                    skip_next = True
+            elif arg == "--workers":
+                if i + 1 < len(args):
+                    workers = int(args[i+1])
+                    daemon_ignored.append(arg)
+                    skip_next = True
+            elif arg == "--per-host":
+                if i + 1 < len(args):
+                    per_host = int(args[i+1])
+                    daemon_ignored.append(arg)
+                    skip_next = True
+            elif arg == "--pool-size":
+                if i + 1 < len(args):
+                    pool_size = int(args[i+1])
+                    skip_next = True
+            elif arg == "--max-bitrate":
+                if i + 1 < len(args):
+                    max_bitrate = int(args[i+1])
+                    skip_next = True
+            elif arg == "--max-filesize":
+                if i + 1 < len(args):
+                    max_filesize = parse_size(args[i+1])
+                    skip_next = True
+            elif arg == "--limit-rate":
+                if i + 1 < len(args):
+                    limit_rate = parse_size(args[i+1])
+                    skip_next = True
+            elif arg == "--fragments":
+                if i + 1 < len(args):
+                    concurrent_fragments = int(args[i+1])
+                    skip_next = True
+            elif arg == "--cpu-budget":
+                if i + 1 < len(args):
+                    cpu_budget = int(args[i+1])
+                    daemon_ignored.append(arg)
+                    skip_next = True
             elif not arg.startswith("--") and url is None:
                 # 只在还没有 URL 时才设置,避免参数值被误认为 URL
                 url = arg
         
-        if url:
+        # 进程级选项 (作用于执行下载的进程): 指定时不交给后台服务, 在当前进程执行
+        process_options = [name for name, value in (
+            ("--stream", stream_transcode), ("--max-bitrate", max_bitrate), ("--max-filesize", max_filesize),
+            ("--limit-rate", limit_rate), ("--fragments", concurrent_fragments), ("--pool-size", pool_size),
+            ("--persist-cache", persist_cache), ("--profile", profile), ("--trace", trace_path),
+            ("--metrics", metrics_path),
+        ) if value]
+        client = None
+        if list_jobs or cancel_id or (use_daemon and not daemon_mode and not process_options and not playlist
+                                      and not resume and not rebuild_archive and (url or batch_source)):
+            from daemon_client import DaemonClient
+            client = DaemonClient.discover()
+            if client is None and (list_jobs or cancel_id):
+                print("错误: 后台服务未运行 (使用 --daemon 启动)")
+                return
+
+        if pool_size:
+            from http_pool import configure_pool_size
+            configure_pool_size(pool_size)
+        if limit_rate:
+            # 所有并发任务共享的总带宽上限 (字节/秒)
+            configure_bandwidth(limit_rate)
+        if profile or trace_path or metrics_path:
+            # 每个任务的阶段耗时: 输出耗时分析 / 追加 JSON Lines 记录 / 更新 Prometheus 文本文件
+            configure_metrics(trace_path=trace_path, prometheus_path=metrics_path, profile=profile)
+        if persist_cache:
+            # 解析结果保存到 SQLite, 重新运行命令时仍可跳过解析
+            configure_resolve_cache(db_path=cache_path("resolve_cache.sqlite3"))
+
+        if list_jobs:
+            from daemon_client import print_jobs
+            print_jobs(client)
+        elif cancel_id:
+            from daemon_client import DaemonError
+            try:
+                result = client.cancel(cancel_id)
+            except DaemonError as e:
+                print(f"错误: {e}")
+                return
+            job = result["job"]
+            print(f"状态: {'已请求取消' if result['cancelled'] else '任务已结束, 无需取消'} "
+                  f"[{job['label']}] {job['url']}")
+        elif daemon_mode:
+            # 常驻后台服务: 之后的命令行调用提交到此进程, 无需重复启动与预热
+            from daemon import run_daemon, DEFAULT_PORT
+            run_daemon(port=daemon_port or DEFAULT_PORT, workers=workers, per_host=per_host, cpu_budget=cpu_budget,
+                       extractor_options={"stream_transcode": stream_transcode, "max_bitrate": max_bitrate,
+                                          "max_filesize": max_filesize,
+                                          "concurrent_fragments": concurrent_fragments},
+                       resume=resume)
+        elif client is not None:
+            from daemon_client import submit_and_follow
+            if daemon_ignored:
+                print(f"提示: {', '.join(daemon_ignored)} 由后台服务的启动参数决定, 本次忽略 "
+                      f"(使用 --no-daemon 在当前进程执行)")
+            if batch_source:
+                try:
+                    urls = read_batch_urls(batch_source)
+                except OSError as e:
+                    print(f"错误: 无法读取链接列表: {e}")
+                    return
+                if url:
+                    urls.insert(0, url)
+            else:
+                urls = [url]
+            if not urls:
+                print("错误: 链接列表为空")
+                return
+            submit_and_follow(client, urls, convert_to_mp4=convert_to_mp4, resolution=resolution,
+                              cookies_file=cookies_file)
+        elif rebuild_archive:
+            # 将下载索引与下载目录重新对齐 (文件被删除/移动/手动放入后使用)
             extractor = VideoExtractor()
-            extractor.extract(url, convert_to_mp4=convert_to_mp4, resolution=resolution, cookies_file=cookies_file)
+            stats = extractor.archive.rebuild(extractor.download_dir, extractor.toolchain, log=print)
+            print(f"下载索引已重建: 保留 {stats['kept']}, 更新 {stats['updated']}, 重新关联 {stats['relinked']}, "
+                  f"移除 {stats['removed']}, 新增 {stats['added']}")
+        elif batch_source:
+            try:
+                urls = read_batch_urls(batch_source)
+            except OSError as e:
+                print(f"错误: 无法读取链接列表: {e}")
+                return
+            if url:
+                urls.insert(0, url)
+            if not urls and not resume:
+                print("错误: 链接列表为空")
+                return
+            run_batch(urls, convert_to_mp4=convert_to_mp4, resolution=resolution,
+                      cookies_file=cookies_file, workers=workers, per_host=per_host, cpu_budget=cpu_budget,
+                      stream_transcode=stream_transcode, playlist=playlist, max_bitrate=max_bitrate,
+                      max_filesize=max_filesize, concurrent_fragments=concurrent_fragments, resume=resume)
+        elif (url and playlist) or resume:
+            run_batch([url] if url else [], convert_to_mp4=convert_to_mp4, resolution=resolution,
+                      cookies_file=cookies_file, workers=workers, per_host=per_host, cpu_budget=cpu_budget,
+                      stream_transcode=stream_transcode, playlist=playlist, max_bitrate=max_bitrate,
+                      max_filesize=max_filesize, concurrent_fragments=concurrent_fragments, resume=resume)
+        elif url:
+            extractor = VideoExtractor(stream_transcode=stream_transcode, max_bitrate=max_bitrate,
+                                       max_filesize=max_filesize, concurrent_fragments=concurrent_fragments)
+            extractor.bandwidth = get_bandwidth_manager().register(url)
+            # 进度按固定频率在同一行刷新
+            get_progress_bus().subscribe_coalesced(ConsolePrinter())
+            try:
+                extractor.extract(url, convert_to_mp4=convert_to_mp4, resolution=resolution, cookies_file=cookies_file)
+            finally:
+                extractor.bandwidth.close()
+                get_progress_bus().flush()
         else:
             print("错误: 未提供视频链接")
     else:
@@ -574,6 +1488,7 @@ def main():
         print("输入 q 退出")
         
         extractor = VideoExtractor()
+        get_progress_bus().subscribe_coalesced(ConsolePrinter())
         
         while True:
             try: